@@ -0,0 +1,50 @@
+from collections import OrderedDict
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination over a creation timestamp
+
+    Pages are fetched with WHERE created < cursor ORDER BY created DESC, id DESC
+    LIMIT n, so there is no OFFSET scan and no COUNT(*) per request. Views set
+    cursor_ordering when their timestamp column is not named 'created'. An
+    exact total is only computed when the client asks for it with ?count=true.
+
+    GET /api/vehicles/?page_size=100&count=true
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created', '-id')
+    count_query_param = 'count'
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_data(self, data, results_key='results'):
+        """
+        Page envelope with the results stored under results_key
+        """
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            payload['count'] = self.count
+        payload[results_key] = data
+        return payload
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
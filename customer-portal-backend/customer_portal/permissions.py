@@ -0,0 +1,18 @@
+from rest_framework.permissions import BasePermission
+
+
+def is_employee(user):
+    """
+    Whether a user is portal staff rather than a customer
+    """
+    return bool(user and user.is_authenticated and (user.is_staff or getattr(user, 'userType', None) == 'employee'))
+
+
+class IsEmployee(BasePermission):
+    """
+    Allow access to employees and staff only
+    """
+    message = "Only employees can perform this action"
+
+    def has_permission(self, request, view):
+        return is_employee(request.user)
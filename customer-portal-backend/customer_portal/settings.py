@@ -80,7 +80,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'customer_portal.pagination.KeysetPagination',
     'PAGE_SIZE': 50,
 }
 
@@ -103,6 +103,27 @@ CORS_ALLOW_CREDENTIALS = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# QR images are rendered on first request and cached by payload hash
+QR_CACHE_DIR = config('QR_CACHE_DIR', default=str(MEDIA_ROOT / 'qr_cache'))
+QR_CACHE_MAX_ITEMS = config('QR_CACHE_MAX_ITEMS', default=1024, cast=int)
+QR_PRERENDER_WORKERS = config('QR_PRERENDER_WORKERS', default=4, cast=int)  # 0 disables bulk pre-rendering
+
+# Gate scanner: in-process cache of issued/consumed QR codes
+QR_SCAN_WINDOW_HOURS = config('QR_SCAN_WINDOW_HOURS', default=72, cast=int)
+QR_SCAN_REFRESH_SECONDS = config('QR_SCAN_REFRESH_SECONDS', default=30, cast=int)
+QR_SCAN_SETTLE_SECONDS = config('QR_SCAN_SETTLE_SECONDS', default=5, cast=int)
+QR_SCAN_CONSUMED_CACHE_SIZE = config('QR_SCAN_CONSUMED_CACHE_SIZE', default=100000, cast=int)
+
+# Vehicle profile cache (POST /api/vehicles/create/), invalidated when taggings, documents or drivers change.
+# LocalMemoryProfileCache is per worker process (other workers' writes show after the TTL);
+# RedisProfileCache is shared by all workers.
+VEHICLE_PROFILE_CACHE_BACKEND = config('VEHICLE_PROFILE_CACHE_BACKEND', default='vehicles.profile_cache.LocalMemoryProfileCache')
+VEHICLE_PROFILE_CACHE_TTL = config('VEHICLE_PROFILE_CACHE_TTL', default=60, cast=int)  # seconds; 0 disables
+VEHICLE_PROFILE_CACHE_MAX_ITEMS = config('VEHICLE_PROFILE_CACHE_MAX_ITEMS', default=10000, cast=int)  # local memory only
+VEHICLE_PROFILE_CACHE_REDIS_URL = config('VEHICLE_PROFILE_CACHE_REDIS_URL', default='redis://127.0.0.1:6379/0')
+VEHICLE_PROFILE_CACHE_REDIS_TIMEOUT = config('VEHICLE_PROFILE_CACHE_REDIS_TIMEOUT', default=0.5, cast=float)  # seconds, then treated as a miss
+VEHICLE_PROFILE_CACHE_REDIS_MAX_CONNECTIONS = config('VEHICLE_PROFILE_CACHE_REDIS_MAX_CONNECTIONS', default=16, cast=int)
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND')
 EMAIL_HOST = config('EMAIL_HOST')
@@ -111,6 +132,39 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 
+# QR email outbox dispatcher (python manage.py dispatch_qr_emails)
+QR_EMAIL_BATCH_SIZE = config('QR_EMAIL_BATCH_SIZE', default=50, cast=int)
+QR_EMAIL_WORKERS = config('QR_EMAIL_WORKERS', default=4, cast=int)
+QR_EMAIL_MAX_ATTEMPTS = config('QR_EMAIL_MAX_ATTEMPTS', default=8, cast=int)
+QR_EMAIL_RETRY_BASE_SECONDS = config('QR_EMAIL_RETRY_BASE_SECONDS', default=30, cast=int)
+QR_EMAIL_RETRY_MAX_SECONDS = config('QR_EMAIL_RETRY_MAX_SECONDS', default=3600, cast=int)
+QR_EMAIL_LEASE_SECONDS = config('QR_EMAIL_LEASE_SECONDS', default=300, cast=int)
+
+# Public address of this API, used for links sent outside a request (e.g. SMS)
+PUBLIC_BASE_URL = config('PUBLIC_BASE_URL', default='http://localhost:8000')
+
+# Gate pass SMS (python manage.py dispatch_qr_sms)
+SMS_GATEWAY = config('SMS_GATEWAY', default='submissions.sms.ConsoleSMSGateway')
+SMS_GATEWAY_URL = config('SMS_GATEWAY_URL', default='')
+SMS_GATEWAY_API_KEY = config('SMS_GATEWAY_API_KEY', default='')
+SMS_GATEWAY_TIMEOUT = config('SMS_GATEWAY_TIMEOUT', default=10, cast=float)
+SMS_GATEWAY_MAX_RECIPIENTS = config('SMS_GATEWAY_MAX_RECIPIENTS', default=100, cast=int)  # Messages per gateway request
+SMS_SENDER_ID = config('SMS_SENDER_ID', default='GATEPS')
+SMS_RATE_PER_SECOND = config('SMS_RATE_PER_SECOND', default=10, cast=float)  # Per dispatcher, a little under the provider quota
+SMS_RATE_BURST = config('SMS_RATE_BURST', default=100, cast=int)
+SMS_BATCH_SIZE = config('SMS_BATCH_SIZE', default=200, cast=int)
+SMS_WORKERS = config('SMS_WORKERS', default=2, cast=int)
+SMS_MAX_ATTEMPTS = config('SMS_MAX_ATTEMPTS', default=6, cast=int)
+SMS_RETRY_BASE_SECONDS = config('SMS_RETRY_BASE_SECONDS', default=30, cast=int)
+SMS_RETRY_MAX_SECONDS = config('SMS_RETRY_MAX_SECONDS', default=3600, cast=int)
+SMS_LEASE_SECONDS = config('SMS_LEASE_SECONDS', default=300, cast=int)
+
+# Audit trail: events are buffered per process and written in batches
+AUDIT_LOG_BATCH_SIZE = config('AUDIT_LOG_BATCH_SIZE', default=200, cast=int)
+AUDIT_LOG_FLUSH_SECONDS = config('AUDIT_LOG_FLUSH_SECONDS', default=2, cast=float)
+AUDIT_LOG_MAX_BUFFER = config('AUDIT_LOG_MAX_BUFFER', default=10000, cast=int)
+AUDIT_LOG_SPOOL_DIR = config('AUDIT_LOG_SPOOL_DIR', default=str(BASE_DIR / 'audit_spool'))
+
 # Static files
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -124,5 +178,68 @@ AUTH_USER_MODEL = 'authentication.CustomerUser'
 # Document storage configuration
 DOCUMENT_STORAGE_PATH = os.path.join(BASE_DIR, 'documents')
 
+# Content-addressed store for DocumentControl uploads (one file per unique content)
+DOCUMENT_BLOB_PATH = config('DOCUMENT_BLOB_PATH', default=os.path.join(DOCUMENT_STORAGE_PATH, 'blobs'))
+
+# Other document files (CustomerDocument uploads), fanned out two hashed directory levels deep
+DOCUMENT_FILE_PATH = config('DOCUMENT_FILE_PATH', default=os.path.join(DOCUMENT_STORAGE_PATH, 'files'))
+
+# Cold tier: manage.py pack_cold_documents appends DocumentControl files no row created in the last
+# DOCUMENT_COLD_AFTER_DAYS points at to packfiles of about DOCUMENT_PACK_SIZE bytes, and removes the loose files
+DOCUMENT_PACK_PATH = config('DOCUMENT_PACK_PATH', default=os.path.join(DOCUMENT_STORAGE_PATH, 'packs'))
+DOCUMENT_COLD_AFTER_DAYS = config('DOCUMENT_COLD_AFTER_DAYS', default=90, cast=int)
+DOCUMENT_PACK_SIZE = config('DOCUMENT_PACK_SIZE', default=1024 * 1024 * 1024, cast=int)
+
+# manage.py collect_document_garbage leaves unreferenced files younger than this alone (uploads in flight)
+DOCUMENT_GC_GRACE_HOURS = config('DOCUMENT_GC_GRACE_HOURS', default=24, cast=float)
+
+# Uploads are validated and spooled while streaming; keep the spool on the blob filesystem so storing is a rename
+DOCUMENT_MAX_UPLOAD_SIZE = config('DOCUMENT_MAX_UPLOAD_SIZE', default=5 * 1024 * 1024, cast=int)
+DOCUMENT_UPLOAD_TEMP_PATH = config('DOCUMENT_UPLOAD_TEMP_PATH', default=os.path.join(DOCUMENT_BLOB_PATH, 'incoming'))
+
+# POST /api/documents/upload-batch/
+DOCUMENT_BATCH_MAX_FILES = config('DOCUMENT_BATCH_MAX_FILES', default=20, cast=int)
+DOCUMENT_BATCH_WORKERS = config('DOCUMENT_BATCH_WORKERS', default=4, cast=int)
+
+# Document downloads: '' streams from Python; 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+# hand the file to the web server after authorization. For nginx, DOCUMENT_ACCEL_REDIRECT_LOCATION must be an
+# `internal` location aliasing DOCUMENT_STORAGE_PATH. 'redirect' sends clients to a presigned object store URL.
+DOCUMENT_DOWNLOAD_OFFLOAD = config('DOCUMENT_DOWNLOAD_OFFLOAD', default='')
+DOCUMENT_ACCEL_REDIRECT_LOCATION = config('DOCUMENT_ACCEL_REDIRECT_LOCATION', default='/protected-documents/')
+
+# Where document files, blobs and QR images are kept: documents.storage.LocalDocumentStorage (the paths above)
+# or documents.storage.S3DocumentStorage (any S3-compatible bucket, keyed by path relative to those roots)
+DOCUMENT_STORAGE_BACKEND = config('DOCUMENT_STORAGE_BACKEND', default='documents.storage.LocalDocumentStorage')
+DOCUMENT_S3_ENDPOINT_URL = config('DOCUMENT_S3_ENDPOINT_URL', default='')  # e.g. https://s3.ap-south-1.amazonaws.com
+DOCUMENT_S3_BUCKET = config('DOCUMENT_S3_BUCKET', default='')
+DOCUMENT_S3_REGION = config('DOCUMENT_S3_REGION', default='us-east-1')
+DOCUMENT_S3_ACCESS_KEY_ID = config('DOCUMENT_S3_ACCESS_KEY_ID', default='')
+DOCUMENT_S3_SECRET_ACCESS_KEY = config('DOCUMENT_S3_SECRET_ACCESS_KEY', default='')
+DOCUMENT_S3_MAX_CONNECTIONS = config('DOCUMENT_S3_MAX_CONNECTIONS', default=10, cast=int)  # Per process
+DOCUMENT_S3_MULTIPART_THRESHOLD = config('DOCUMENT_S3_MULTIPART_THRESHOLD', default=8 * 1024 * 1024, cast=int)
+DOCUMENT_S3_PART_SIZE = config('DOCUMENT_S3_PART_SIZE', default=8 * 1024 * 1024, cast=int)  # S3 needs at least 5 MB
+DOCUMENT_S3_PRESIGN_EXPIRES = config('DOCUMENT_S3_PRESIGN_EXPIRES', default=300, cast=int)  # Seconds
+DOCUMENT_S3_TIMEOUT = config('DOCUMENT_S3_TIMEOUT', default=30, cast=float)
+
+# GET /api/documents/control/export/<kind>/<key>/: files read ahead in parallel while the ZIP streams
+DOCUMENT_EXPORT_READAHEAD = config('DOCUMENT_EXPORT_READAHEAD', default=4, cast=int)
+
+# Document previews (WebP thumbnails / PDF first pages), cached by content hash
+DOCUMENT_PREVIEW_PATH = config('DOCUMENT_PREVIEW_PATH', default=os.path.join(DOCUMENT_STORAGE_PATH, 'previews'))
+DOCUMENT_PREVIEW_SIZE = config('DOCUMENT_PREVIEW_SIZE', default=320, cast=int)  # Longest edge in pixels
+DOCUMENT_PREVIEW_QUALITY = config('DOCUMENT_PREVIEW_QUALITY', default=70, cast=int)
+DOCUMENT_PREVIEW_WORKERS = config('DOCUMENT_PREVIEW_WORKERS', default=2, cast=int)  # 0 renders in the request thread
+DOCUMENT_PREVIEW_TIMEOUT = config('DOCUMENT_PREVIEW_TIMEOUT', default=30, cast=float)
+
+# Upload-time image normalization: strip EXIF, downscale and re-encode JPEG/PNG uploads
+DOCUMENT_IMAGE_NORMALIZE = config('DOCUMENT_IMAGE_NORMALIZE', default=False, cast=bool)
+DOCUMENT_IMAGE_MAX_DIMENSION = config('DOCUMENT_IMAGE_MAX_DIMENSION', default=2000, cast=int)  # Longest edge in pixels
+DOCUMENT_IMAGE_FORMAT = config('DOCUMENT_IMAGE_FORMAT', default='jpeg')  # 'jpeg' or 'webp'
+DOCUMENT_IMAGE_QUALITY = config('DOCUMENT_IMAGE_QUALITY', default=82, cast=int)
+DOCUMENT_IMAGE_KEEP_ORIGINAL = config('DOCUMENT_IMAGE_KEEP_ORIGINAL', default=False, cast=bool)
+DOCUMENT_IMAGE_NORMALIZE_WORKERS = config('DOCUMENT_IMAGE_NORMALIZE_WORKERS', default=2, cast=int)
+DOCUMENT_IMAGE_NORMALIZE_QUEUE = config('DOCUMENT_IMAGE_NORMALIZE_QUEUE', default=8, cast=int)  # Waiting uploads before storing as-is
+DOCUMENT_IMAGE_NORMALIZE_TIMEOUT = config('DOCUMENT_IMAGE_NORMALIZE_TIMEOUT', default=20, cast=float)
+
 # Ensure directory exists
 os.makedirs(DOCUMENT_STORAGE_PATH, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,37 @@
+from django.db import connection
+
+
+def column_list(model, table_alias=None):
+    """
+    Quoted, comma separated column names of a model's concrete fields
+    """
+    prefix = f'"{table_alias}".' if table_alias else ''
+    return ', '.join(f'{prefix}"{field.column}"' for field in model._meta.concrete_fields)
+
+
+def upsert_returning(model, sql, params):
+    """
+    Run a single INSERT ... ON CONFLICT ... RETURNING statement and build
+    model instances from its rows
+
+    The statement must select every concrete column of the model (see
+    column_list) followed by any number of extra verdict columns, e.g.
+    "created" or "name_matches".
+
+    Returns:
+        tuple: (instance, extra column values...) for the first row, or None
+    """
+    fields = model._meta.concrete_fields
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    instance = model.from_db(
+        connection.alias,
+        [field.attname for field in fields],
+        row[:len(fields)]
+    )
+    return (instance, *row[len(fields):])
@@ -0,0 +1,180 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from .storage import get_document_storage
+import io
+import os
+import zipfile
+
+# Already-compressed formats are stored as-is; deflating them costs CPU and saves nothing
+STORED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.webp')
+
+# Size of the writes fed to the archive, and so of the chunks sent to the client
+ARCHIVE_CHUNK_SIZE = 256 * 1024
+
+# Files up to this size are read ahead whole; larger ones are streamed when their turn comes
+READAHEAD_MAX_BYTES = 8 * 1024 * 1024
+
+
+class ZipSink(io.RawIOBase):
+    """
+    Write-only, unseekable target for ZipFile that hands back what was written
+
+    ZipFile falls back to data descriptors when it cannot seek, so no
+    entry needs to be rewritten once its bytes have been sent.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ArchiveEntry:
+    """
+    One stored file to put in an archive under name
+    """
+
+    def __init__(self, name, path, modified=None):
+        self.name = name
+        self.path = path
+        self.modified = modified
+
+
+def unique_names(names):
+    """
+    Names with ' (2)', ' (3)', ... added before the extension where they repeat
+    """
+    seen = set()
+    for name in names:
+        candidate = name
+        stem, extension = os.path.splitext(name)
+        number = 2
+        while candidate.lower() in seen:
+            candidate = f"{stem} ({number}){extension}"
+            number += 1
+        seen.add(candidate.lower())
+        yield candidate
+
+
+def read_ahead(storage, path):
+    """
+    Open a stored file, reading it whole when it is small enough
+
+    Returns:
+        tuple: (data, None) or (None, open file), or (None, None) if missing
+    """
+    try:
+        handle = storage.open(path)
+    except FileNotFoundError:
+        return None, None
+    if handle.size > READAHEAD_MAX_BYTES:
+        return None, handle
+    with handle:
+        return handle.read(), None
+
+
+def iter_zip(entries, storage=None, readahead=None):
+    """
+    Stream a ZIP archive of stored files, chunk by chunk
+
+    The archive is produced as it is sent: nothing is spooled to a temp
+    file and only the entries being read ahead are held in memory. Up to
+    `readahead` upcoming files are fetched in parallel while the current
+    one is written, which hides storage latency (object stores especially).
+    Files missing from storage are skipped and listed in MISSING.txt.
+
+    Args:
+        entries: Iterable of ArchiveEntry
+        storage: Backend holding the files (default get_document_storage())
+        readahead: Files fetched ahead (default DOCUMENT_EXPORT_READAHEAD)
+
+    Yields:
+        bytes: Consecutive pieces of the archive
+    """
+    storage = storage or get_document_storage()
+    readahead = max(readahead or settings.DOCUMENT_EXPORT_READAHEAD, 1)
+    sink = ZipSink()
+    missing = []
+    pending = deque()
+    entries = iter(entries)
+
+    def fill(pool):
+        while len(pending) < readahead:
+            entry = next(entries, None)
+            if entry is None:
+                return
+            pending.append((entry, pool.submit(read_ahead, storage, entry.path)))
+
+    pool = ThreadPoolExecutor(max_workers=readahead, thread_name_prefix='zip-readahead')
+    try:
+        with zipfile.ZipFile(sink, 'w') as archive:
+            fill(pool)
+            while pending:
+                entry, future = pending.popleft()
+                fill(pool)
+                data, handle = future.result()
+                if data is None and handle is None:
+                    missing.append(entry.name)
+                    continue
+
+                info = zipfile.ZipInfo(entry.name, date_time=zip_timestamp(entry.modified))
+                info.compress_type = (
+                    zipfile.ZIP_STORED if os.path.splitext(entry.name)[1].lower() in STORED_EXTENSIONS
+                    else zipfile.ZIP_DEFLATED
+                )
+                info.file_size = len(data) if data is not None else handle.size
+                with archive.open(info, 'w') as target:
+                    if data is not None:
+                        view = memoryview(data)
+                        for start in range(0, len(view), ARCHIVE_CHUNK_SIZE):
+                            target.write(view[start:start + ARCHIVE_CHUNK_SIZE])
+                            yield sink.drain()
+                    else:
+                        with handle:
+                            for chunk in iter(lambda: handle.read(ARCHIVE_CHUNK_SIZE), b''):
+                                target.write(chunk)
+                                yield sink.drain()
+                yield sink.drain()
+
+            if missing:
+                archive.writestr(
+                    zipfile.ZipInfo('MISSING.txt', date_time=zip_timestamp(None)),
+                    'Files not found in storage:\n' + ''.join(f"{name}\n" for name in missing)
+                )
+        yield sink.drain()
+    finally:
+        # Client gone mid-download: drop what was read ahead
+        pool.shutdown(wait=True, cancel_futures=True)
+        for _, future in pending:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                _, handle = future.result()
+                if handle is not None:
+                    handle.close()
+
+
+def zip_timestamp(moment):
+    """
+    ZIP date_time tuple in local time; ZIP cannot represent dates before 1980
+    """
+    moment = moment or timezone.now()
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return max(moment.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
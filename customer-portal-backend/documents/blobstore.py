@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+from .layout import get_storage_layout
+from .models import DocumentBlob, StoredFile
+from .storage import get_document_storage
+import hashlib
+
+# Advisory lock namespace for blob paths. Uploads hold a path shared from before
+# they decide whether its file is in place until they commit; the garbage
+# collector holds it exclusively while it rechecks and deletes.
+BLOB_PATH_LOCK_NAMESPACE = 0x626c6f62  # 'blob'
+
+# Locks are taken in hash order so concurrent lockers never deadlock
+LOCK_BLOB_PATHS_SQL = """
+    SELECT {function}(%s, hashtext("path")) FROM unnest(%s::text[]) AS "path"
+    ORDER BY hashtext("path")
+"""
+
+
+def lock_blob_paths(paths, exclusive=False):
+    """
+    Lock blob paths until the current transaction ends
+    """
+    function = 'pg_advisory_xact_lock' if exclusive else 'pg_advisory_xact_lock_shared'
+    with connection.cursor() as cursor:
+        cursor.execute(LOCK_BLOB_PATHS_SQL.format(function=function), [BLOB_PATH_LOCK_NAMESPACE, sorted(set(paths))])
+
+
+def blob_path(sha256):
+    """
+    Location of a blob: <DOCUMENT_BLOB_PATH>/<sha256[0:2]>/<sha256[2:4]>/<sha256>
+    """
+    return get_storage_layout().blob_path(sha256)
+
+
+def store_uploaded_file(uploaded_file):
+    """
+    Store an upload in the content-addressed blob store
+
+    Uploads spooled by DocumentUploadHandler arrive already hashed and are
+    renamed into place; any other upload is hashed in one pass first.
+    Content that is already stored only gains a reference and nothing is
+    written. The blob path is locked against the garbage collector until
+    the reference is committed.
+
+    Args:
+        uploaded_file: Django UploadedFile object
+
+    Returns:
+        tuple: (DocumentBlob holding a reference for the caller, created)
+    """
+    sha256 = getattr(uploaded_file, 'sha256', None) or hash_upload(uploaded_file)
+
+    with transaction.atomic():
+        blob = DocumentBlob.acquire(sha256)
+        if blob is not None:
+            lock_blob_paths([blob.path])
+            if not get_document_storage().exists(blob.path):
+                # Repair a blob whose file went missing outside the store
+                place_upload(uploaded_file, blob.path)
+            return blob, False
+
+        path = blob_path(sha256)
+        lock_blob_paths([path])
+        place_upload(uploaded_file, path)
+        blob = DocumentBlob.register(sha256, uploaded_file.size, path, content_type=uploaded_file.content_type or '')
+        return blob, blob.refcount == 1
+
+
+def store_uploaded_files(uploaded_files, workers=None):
+    """
+    Store several uploads with a single DocumentBlob upsert
+
+    Rows are upserted first, which locks them against a concurrent release,
+    then files for content not stored yet are put in place on a thread
+    pool. The pool only moves bytes; every database write happens in the
+    calling thread. Run it inside the transaction that records the
+    documents, so a failure gives every reference back.
+
+    Args:
+        uploaded_files: Django UploadedFile objects; repeats of the same
+            content each take a reference
+        workers: Threads moving files into place (DOCUMENT_BATCH_WORKERS)
+
+    Returns:
+        list: (DocumentBlob, created) per upload, in order
+    """
+    hashes = [getattr(uploaded_file, 'sha256', None) or hash_upload(uploaded_file) for uploaded_file in uploaded_files]
+
+    entries = {}
+    sources = {}
+    for uploaded_file, sha256 in zip(uploaded_files, hashes):
+        size, path, content_type, references = entries.get(
+            sha256, (uploaded_file.size, blob_path(sha256), uploaded_file.content_type or '', 0)
+        )
+        entries[sha256] = (size, path, content_type, references + 1)
+        sources.setdefault(sha256, uploaded_file)
+
+    with transaction.atomic():
+        blobs = DocumentBlob.register_many(entries)
+        lock_blob_paths([blob.path for blob, _ in blobs.values()])
+        storage = get_document_storage()
+
+        # Checked here rather than on the pool: the cold tier lookup queries the database
+        missing = [
+            (sources[sha256], blob.path) for sha256, (blob, _) in blobs.items()
+            if not storage.exists(blob.path)
+        ]
+        if missing:
+            with ThreadPoolExecutor(max_workers=workers or settings.DOCUMENT_BATCH_WORKERS) as pool:
+                sizes = list(pool.map(lambda item: put_upload(*item), missing))
+            StoredFile.record_many([(path, True, size) for (_, path), size in zip(missing, sizes)])
+
+    return [blobs[sha256] for sha256 in hashes]
+
+
+def hash_upload(uploaded_file):
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def put_upload(uploaded_file, path):
+    """
+    Put an upload's bytes at path in document storage (a rename when the
+    upload is spooled on the same local filesystem); no database access
+
+    Returns:
+        int: Size of the stored file
+    """
+    get_document_storage().save_upload(path, uploaded_file)
+    return uploaded_file.size
+
+
+def place_upload(uploaded_file, path):
+    """
+    Put an upload's bytes at path and record it in the storage index
+    """
+    StoredFile.record(path, put_upload(uploaded_file, path))
@@ -0,0 +1,182 @@
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from urllib.parse import quote
+from .storage import get_document_storage
+import os
+import re
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Read size when streaming a byte range through Python
+RANGE_CHUNK_SIZE = 64 * 1024
+
+OFFLOAD_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile',
+}
+
+
+def etag_matches(header, etag):
+    """
+    If-None-Match comparison (weak, as RFC 9110 requires for that header)
+    """
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+def parse_range(header, size):
+    """
+    Resolve a single-range Range header against a file size
+
+    Returns:
+        tuple | None | False: (start, end) inclusive, None to ignore the
+            header and send the whole file, False if unsatisfiable
+    """
+    match = RANGE_RE.match(header.strip().replace(' ', ''))
+    if not match:
+        # Malformed or multiple ranges: sending the full file is allowed
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return False
+    return start, end
+
+
+def iter_file_range(file_handle, start, length, chunk_size=RANGE_CHUNK_SIZE):
+    with file_handle as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload_path(path):
+    """
+    Header value handing path to the web server, or None to serve from Python
+
+    X-Accel-Redirect needs a URI under the internal nginx location that
+    aliases DOCUMENT_STORAGE_PATH; files outside it are served from Python.
+    """
+    mode = settings.DOCUMENT_DOWNLOAD_OFFLOAD
+    if mode == 'x-sendfile':
+        return os.path.abspath(path)
+    if mode == 'x-accel-redirect':
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.DOCUMENT_STORAGE_PATH))
+        if relative.startswith('..'):
+            return None
+        location = settings.DOCUMENT_ACCEL_REDIRECT_LOCATION.rstrip('/')
+        return f"{location}/{quote(relative.replace(os.sep, '/'))}"
+    return None
+
+
+def file_download_response(request, path, checksum, content_type, filename, last_modified=None, as_attachment=True,
+                           storage=None):
+    """
+    Conditional, range-aware download of a stored file
+
+    - ETag is the content checksum, so it is strong and stable across moves
+    - If-None-Match (or If-Modified-Since without it) answers 304
+    - A single Range answers 206, honouring If-Range; unsatisfiable ranges 416
+    - With DOCUMENT_DOWNLOAD_OFFLOAD set, the body is left to nginx
+      (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile), which also serve
+      ranges themselves; Python only authorizes and answers 304s
+    - With DOCUMENT_DOWNLOAD_OFFLOAD = 'redirect' and an object store
+      backend, the client is sent to a short-lived presigned URL instead
+    - Otherwise the file is streamed from the storage backend
+
+    Args:
+        request: Authorized request
+        path: Stored file path
+        checksum: Hex digest of the file content, used as the ETag
+        content_type: MIME type of the file
+        filename: Download name for Content-Disposition
+        last_modified: Optional datetime for Last-Modified
+        as_attachment: False to let the browser display the file inline
+        storage: Backend holding the file (default get_document_storage())
+    """
+    storage = storage or get_document_storage()
+    etag = f'"{checksum}"'
+    last_modified_header = http_date(last_modified.timestamp()) if last_modified else None
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['Accept-Ranges'] = 'bytes'
+        if last_modified_header:
+            response['Last-Modified'] = last_modified_header
+        return response
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, etag)
+    else:
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        not_modified = bool(since and last_modified and int(last_modified.timestamp()) <= since)
+    if not_modified:
+        return finish(HttpResponse(status=304))
+
+    disposition = f'{"attachment" if as_attachment else "inline"}; filename="{filename}"'
+
+    if settings.DOCUMENT_DOWNLOAD_OFFLOAD == 'redirect':
+        url = storage.url(path, filename, content_type, as_attachment)
+        if url:
+            response = HttpResponse(status=302)
+            response['Location'] = url
+            return finish(response)
+
+    local_path = storage.local_path(path)
+    offload = offload_path(local_path) if local_path else None
+    if offload is not None:
+        response = HttpResponse(content_type=content_type)
+        response[OFFLOAD_HEADERS[settings.DOCUMENT_DOWNLOAD_OFFLOAD]] = offload
+        response['Content-Disposition'] = disposition
+        return finish(response)
+
+    # One open() both checks existence and sizes the file
+    file_handle = storage.open(path)
+    size = file_handle.size
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header:
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range.strip() == etag:
+            byte_range = parse_range(range_header, size)
+
+    if byte_range is False:
+        file_handle.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    if byte_range is None:
+        response = FileResponse(file_handle, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(iter_file_range(file_handle, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Content-Disposition'] = disposition
+    return finish(response)
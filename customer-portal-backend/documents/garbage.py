@@ -0,0 +1,301 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+from .blobstore import lock_blob_paths
+from .models import DOCUMENT_TYPES, StoredFile, batched
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Any two GC runs against the same database exclude each other
+GC_LOCK_KEY = 0x646f6367  # 'docg'
+
+# Every path a live row points at, byte-ordered to merge with the sorted storage walk,
+# and whether the cold tier holds the file (so no loose file is expected)
+LIVE_PATHS_SQL = """
+    SELECT "path", "source", EXISTS (SELECT 1 FROM "PackedFile" WHERE "PackedFile"."path" = "live"."path") FROM (
+        SELECT "path", 'DocumentBlob' AS "source" FROM "DocumentBlob"
+        UNION ALL
+        SELECT "filePath", 'DocumentControl' FROM "DocumentControl"
+        UNION ALL
+        SELECT "file_path", 'CustomerDocument' FROM "CustomerDocument" WHERE "is_active"
+    ) AS "live"
+    ORDER BY "path" COLLATE "C"
+"""
+
+# Rows whose path is relative or not normalized ('.', '..', '//', trailing '/'),
+# so it does not sort where the storage walk finds its file
+IRREGULAR_PATHS_SQL = """
+    SELECT "path", "source", EXISTS (SELECT 1 FROM "PackedFile" WHERE "PackedFile"."path" = "live"."path") FROM (
+        SELECT "path", 'DocumentBlob' AS "source" FROM "DocumentBlob"
+        UNION ALL
+        SELECT "filePath", 'DocumentControl' FROM "DocumentControl"
+        UNION ALL
+        SELECT "file_path", 'CustomerDocument' FROM "CustomerDocument" WHERE "is_active"
+    ) AS "live"
+    WHERE "path" <> '' AND ("path" !~ '^/' OR "path" ~ '(^|/)\\.\\.?(/|$)|//|/$')
+"""
+
+LIVE_PATHS_IN_SQL = """
+    SELECT "path" FROM "DocumentBlob" WHERE "path" = ANY(%s)
+    UNION
+    SELECT "filePath" FROM "DocumentControl" WHERE "filePath" = ANY(%s)
+    UNION
+    SELECT "file_path" FROM "CustomerDocument" WHERE "is_active" AND "file_path" = ANY(%s)
+"""
+
+
+def default_roots():
+    """
+    Directories holding document files: the blob store, the fanned-out
+    file root and the flat directories of uploads made before them
+    """
+    legacy = [os.path.join(settings.DOCUMENT_STORAGE_PATH, 'documents')] + [
+        os.path.join(settings.DOCUMENT_STORAGE_PATH, document_type) for document_type, _ in DOCUMENT_TYPES
+    ]
+    return [settings.DOCUMENT_BLOB_PATH, settings.DOCUMENT_FILE_PATH] + legacy
+
+
+def normalize_path(path):
+    """
+    Absolute, normalized form of a stored path; relative paths are resolved
+    against the working directory, as the local storage backend does
+    """
+    return os.path.abspath(path)
+
+
+def walk_sorted(root, excluded):
+    """
+    Files under root as (path, size, mtime), in byte order of their paths
+
+    Children are visited sorted by name, directories as name + '/', so
+    the depth-first walk comes out in the same order as the database's
+    COLLATE "C" sort. Only one directory listing is held per level.
+    """
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return
+    children = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.path not in excluded:
+                    children.append((entry.name + '/', entry, True))
+            elif entry.is_file(follow_symlinks=False):
+                children.append((entry.name, entry, False))
+        except OSError:
+            continue
+    children.sort(key=lambda child: child[0])
+    del entries
+
+    for _, entry, is_dir in children:
+        if is_dir:
+            yield from walk_sorted(entry.path, excluded)
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        yield entry.path, stat.st_size, stat.st_mtime
+
+
+class DocumentGarbageCollector:
+    """
+    Finds document files no live row points at, and rows whose file is gone
+
+    Storage is walked in sorted order and merged against the sorted stream
+    of live paths from a server-side cursor, so memory stays bounded no
+    matter how many files there are. Files newer than the grace period are
+    left alone (an upload may not have committed its row yet), and each
+    batch of candidates is checked against the database again just before
+    deletion. Inactive (soft-deleted or superseded) CustomerDocument rows
+    do not keep their files alive.
+
+    Stored paths are compared in normalized absolute form. The few rows
+    with relative or non-normalized paths do not sort with the walk, so
+    they are loaded up front and matched by lookup instead.
+    """
+
+    def __init__(self, roots=None, grace_hours=None, workers=None, batch_size=500, dry_run=False, stdout=None):
+        roots = sorted({os.path.abspath(root) for root in roots or default_roots()})
+        # Skip roots nested in another root so nothing is walked twice
+        self.roots = [root for root in roots if not any(root.startswith(other + os.sep) for other in roots)]
+        self.excluded = {
+            os.path.abspath(settings.DOCUMENT_UPLOAD_TEMP_PATH),
+            os.path.abspath(settings.DOCUMENT_PREVIEW_PATH),
+            os.path.abspath(settings.DOCUMENT_PACK_PATH),
+        }
+        self.grace_hours = settings.DOCUMENT_GC_GRACE_HOURS if grace_hours is None else grace_hours
+        self.workers = workers or settings.DOCUMENT_BATCH_WORKERS
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stdout = stdout
+
+    def report(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def under_roots(self, path):
+        return any(path.startswith(root + os.sep) for root in self.roots) and not any(
+            path.startswith(excluded + os.sep) for excluded in self.excluded
+        )
+
+    def storage_files(self):
+        # Sorted with the same trailing separator as the walk so root order matches path order
+        for root in sorted(self.roots, key=lambda root: root + '/'):
+            yield from walk_sorted(root, self.excluded)
+
+    def irregular_paths(self):
+        """
+        normalized path -> (stored path, source table, packed) for rows whose
+        stored path is not already normalized
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(IRREGULAR_PATHS_SQL)
+            rows = cursor.fetchall()
+        return {normalize_path(path): (path, source, packed) for path, source, packed in rows}
+
+    def live_paths(self):
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(LIVE_PATHS_SQL)
+            while rows := cursor.fetchmany(self.batch_size):
+                # Irregular paths are handled from irregular_paths()
+                yield from (row for row in rows if row[0] and normalize_path(row[0]) == row[0])
+
+    def compare(self):
+        """
+        Merge the storage walk with the live paths
+
+        Yields:
+            tuple: ('live' | 'orphan', path, size, mtime) for every file
+            found, ('missing', path, source table, None) for rows without one
+        """
+        irregular = self.irregular_paths()
+        files = self.storage_files()
+        live = self.live_paths()
+        file_entry = next(files, None)
+        live_entry = next(live, None)
+        while file_entry is not None or live_entry is not None:
+            if live_entry is None or (file_entry is not None and file_entry[0] < live_entry[0]):
+                yield ('live' if irregular.pop(file_entry[0], None) else 'orphan',) + file_entry
+                file_entry = next(files, None)
+            elif file_entry is None or live_entry[0] < file_entry[0]:
+                path, source, packed = live_entry
+                if path and not packed and self.under_roots(path):
+                    yield 'missing', path, source, None
+                live_entry = next(live, None)
+            else:
+                # Several rows may share a path; consume them all
+                while live_entry is not None and live_entry[0] == file_entry[0]:
+                    live_entry = next(live, None)
+                irregular.pop(file_entry[0], None)
+                yield ('live',) + file_entry
+                file_entry = next(files, None)
+
+        # Irregular rows whose file the walk did not find
+        for normalized, (path, source, packed) in sorted(irregular.items()):
+            if not packed and self.under_roots(normalized):
+                yield 'missing', path, source, None
+
+    def still_orphaned(self, paths):
+        """
+        The paths no row points at, checked against the database again
+
+        Rows may store a path relative to the working directory, so both
+        forms are looked up.
+        """
+        candidates = paths + [os.path.relpath(path) for path in paths]
+        with connection.cursor() as cursor:
+            cursor.execute(LIVE_PATHS_IN_SQL, [candidates, candidates, candidates])
+            live = {normalize_path(row[0]) for row in cursor.fetchall()}
+        return [path for path in paths if path not in live]
+
+    def run_once(self):
+        """
+        One full collection pass
+
+        Returns:
+            dict: scanned/orphaned/deleted/missing counts, bytes and timings
+        """
+        started = time.monotonic()
+        cutoff = time.time() - self.grace_hours * 3600
+        stats = {
+            'scanned': 0, 'orphaned': 0, 'orphaned_bytes': 0, 'too_recent': 0,
+            'deleted': 0, 'deleted_bytes': 0, 'missing': 0,
+        }
+        missing = []
+
+        def orphans():
+            for kind, path, detail, mtime in self.compare():
+                if kind == 'missing':
+                    stats['missing'] += 1
+                    self.report(f"missing file: {path} ({detail})")
+                    missing.append((path, False, None))
+                    if len(missing) >= self.batch_size:
+                        self.record_missing(missing)
+                    continue
+                stats['scanned'] += 1
+                if kind == 'orphan':
+                    if mtime > cutoff:
+                        stats['too_recent'] += 1
+                    else:
+                        yield path, detail
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for batch in batched(orphans(), self.batch_size):
+                stats['orphaned'] += len(batch)
+                stats['orphaned_bytes'] += sum(size for _, size in batch)
+                if self.dry_run:
+                    for path, size in batch:
+                        self.report(f"would delete: {path} ({size} bytes)")
+                    continue
+
+                sizes = dict(batch)
+                with transaction.atomic():
+                    # An upload reusing one of these paths either committed its row
+                    # before the recheck or waits and finds the file gone
+                    lock_blob_paths(sizes, exclusive=True)
+                    removed = [path for path in pool.map(self.remove, self.still_orphaned(list(sizes))) if path]
+                    StoredFile.record_many((path, False, None) for path in removed)
+                stats['deleted'] += len(removed)
+                stats['deleted_bytes'] += sum(sizes[path] for path in removed)
+        self.record_missing(missing)
+
+        stats['elapsed'] = time.monotonic() - started
+        stats['files_per_second'] = stats['scanned'] / stats['elapsed'] if stats['elapsed'] else 0
+        return stats
+
+    def record_missing(self, entries):
+        if not self.dry_run:
+            StoredFile.record_many(entries)
+        entries.clear()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return path
+        except FileNotFoundError:
+            return path
+        except OSError as e:
+            logger.warning("Could not delete orphaned document file %s: %s", path, e)
+            return None
+
+    def run(self):
+        """
+        run_once() unless another collection holds the lock
+
+        Returns:
+            dict | None: Stats, or None if another run is in progress
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [GC_LOCK_KEY])
+            if not cursor.fetchone()[0]:
+                return None
+        try:
+            return self.run_once()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [GC_LOCK_KEY])
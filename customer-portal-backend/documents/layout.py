@@ -0,0 +1,136 @@
+from datetime import datetime
+from django.conf import settings
+import errno
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import uuid
+
+# Characters kept from a document type when it becomes part of a file name
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def fanout_dirs(key):
+    """
+    Two directory levels taken from a hex key: 'abcdef...' -> ('ab', 'cd')
+    """
+    return key[0:2], key[2:4]
+
+
+def link_or_copy(source, destination):
+    """
+    Make destination another name for source: a hard link, or a copy when
+    the two are on different filesystems
+
+    The source is left in place so the move can be committed to the
+    database before the old name is removed.
+
+    Returns:
+        bool: False if destination already existed (left untouched)
+
+    Raises:
+        FileNotFoundError: source does not exist
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+        return True
+    except FileExistsError:
+        return False
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.EMLINK):
+            raise
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f, open(source, 'rb') as src:
+            shutil.copyfileobj(src, f, 1024 * 1024)
+        if os.path.exists(destination):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, destination)
+        return True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class StorageLayout:
+    """
+    Where document files live on disk
+
+    Every file sits two hashed directory levels below its root
+    (<root>/ab/cd/<name>), so 65,536 directories share the files and no
+    single directory grows large enough to slow down open, stat and
+    listings. Blobs are named by their content hash. Other files get a
+    random token in their name and are written exclusively, so two uploads
+    can never end up with the same path. The same paths double as object
+    keys when documents are kept in an object store.
+    """
+
+    def __init__(self, blob_root=None, file_root=None):
+        self.blob_root = blob_root or settings.DOCUMENT_BLOB_PATH
+        self.file_root = file_root or settings.DOCUMENT_FILE_PATH
+
+    def blob_path(self, sha256):
+        """
+        <blob_root>/<sha256[0:2]>/<sha256[2:4]>/<sha256>
+        """
+        return os.path.join(self.blob_root, *fanout_dirs(sha256), sha256)
+
+    def file_name(self, document_type, original_name):
+        """
+        <type>_<YYYYmmdd_HHMMSS>_<token><ext>, unique without checking the disk
+        """
+        document_type = UNSAFE_NAME_CHARS.sub('_', document_type or 'document')
+        extension = os.path.splitext(original_name or '')[1].lower()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f"{document_type}_{timestamp}_{uuid.uuid4().hex}{extension}"
+
+    def file_path(self, file_name):
+        """
+        Location of a named file: <file_root>/<h[0:2]>/<h[2:4]>/<file_name>, h = sha256(file_name)
+        """
+        key = hashlib.sha256(file_name.encode()).hexdigest()
+        return os.path.join(self.file_root, *fanout_dirs(key), file_name)
+
+    def new_file_path(self, document_type, original_name):
+        return self.file_path(self.file_name(document_type, original_name))
+
+    def is_blob_in_place(self, path, sha256):
+        return path == self.blob_path(sha256)
+
+    def is_file_in_place(self, path):
+        return path == self.file_path(os.path.basename(path))
+
+    def relocation_target(self, path, document_type, sha256=None):
+        """
+        Where an existing file belongs in this layout, or None if it is already there
+
+        Blobs move to their hashed location. Other files get a fresh
+        collision-proof name, since flat per-type directories may hold the
+        same name for different customers.
+        """
+        if sha256:
+            return None if self.is_blob_in_place(path, sha256) else self.blob_path(sha256)
+        if self.is_file_in_place(path):
+            return None
+        return self.new_file_path(document_type, path)
+
+
+_storage_layout = None
+
+
+def get_storage_layout():
+    """
+    Layout configured from DOCUMENT_BLOB_PATH and DOCUMENT_FILE_PATH
+    """
+    global _storage_layout
+    if _storage_layout is None or (
+        _storage_layout.blob_root, _storage_layout.file_root
+    ) != (settings.DOCUMENT_BLOB_PATH, settings.DOCUMENT_FILE_PATH):
+        _storage_layout = StorageLayout()
+    return _storage_layout
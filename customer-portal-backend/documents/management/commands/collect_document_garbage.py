@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from documents.garbage import DocumentGarbageCollector
+from documents.storage import get_document_storage
+
+
+class Command(BaseCommand):
+    help = "Delete document files no live row points at and report rows whose files are missing"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root', action='append',
+            help='Directory to collect, repeatable (default the blob store, DOCUMENT_FILE_PATH and legacy upload directories)'
+        )
+        parser.add_argument('--grace-hours', type=float, help='Keep unreferenced files younger than this (default DOCUMENT_GC_GRACE_HOURS)')
+        parser.add_argument('--workers', type=int, help='Parallel deletions (default DOCUMENT_BATCH_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Candidates re-checked against the database at a time')
+        parser.add_argument('--dry-run', action='store_true', help='List what would be deleted without deleting')
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds instead of running once')
+
+    def handle(self, *args, **options):
+        if not get_document_storage().is_local:
+            raise CommandError("Garbage collection walks the local filesystem; use the bucket's lifecycle rules for object storage")
+        collector = DocumentGarbageCollector(
+            roots=options['root'],
+            grace_hours=options['grace_hours'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            stdout=self.stdout
+        )
+
+        while True:
+            stats = collector.run()
+            if stats is None:
+                self.stdout.write("Another document garbage collection is running, skipped")
+            else:
+                verb = 'would delete' if options['dry_run'] else 'deleted'
+                deleted = stats['orphaned'] if options['dry_run'] else stats['deleted']
+                deleted_bytes = stats['orphaned_bytes'] if options['dry_run'] else stats['deleted_bytes']
+                self.stdout.write(
+                    f"Scanned {stats['scanned']} files in {stats['elapsed']:.1f}s ({stats['files_per_second']:.0f} files/s): "
+                    f"{deleted} orphaned {verb} ({deleted_bytes / 1024 / 1024:.1f} MB), "
+                    f"{stats['too_recent']} within the grace period, {stats['missing']} rows with missing files"
+                )
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from documents.packs import DocumentPacker
+from documents.storage import get_document_storage
+
+
+class Command(BaseCommand):
+    help = "Move cold DocumentControl files into append-only packfiles and remove the loose files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Files no row created within this many days points at (default DOCUMENT_COLD_AFTER_DAYS)')
+        parser.add_argument('--pack-size', type=int, help='Seal a pack once it reaches this many bytes (default DOCUMENT_PACK_SIZE)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Files appended and indexed per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='List what would be packed without packing')
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds instead of running once')
+
+    def handle(self, *args, **options):
+        if not get_document_storage().is_local:
+            raise CommandError("Packing works on the local filesystem; it does not apply to object storage")
+        packer = DocumentPacker(
+            older_than_days=options['older_than_days'],
+            pack_size=options['pack_size'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            stdout=self.stdout
+        )
+
+        while True:
+            stats = packer.run()
+            if stats is None:
+                self.stdout.write("Another packing run is in progress, skipped")
+            else:
+                verb = 'would pack' if options['dry_run'] else 'packed'
+                self.stdout.write(
+                    f"{stats['packed']} files {verb} ({stats['packed_bytes'] / 1024 / 1024:.1f} MB) "
+                    f"in {stats['elapsed']:.1f}s, {stats['missing']} missing"
+                )
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
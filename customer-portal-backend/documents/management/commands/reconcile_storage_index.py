@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from documents.models import CustomerDocument, DocumentControl, StoredFile
+from documents.storage import get_document_storage
+
+
+class Command(BaseCommand):
+    help = "Walk document storage and refresh the StoredFile presence index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root', action='append',
+            help='Directory to walk, repeatable (default DOCUMENT_STORAGE_PATH and DOCUMENT_BLOB_PATH)'
+        )
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds instead of running once')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        roots = sorted({os.path.abspath(root) for root in options['root'] or [
+            settings.DOCUMENT_STORAGE_PATH, settings.DOCUMENT_BLOB_PATH
+        ]})
+        # Skip roots nested in another root so nothing is walked twice
+        roots = [root for root in roots if not any(root.startswith(other + os.sep) for other in roots)]
+
+        while True:
+            self.reconcile(roots, options['batch_size'])
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def reconcile(self, roots, batch_size):
+        if not get_document_storage().is_local:
+            # Object stores are not walked; only paths the index does not know are looked up
+            roots = []
+        for root in roots:
+            found, missing = StoredFile.reconcile(root, batch_size=batch_size)
+            self.stdout.write(f"{root}: {found} files indexed, {missing} marked missing")
+
+        # Document paths the walk did not reach (missing files, or outside the roots)
+        indexed = StoredFile.objects.values('path')
+        unindexed = set(
+            CustomerDocument.objects.exclude(file_path__in=indexed).values_list('file_path', flat=True)
+        ) | set(
+            DocumentControl.objects.exclude(filePath__in=indexed).values_list('filePath', flat=True)
+        )
+        unindexed.discard('')
+        missing = StoredFile.refresh_many(sorted(unindexed), batch_size=batch_size)
+        self.stdout.write(f"{len(unindexed)} unindexed document paths checked, {missing} missing")
@@ -0,0 +1,159 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from documents.layout import get_storage_layout, link_or_copy
+from documents.models import CustomerDocument, DocumentBlob, DocumentControl, StoredFile
+from documents.storage import get_document_storage
+from vehicles.profile_cache import invalidate_vehicle_profiles
+
+
+def keyset_batches(queryset, fields, batch_size):
+    """
+    (id, *fields) rows in id order, batch_size at a time
+    """
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def rewrite_paths(model, key_column, path_column, moves):
+    """
+    Point rows at their new paths, unless their path changed meanwhile
+
+    Args:
+        moves: [(key, old path, new path)]
+
+    Returns:
+        set: Keys of the rows that were rewritten
+    """
+    if not moves:
+        return set()
+    values = ', '.join(['(%s, %s, %s)'] * len(moves))
+    params = [value for move in moves for value in move]
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE "{model._meta.db_table}" AS t SET "{path_column}" = m.new_path
+            FROM (VALUES {values}) AS m(key, old_path, new_path)
+            WHERE t."{key_column}" = m.key AND t."{path_column}" = m.old_path
+            RETURNING m.key
+        """, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def rewrite_document_paths(key_column, moves):
+    rewritten = rewrite_paths(DocumentControl, key_column, 'filePath', moves)
+    if rewritten:
+        # Cached vehicle profiles list document paths
+        invalidate_vehicle_profiles(documents=DocumentControl.objects.filter(
+            filePath__in=[new_path for key, _, new_path in moves if key in rewritten]
+        ).only('reference_kind', 'reference_int_key', 'reference_str_key'))
+    return rewritten
+
+
+def rewrite_blob_paths(moves):
+    moved = rewrite_paths(DocumentBlob, 'id', 'path', moves)
+    rewrite_document_paths('blob_id', [move for move in moves if move[0] in moved])
+    return moved
+
+
+class Command(BaseCommand):
+    help = "Move document files into the fanned-out storage layout and rewrite their stored paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Files moved in parallel (default DOCUMENT_BATCH_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows rewritten per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+
+    def handle(self, *args, **options):
+        if not get_document_storage().is_local:
+            raise CommandError("Relocation moves files on the local filesystem; it does not apply to object storage")
+        layout = get_storage_layout()
+        sources = [
+            # (label, rows, target for a row, rewrite)
+            (
+                'blobs',
+                keyset_batches(DocumentBlob.objects.all(), ['path', 'sha256'], options['batch_size']),
+                lambda path, sha256: layout.relocation_target(path, None, sha256),
+                rewrite_blob_paths,
+            ),
+            (
+                'DocumentControl files',
+                keyset_batches(DocumentControl.objects.filter(blob__isnull=True), ['filePath', 'type'], options['batch_size']),
+                lambda path, document_type: layout.relocation_target(path, document_type),
+                lambda moves: rewrite_document_paths('id', moves),
+            ),
+            (
+                'CustomerDocument files',
+                keyset_batches(CustomerDocument.objects.all(), ['file_path', 'document_type'], options['batch_size']),
+                lambda path, document_type: layout.relocation_target(path, document_type),
+                lambda moves: rewrite_paths(CustomerDocument, 'id', 'file_path', moves),
+            ),
+        ]
+
+        with ThreadPoolExecutor(max_workers=options['workers'] or settings.DOCUMENT_BATCH_WORKERS) as pool:
+            for label, batches, target, rewrite in sources:
+                self.relocate(label, batches, target, rewrite, pool, options['dry_run'])
+
+    def relocate(self, label, batches, target, rewrite, pool, dry_run):
+        started = time.monotonic()
+        moved = missing = skipped = moved_bytes = 0
+
+        for rows in batches:
+            moves = []
+            for key, path, detail in rows:
+                destination = target(path, detail) if path else None
+                if destination:
+                    moves.append((key, path, destination))
+            if dry_run:
+                moved += len(moves)
+                continue
+
+            # Link every file under its new name first; the old name goes only once the row points away from it
+            def link(move):
+                key, source, destination = move
+                try:
+                    created = link_or_copy(source, destination)
+                except FileNotFoundError:
+                    return None
+                return key, source, destination, created, os.stat(destination).st_size
+
+            linked = [result for result in pool.map(link, moves) if result is not None]
+            missing += len(moves) - len(linked)
+
+            with transaction.atomic():
+                rewritten = rewrite([(key, source, destination) for key, source, destination, _, _ in linked])
+
+            index = []
+            for key, source, destination, created, size in linked:
+                if key in rewritten:
+                    try:
+                        os.remove(source)
+                    except FileNotFoundError:
+                        pass
+                    index += [(source, False, None), (destination, True, size)]
+                    moved += 1
+                    moved_bytes += size
+                else:
+                    # The row changed while its file was being linked
+                    if created:
+                        os.remove(destination)
+                    skipped += 1
+            StoredFile.record_many(index)
+
+        elapsed = time.monotonic() - started
+        if dry_run:
+            self.stdout.write(f"{label}: {moved} would move")
+            return
+        self.stdout.write(
+            f"{label}: {moved} moved ({moved_bytes / 1024 / 1024:.1f} MB), {missing} missing, "
+            f"{skipped} changed meanwhile, {elapsed:.1f}s ({moved / elapsed if elapsed else 0:.0f} files/s)"
+        )
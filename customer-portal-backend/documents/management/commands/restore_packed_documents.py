@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import DocumentControl, PackedFile, REFERENCE_KIND_TYPES
+from documents.packs import get_cold_tier
+
+
+class Command(BaseCommand):
+    help = "Promote packed document files back to loose files in the hot tier"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', default=[], help='Stored file path, repeatable')
+        parser.add_argument(
+            '--reference', nargs=2, action='append', default=[], metavar=('KIND', 'KEY'),
+            help=f"Every file of a reference, repeatable; KIND is one of {', '.join(REFERENCE_KIND_TYPES)}"
+        )
+        parser.add_argument('--pack', type=int, action='append', default=[], help='Every file of a DocumentPack id, repeatable')
+        parser.add_argument('--all', action='store_true', help='Empty the cold tier')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        paths = set(options['path'])
+        for kind, key in options['reference']:
+            if kind not in REFERENCE_KIND_TYPES:
+                raise CommandError(f"Unknown reference kind '{kind}'")
+            for documents in DocumentControl.for_references([(kind, key)]).values():
+                paths.update(document.filePath for document in documents)
+
+        if options['all']:
+            paths.update(PackedFile.objects.values_list('path', flat=True))
+        elif options['pack']:
+            paths.update(PackedFile.objects.filter(pack_id__in=options['pack']).values_list('path', flat=True))
+
+        if not paths:
+            raise CommandError("Nothing selected: give --path, --reference, --pack or --all")
+
+        restored = get_cold_tier().restore(sorted(paths), batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(f"{restored} files restored to the hot tier")
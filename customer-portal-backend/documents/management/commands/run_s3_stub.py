@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from documents.s3_stub import StubS3Server
+
+
+class Command(BaseCommand):
+    help = "Run a local in-memory stand-in S3 endpoint for development and storage benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=9010, help='Port to listen on')
+        parser.add_argument('--access-key-id', default='stub')
+        parser.add_argument('--secret-access-key', default='stub-secret')
+        parser.add_argument('--region', default='us-east-1')
+
+    def handle(self, *args, **options):
+        stub = StubS3Server(
+            port=options['port'],
+            access_key_id=options['access_key_id'],
+            secret_access_key=options['secret_access_key'],
+            region=options['region']
+        )
+        self.stdout.write(
+            f"Stub S3 endpoint listening on {stub.url}\n"
+            f"Use DOCUMENT_STORAGE_BACKEND=documents.storage.S3DocumentStorage DOCUMENT_S3_ENDPOINT_URL={stub.url} "
+            f"DOCUMENT_S3_BUCKET=documents DOCUMENT_S3_ACCESS_KEY_ID={options['access_key_id']} "
+            f"DOCUMENT_S3_SECRET_ACCESS_KEY={options['secret_access_key']} DOCUMENT_S3_REGION={options['region']}"
+        )
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
+            self.stdout.write(
+                f"{stub.requests} requests over {stub.connections} connections, "
+                f"{len(stub.objects)} objects, {stub.multipart_completed} multipart uploads"
+            )
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-16 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_fix_replaced_by_field'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerdocument',
+            index=models.Index(fields=['customer_email', 'is_active', 'uploaded_at', 'id'], name='CustomerDoc_custome_3c415a_idx'),
+        ),
+    ]
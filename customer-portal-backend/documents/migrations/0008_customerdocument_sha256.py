@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-16 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_documentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerdocument',
+            name='sha256',
+            field=models.CharField(blank=True, default='', help_text='Hex SHA-256 of the file content', max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-16 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_customerdocument_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcontrol',
+            name='original_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='original_documents', to='documents.documentblob'),
+        ),
+        migrations.AddField(
+            model_name='documentcontrol',
+            name='original_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
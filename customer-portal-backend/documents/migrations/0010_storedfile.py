@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-16 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_documentcontrol_original'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('present', models.BooleanField(default=True)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Stored File',
+                'verbose_name_plural': 'Stored Files',
+                'db_table': 'StoredFile',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-16 19:27
+
+from django.db import migrations, models
+
+
+# Derive the typed reference of existing rows from type and referenceId
+BACKFILL_REFERENCE_SQL = """
+UPDATE "DocumentControl" SET
+    "reference_kind" = CASE
+        WHEN "type" IN ('vehicle_registration', 'vehicle_insurance', 'vehicle_puc') THEN 'vehicle'
+        WHEN "type" = 'driver_aadhar' THEN 'driver'
+        WHEN "type" = 'helper_aadhar' THEN 'helper'
+        WHEN "type" IN ('po', 'do', 'before_weighing', 'after_weighing') THEN 'po'
+    END,
+    "reference_int_key" = CASE
+        WHEN "type" IN ('po', 'do', 'before_weighing', 'after_weighing') THEN NULL
+        ELSE "referenceId"
+    END,
+    "reference_str_key" = CASE
+        WHEN "type" IN ('po', 'do', 'before_weighing', 'after_weighing') THEN "referenceId"::text
+    END
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_storedfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcontrol',
+            name='reference_int_key',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentcontrol',
+            name='reference_kind',
+            field=models.CharField(blank=True, choices=[('vehicle', 'Vehicle'), ('driver', 'Driver'), ('helper', 'Helper'), ('po', 'Purchase Order')], max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentcontrol',
+            name='reference_str_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_REFERENCE_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='documentcontrol',
+            index=models.Index(condition=models.Q(('reference_int_key__isnull', False)), fields=['reference_kind', 'reference_int_key', 'type'], name='DocumentCon_ref_int_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentcontrol',
+            index=models.Index(condition=models.Q(('reference_str_key__isnull', False)), fields=['reference_kind', 'reference_str_key', 'type'], name='DocumentCon_ref_str_idx'),
+        ),
+    ]
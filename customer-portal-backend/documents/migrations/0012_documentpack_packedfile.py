@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-16 19:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_documentcontrol_typed_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('sealed', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Document Pack',
+                'verbose_name_plural': 'Document Packs',
+                'db_table': 'DocumentPack',
+            },
+        ),
+        migrations.CreateModel(
+            name='PackedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('offset', models.BigIntegerField()),
+                ('length', models.BigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('packed_at', models.DateTimeField(auto_now_add=True)),
+                ('pack', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='documents.documentpack')),
+            ],
+            options={
+                'verbose_name': 'Packed File',
+                'verbose_name_plural': 'Packed Files',
+                'db_table': 'PackedFile',
+            },
+        ),
+    ]
@@ -1,10 +1,22 @@
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F, Q
 from vehicles.models import VehicleDetails
 from drivers.models import DriverHelper
-from django.conf import settings
+from django.utils import timezone
+from customer_portal.upsert import column_list, upsert_returning
+from .layout import get_storage_layout
+from .storage import get_document_storage
+import hashlib
+import itertools
 import os
-import shutil
-from datetime import datetime
+
+EXTENSION_CONTENT_TYPES = {
+    '.pdf': 'application/pdf',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+}
 
 DOCUMENT_TYPES = (
     ('vehicle_registration', 'Vehicle Registration'),
@@ -18,14 +30,399 @@ DOCUMENT_TYPES = (
     ('after_weighing', 'After Weighing Receipt'),
 )
 
+# What a DocumentControl row refers to, by document type
+REFERENCE_KINDS = (
+    ('vehicle', 'Vehicle'),      # VehicleDetails.id
+    ('driver', 'Driver'),        # DriverHelper.id
+    ('helper', 'Helper'),        # DriverHelper.id
+    ('po', 'Purchase Order'),    # PODetails.id (PO number)
+)
+
+REFERENCE_KIND_TYPES = {
+    'vehicle': ('vehicle_registration', 'vehicle_insurance', 'vehicle_puc'),
+    'driver': ('driver_aadhar',),
+    'helper': ('helper_aadhar',),
+    'po': ('po', 'do', 'before_weighing', 'after_weighing'),
+}
+
+DOCUMENT_REFERENCE_KINDS = {
+    document_type: kind
+    for kind, document_types in REFERENCE_KIND_TYPES.items()
+    for document_type in document_types
+}
+
+# Kinds keyed by a string primary key; the rest use reference_int_key
+STRING_REFERENCE_KINDS = ('po',)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class StoredFile(models.Model):
+    """
+    Index of document files on storage: presence and size by path
+
+    Serializers and views read this instead of stat()ing every file, which is
+    slow on network storage. Writes and deletes made through the app update
+    it directly; reconcile() walks the storage tree to catch changes made
+    behind the app's back (python manage.py reconcile_storage_index).
+    """
+    path = models.CharField(max_length=500, unique=True)
+    present = models.BooleanField(default=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    checked_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'StoredFile'
+        verbose_name = 'Stored File'
+        verbose_name_plural = 'Stored Files'
+
+    def __str__(self):
+        return f"{self.path} ({'present' if self.present else 'missing'})"
+
+    @classmethod
+    def record_many(cls, entries, checked_at=None):
+        """
+        Upsert index rows with one statement
+
+        Args:
+            entries: Iterable of (path, present, size)
+        """
+        rows = {path: (present, size) for path, present, size in entries}
+        if not rows:
+            return 0
+        checked_at = checked_at or timezone.now()
+        values = []
+        params = []
+        for path, (present, size) in rows.items():
+            values.append("(%s, %s, %s, %s)")
+            params.extend([path, present, size, checked_at])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO "StoredFile" ("path", "present", "size", "checked_at")
+                VALUES {', '.join(values)}
+                ON CONFLICT ("path") DO UPDATE SET
+                    "present" = EXCLUDED."present",
+                    "size" = EXCLUDED."size",
+                    "checked_at" = EXCLUDED."checked_at"
+                WHERE "StoredFile"."checked_at" <= EXCLUDED."checked_at"
+            """, params)
+        return len(rows)
+
+    @classmethod
+    def record(cls, path, size):
+        """
+        Note a file written by the app
+        """
+        cls.record_many([(path, True, size)])
+
+    @classmethod
+    def record_missing(cls, path):
+        """
+        Note a file deleted by the app, or found missing
+        """
+        cls.record_many([(path, False, None)])
+
+    @classmethod
+    def refresh(cls, path):
+        """
+        Look a path up in document storage and record the result
+
+        Returns:
+            bool: Whether the file exists
+        """
+        try:
+            size = get_document_storage().size(path)
+        except OSError:
+            cls.record_missing(path)
+            return False
+        cls.record(path, size)
+        return True
+
+    @classmethod
+    def is_present(cls, path):
+        """
+        Indexed presence of a path, checking storage only if it is not indexed yet
+        """
+        present = cls.objects.filter(path=path).values_list('present', flat=True).first()
+        return cls.refresh(path) if present is None else present
+
+    @classmethod
+    def presence_subquery(cls, path_field):
+        """
+        Subquery annotating a queryset with the indexed presence of path_field
+        (None when the path is not indexed yet)
+        """
+        return models.Subquery(
+            cls.objects.filter(path=models.OuterRef(path_field)).values('present')[:1]
+        )
+
+    @classmethod
+    def reconcile(cls, root, batch_size=1000):
+        """
+        Bring the index for everything under root in line with storage
+
+        Every file found is recorded present and indexed paths under root
+        that were not found are recorded missing.
+
+        Returns:
+            tuple: (files found, paths marked missing)
+        """
+        started = timezone.now()
+        root = os.path.abspath(root)
+
+        def walk(directory):
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                return
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        yield entry.path, True, entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+
+        found = 0
+        for batch in batched(walk(root), batch_size):
+            found += cls.record_many(batch, checked_at=started)
+
+        # Files moved into a cold-tier pack are still present, just not as a loose file
+        missing = cls.objects.filter(
+            path__startswith=root.rstrip(os.sep) + os.sep, checked_at__lt=started, present=True
+        ).exclude(
+            path__in=PackedFile.objects.values('path')
+        ).update(present=False, size=None, checked_at=timezone.now())
+        return found, missing
+
+    @classmethod
+    def refresh_many(cls, paths, batch_size=1000):
+        """
+        Look each path up in document storage and record the results in batches
+
+        Returns:
+            int: Number of paths found missing
+        """
+        storage = get_document_storage()
+
+        def stat_paths():
+            for path in paths:
+                try:
+                    yield path, True, storage.size(path)
+                except OSError:
+                    yield path, False, None
+
+        missing = 0
+        for batch in batched(stat_paths(), batch_size):
+            cls.record_many(batch)
+            missing += sum(1 for _, present, _ in batch if not present)
+        return missing
+
+
+class DocumentPack(models.Model):
+    """
+    Append-only packfile holding cold document files (see documents/packs.py)
+    """
+    path = models.CharField(max_length=500, unique=True)
+    size = models.BigIntegerField(default=0)  # Committed length; bytes past it are an interrupted append
+    entry_count = models.IntegerField(default=0)
+    sealed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'DocumentPack'
+        verbose_name = 'Document Pack'
+        verbose_name_plural = 'Document Packs'
+
+    def __str__(self):
+        return f"{self.path} ({self.entry_count} files{', sealed' if self.sealed else ''})"
+
+
+class PackedFile(models.Model):
+    """
+    Offset index of the cold tier: where in which pack a document file lives
+
+    Rows keep pointing at the file's original path, so nothing that
+    stores paths changes when a file is packed or restored.
+    """
+    path = models.CharField(max_length=500, unique=True)
+    pack = models.ForeignKey(DocumentPack, on_delete=models.PROTECT, related_name='entries')
+    offset = models.BigIntegerField()  # Of the file's first byte in the pack
+    length = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    packed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'PackedFile'
+        verbose_name = 'Packed File'
+        verbose_name_plural = 'Packed Files'
+
+    def __str__(self):
+        return f"{self.path} (pack {self.pack_id} @ {self.offset})"
+
+
+class DocumentBlob(models.Model):
+    """
+    Unique file content in the content-addressed document store
+
+    Every DocumentControl row pointing at the blob holds one reference; the
+    file is removed when the last reference is released.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    path = models.CharField(max_length=500)
+    refcount = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'DocumentBlob'
+        verbose_name = 'Document Blob'
+        verbose_name_plural = 'Document Blobs'
+
+    def __str__(self):
+        return f"{self.sha256} ({self.refcount} refs)"
+
+    @classmethod
+    def acquire(cls, sha256):
+        """
+        Take a reference on existing content
+
+        Returns:
+            DocumentBlob: The blob with its new refcount, or None if the
+            content is not stored yet
+        """
+        sql = f"""
+            UPDATE "DocumentBlob" SET "refcount" = "refcount" + 1
+            WHERE "sha256" = %s
+            RETURNING {column_list(cls)}
+        """
+        result = upsert_returning(cls, sql, [sha256])
+        return result[0] if result else None
+
+    @classmethod
+    def register(cls, sha256, size, path, content_type=''):
+        """
+        Record newly written content and take a reference on it
+
+        A concurrent upload of the same content may have registered it first,
+        in which case its row gains the reference instead.
+        """
+        sql = f"""
+            INSERT INTO "DocumentBlob" ("sha256", "size", "content_type", "path", "refcount", "created")
+            VALUES (%s, %s, %s, %s, 1, %s)
+            ON CONFLICT ("sha256") DO UPDATE SET "refcount" = "DocumentBlob"."refcount" + 1
+            RETURNING {column_list(cls)}
+        """
+        return upsert_returning(cls, sql, [sha256, size, content_type, path, timezone.now()])[0]
+
+    @classmethod
+    def register_many(cls, entries):
+        """
+        Take references on several contents with one statement, inserting
+        rows for content not stored yet
+
+        Args:
+            entries: {sha256: (size, path, content_type, references)}
+
+        Returns:
+            dict: {sha256: (DocumentBlob, created)}
+        """
+        if not entries:
+            return {}
+        now = timezone.now()
+        values = []
+        params = []
+        for sha256, (size, path, content_type, references) in sorted(entries.items()):
+            values.append("(%s, %s, %s, %s, %s, %s)")
+            params.extend([sha256, size, content_type, path, references, now])
+
+        sql = f"""
+            INSERT INTO "DocumentBlob" ("sha256", "size", "content_type", "path", "refcount", "created")
+            VALUES {', '.join(values)}
+            ON CONFLICT ("sha256") DO UPDATE SET "refcount" = "DocumentBlob"."refcount" + EXCLUDED."refcount"
+            RETURNING {column_list(cls)}, (xmax = 0) AS created
+        """
+        fields = cls._meta.concrete_fields
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        blobs = {}
+        for row in rows:
+            blob = cls.from_db(connection.alias, [field.attname for field in fields], row[:len(fields)])
+            blobs[blob.sha256] = (blob, row[len(fields)])
+        return blobs
+
+    @classmethod
+    def release(cls, blob_id):
+        """
+        Drop one reference; delete the row and the file when none remain
+
+        The row stays locked until the transaction ends, so an upload of the
+        same content waits and then writes the file again instead of
+        referencing a file that is being removed.
+
+        Returns:
+            bool: True if the blob was deleted
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(id=blob_id).first()
+            if blob is None:
+                return False
+            if blob.refcount > 1:
+                cls.objects.filter(id=blob_id).update(refcount=F('refcount') - 1)
+                return False
+
+            blob.delete()
+            get_document_storage().delete(blob.path)
+            StoredFile.record_missing(blob.path)
+            return True
+
+
 class DocumentControl(models.Model):
     """
     Document storage (TTMS DocumentControl table)
+
+    Uploads are stored once per unique content: filePath points at the
+    shared DocumentBlob file. Rows created before the blob store have no
+    blob and own their file. Normalized images keep the upload's size in
+    original_size and, if configured, the upload itself in original_blob.
+
+    The referenced vehicle, driver, helper or PO is stored as a typed
+    reference: reference_kind plus reference_int_key (integer primary keys)
+    or reference_str_key (PO numbers). referenceId is kept for existing
+    API consumers and holds the integer key only.
     """
     name = models.CharField(max_length=255, null=True, blank=True)
     type = models.CharField(max_length=50, choices=DOCUMENT_TYPES)
-    referenceId = models.IntegerField(null=True, blank=True)  # Can reference VehicleDetails, DriverHelper, or PODetails
+    referenceId = models.IntegerField(null=True, blank=True)  # Legacy: integer key of reference_kind, null for POs
+    reference_kind = models.CharField(max_length=10, choices=REFERENCE_KINDS, null=True, blank=True)
+    reference_int_key = models.BigIntegerField(null=True, blank=True)
+    reference_str_key = models.CharField(max_length=100, null=True, blank=True)
     filePath = models.CharField(max_length=500)
+    blob = models.ForeignKey(
+        DocumentBlob,
+        on_delete=models.PROTECT,
+        related_name='documents',
+        null=True,
+        blank=True
+    )
+    # Set when the upload was re-encoded (DOCUMENT_IMAGE_NORMALIZE)
+    original_size = models.BigIntegerField(null=True, blank=True)
+    original_blob = models.ForeignKey(
+        DocumentBlob,
+        on_delete=models.PROTECT,
+        related_name='original_documents',
+        null=True,
+        blank=True
+    )
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -33,10 +430,100 @@ class DocumentControl(models.Model):
         verbose_name = 'Document'
         verbose_name_plural = 'Documents'
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['reference_kind', 'reference_int_key', 'type'],
+                name='DocumentCon_ref_int_idx',
+                condition=Q(reference_int_key__isnull=False)
+            ),
+            models.Index(
+                fields=['reference_kind', 'reference_str_key', 'type'],
+                name='DocumentCon_ref_str_idx',
+                condition=Q(reference_str_key__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.get_type_display()}"
 
+    @property
+    def reference_key(self):
+        if self.reference_kind in STRING_REFERENCE_KINDS:
+            return self.reference_str_key
+        return self.reference_int_key
+
+    @staticmethod
+    def normalize_reference_key(kind, key):
+        if key is None:
+            return None
+        return str(key) if kind in STRING_REFERENCE_KINDS else int(key)
+
+    @classmethod
+    def reference_fields(cls, document_type, key):
+        """
+        Model fields for a document of document_type referring to key
+
+        Returns:
+            dict: reference_kind, reference_int_key / reference_str_key and referenceId
+        """
+        kind = DOCUMENT_REFERENCE_KINDS.get(document_type)
+        key = cls.normalize_reference_key(kind, key)
+        if kind in STRING_REFERENCE_KINDS:
+            return {'reference_kind': kind, 'reference_str_key': key, 'reference_int_key': None, 'referenceId': None}
+        return {'reference_kind': kind, 'reference_str_key': None, 'reference_int_key': key, 'referenceId': key}
+
+    @classmethod
+    def for_references(cls, references):
+        """
+        Documents of many vehicles, drivers, helpers and POs in one query
+
+        Only document types belonging to each kind are returned, so a driver
+        and a helper sharing a DriverHelper id do not see each other's files.
+
+        Args:
+            references: Iterable of (kind, key), e.g. [('vehicle', 3), ('po', 'PO-1')]
+
+        Returns:
+            dict: {(kind, key): [DocumentControl, ...]} newest first, in
+            the order the references were given
+        """
+        results = {}
+        keys_by_kind = {}
+        for kind, key in references:
+            key = cls.normalize_reference_key(kind, key)
+            if key is None or kind not in REFERENCE_KIND_TYPES:
+                continue
+            results.setdefault((kind, key), [])
+            keys_by_kind.setdefault(kind, []).append(key)
+
+        condition = Q()
+        for kind, keys in keys_by_kind.items():
+            key_field = 'reference_str_key' if kind in STRING_REFERENCE_KINDS else 'reference_int_key'
+            condition |= Q(reference_kind=kind, type__in=REFERENCE_KIND_TYPES[kind], **{f'{key_field}__in': keys})
+        if not condition:
+            return results
+
+        for document in cls.objects.filter(condition).order_by('-created'):
+            results[(document.reference_kind, document.reference_key)].append(document)
+        return results
+
+    def content_sha256(self):
+        """
+        Checksum of the stored content; legacy rows without a blob are hashed on demand
+        """
+        if self.blob_id:
+            return self.blob.sha256
+        digest = hashlib.sha256()
+        with get_document_storage().open(self.filePath) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def content_type(self):
+        if self.blob_id and self.blob.content_type:
+            return self.blob.content_type
+        return EXTENSION_CONTENT_TYPES.get(os.path.splitext(self.filePath)[1].lower(), 'application/octet-stream')
+
 
 # Keep CustomerDocument for backward compatibility with existing API
 class CustomerDocument(models.Model):
@@ -52,6 +539,7 @@ class CustomerDocument(models.Model):
     original_filename = models.CharField(max_length=255)
     file_size = models.BigIntegerField(help_text="File size in bytes")
     file_extension = models.CharField(max_length=10)
+    sha256 = models.CharField(max_length=64, blank=True, default='', help_text="Hex SHA-256 of the file content")
     
     vehicle = models.ForeignKey(
         VehicleDetails,
@@ -93,35 +581,16 @@ class CustomerDocument(models.Model):
         indexes = [
             models.Index(fields=['customer_email', 'document_type']),
             models.Index(fields=['is_active']),
+            models.Index(fields=['customer_email', 'is_active', 'uploaded_at', 'id']),  # Keyset pagination
         ]
 
     def __str__(self):
         return f"{self.customer_email} - {self.get_document_type_display()}"
 
-    @staticmethod
-    def get_storage_path(customer_email, document_type):
-        """
-        Generate storage directory path for documents
-        Path: /path/to/storage/documents/{customer_email}/{document_type}/
-        """
-        # Get base storage directory from settings
-        base_storage = getattr(settings, 'DOCUMENT_STORAGE_PATH', '/var/customer_portal/documents/')
-        
-        # Sanitize email for folder name
-        email_folder = customer_email.replace('@', '_at_').replace('.', '_')
-        
-        # Create full path
-        storage_path = os.path.join(base_storage, 'documents', email_folder, document_type)
-        
-        # Create directory if it doesn't exist
-        os.makedirs(storage_path, exist_ok=True)
-        
-        return storage_path
-
     @classmethod
     def save_file_to_storage(cls, uploaded_file, customer_email, document_type):
         """
-        Save uploaded file to local storage and return file path
+        Save uploaded file to document storage and return file path
         
         Args:
             uploaded_file: Django UploadedFile object
@@ -131,27 +600,33 @@ class CustomerDocument(models.Model):
         Returns:
             dict: Contains file_path, original_filename, file_size, file_extension
         """
-        # Get storage directory
-        storage_dir = cls.get_storage_path(customer_email, document_type)
-        
-        # Generate unique filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_extension = os.path.splitext(uploaded_file.name)[1]
-        filename = f"{document_type}_{timestamp}{file_extension}"
-        
-        # Full file path
-        file_path = os.path.join(storage_dir, filename)
+        content_type = EXTENSION_CONTENT_TYPES.get(file_extension.lower(), 'application/octet-stream')
         
-        # Save file to disk
-        with open(file_path, 'wb+') as destination:
-            for chunk in uploaded_file.chunks():
-                destination.write(chunk)
+        # Save under a collision-proof name in the fanned-out layout, hashing on the way;
+        # the write is exclusive so an existing file is never replaced
+        while True:
+            file_path = get_storage_layout().new_file_path(document_type, uploaded_file.name)
+            digest = hashlib.sha256()
+
+            def hashed_chunks():
+                for chunk in uploaded_file.chunks():
+                    digest.update(chunk)
+                    yield chunk
+
+            try:
+                get_document_storage().save(file_path, hashed_chunks(), content_type, exclusive=True)
+                break
+            except FileExistsError:
+                continue
+        StoredFile.record(file_path, uploaded_file.size)
         
         return {
             'file_path': file_path,
             'original_filename': uploaded_file.name,
             'file_size': uploaded_file.size,
-            'file_extension': file_extension
+            'file_extension': file_extension,
+            'sha256': digest.hexdigest()
         }
 
     def delete(self, using=None, keep_parents=False, hard_delete=False):
@@ -161,9 +636,10 @@ class CustomerDocument(models.Model):
         """
         if hard_delete:
             # Delete physical file from storage
-            if self.file_path and os.path.isfile(self.file_path):
+            if self.file_path:
                 try:
-                    os.remove(self.file_path)
+                    get_document_storage().delete(self.file_path)
+                    StoredFile.record_missing(self.file_path)
                 except OSError as e:
                     print(f"Error deleting file {self.file_path}: {e}")
             super().delete(using=using, keep_parents=keep_parents)
@@ -204,18 +680,23 @@ class CustomerDocument(models.Model):
         # Save file to storage and get file info
         file_info = cls.save_file_to_storage(uploaded_file, customer_email, document_type)
 
-        # Create new document record
-        new_doc = cls.objects.create(
-            customer_email=customer_email,
-            document_type=document_type,
-            file_path=file_info['file_path'],
-            original_filename=file_info['original_filename'],
-            file_size=file_info['file_size'],
-            file_extension=file_info['file_extension'],
-            vehicle=vehicle,
-            driver=driver,
-            helper=helper
-        )
+        # Create new document record; don't leave the file behind if that fails
+        try:
+            new_doc = cls.objects.create(
+                customer_email=customer_email,
+                document_type=document_type,
+                file_path=file_info['file_path'],
+                original_filename=file_info['original_filename'],
+                file_size=file_info['file_size'],
+                file_extension=file_info['file_extension'],
+                sha256=file_info['sha256'],
+                vehicle=vehicle,
+                driver=driver,
+                helper=helper
+            )
+        except Exception:
+            get_document_storage().delete(file_info['file_path'])
+            raise
 
         # Mark old document as replaced (soft delete)
         if old_doc:
@@ -223,13 +704,8 @@ class CustomerDocument(models.Model):
             old_doc.replaced_by = new_doc
             old_doc.save()
             
-            # Optionally delete old physical file to save space
-            # Uncomment the following to delete old files immediately
-            # if old_doc.file_path and os.path.isfile(old_doc.file_path):
-            #     try:
-            #         os.remove(old_doc.file_path)
-            #     except OSError:
-            #         pass
+            # The superseded file is removed by manage.py collect_document_garbage
+            # once the grace period has passed
 
         return new_doc
 
@@ -252,4 +728,32 @@ class CustomerDocument(models.Model):
         """
         Check if the physical file exists on storage
         """
-        return os.path.isfile(self.file_path) if self.file_path else False
\ No newline at end of file
+        return get_document_storage().exists(self.file_path) if self.file_path else False
+
+    def indexed_file_exists(self):
+        """
+        File presence from the StoredFile index, without touching storage
+
+        Uses the file_present annotation when the queryset has it
+        (StoredFile.presence_subquery); paths not indexed yet are checked once.
+        """
+        if not self.file_path:
+            return False
+        present = getattr(self, 'file_present', None)
+        if present is not None:
+            return present
+        return StoredFile.is_present(self.file_path)
+
+    def ensure_checksum(self):
+        """
+        Content checksum, computed and saved once for documents stored before
+        checksums were recorded
+        """
+        if not self.sha256:
+            digest = hashlib.sha256()
+            with get_document_storage().open(self.file_path) as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            self.sha256 = digest.hexdigest()
+            type(self).objects.filter(pk=self.pk).update(sha256=self.sha256)
+        return self.sha256
@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .upload_handlers import StreamedUploadedFile
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+NORMALIZABLE_TYPES = ('image/jpeg', 'image/png')
+
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'webp': ('WEBP', 'image/webp', '.webp'),
+}
+
+
+def encode_normalized(source, max_dimension, output_format, quality):
+    """
+    Re-encode an image without metadata, downscaled to max_dimension
+
+    EXIF orientation is applied to the pixels before the metadata is dropped;
+    the ICC profile is kept so colours do not shift.
+
+    Args:
+        source: Path or binary file object of a JPEG/PNG
+        output_format: 'jpeg' or 'webp'
+
+    Returns:
+        tuple: (encoded bytes, resized)
+    """
+    from PIL import Image, ImageOps
+
+    pil_format = OUTPUT_FORMATS[output_format][0]
+    with Image.open(source) as original:
+        original.draft('RGB', (max_dimension, max_dimension))  # Let JPEG decode at reduced scale
+        icc_profile = original.info.get('icc_profile')
+        image = ImageOps.exif_transpose(original)
+        resized = max(image.size) > max_dimension
+        if resized:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if pil_format == 'WEBP' and has_alpha:
+            image = image.convert('RGBA')
+        elif has_alpha:
+            # JPEG has no alpha: flatten onto white like a printed page
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        options = {'quality': quality}
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        if pil_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        else:
+            options.update(method=6)
+        image.save(output, pil_format, **options)
+    return output.getvalue(), resized
+
+
+class NormalizedUpload:
+    """
+    Outcome of normalizing one upload
+
+    file is what should be stored: the re-encoded image, or the upload itself
+    when normalization did not apply or would not have saved anything.
+    """
+
+    def __init__(self, file, original, normalized):
+        self.file = file
+        self.original = original
+        self.normalized = normalized
+
+    @property
+    def original_size(self):
+        return self.original.size
+
+    @property
+    def bytes_saved(self):
+        return self.original.size - self.file.size if self.normalized else 0
+
+
+class ImageNormalizer:
+    """
+    Upload-time EXIF stripping, downscaling and recompression of images
+
+    Work runs on a fixed pool of DOCUMENT_IMAGE_NORMALIZE_WORKERS threads
+    (Pillow releases the GIL while decoding and encoding). At most
+    DOCUMENT_IMAGE_NORMALIZE_QUEUE uploads wait for a worker; beyond that, or
+    on any error or timeout, the upload is stored as received instead of
+    holding the request. Re-encodes that are not smaller and not downscaled
+    are discarded. Savings are logged; per-type totals come from the
+    original_size recorded on each DocumentControl row.
+    """
+
+    def __init__(self, workers=None, max_queue=None, max_dimension=None,
+                 output_format=None, quality=None, timeout=None):
+        self.workers = workers or settings.DOCUMENT_IMAGE_NORMALIZE_WORKERS
+        self.max_dimension = max_dimension or settings.DOCUMENT_IMAGE_MAX_DIMENSION
+        self.output_format = output_format or settings.DOCUMENT_IMAGE_FORMAT
+        self.quality = quality or settings.DOCUMENT_IMAGE_QUALITY
+        self.timeout = timeout or settings.DOCUMENT_IMAGE_NORMALIZE_TIMEOUT
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported DOCUMENT_IMAGE_FORMAT: {self.output_format}")
+
+        self._slots = threading.BoundedSemaphore(
+            self.workers + (settings.DOCUMENT_IMAGE_NORMALIZE_QUEUE if max_queue is None else max_queue)
+        )
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-normalizer')
+
+    def normalize(self, uploaded_file, document_type=None):
+        """
+        Normalize an accepted upload if it is a JPEG/PNG
+
+        Returns:
+            NormalizedUpload
+        """
+        if uploaded_file.content_type not in NORMALIZABLE_TYPES:
+            return NormalizedUpload(uploaded_file, uploaded_file, False)
+
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Image normalizer busy, storing %s as uploaded", uploaded_file.name)
+            return NormalizedUpload(uploaded_file, uploaded_file, False)
+        try:
+            future = self._pool.submit(self._encode, uploaded_file)
+            future.add_done_callback(lambda done: self._slots.release())
+        except BaseException:
+            self._slots.release()
+            raise
+
+        try:
+            encoded, resized = future.result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning("Could not normalize %s, storing as uploaded: %s", uploaded_file.name, e)
+            return NormalizedUpload(uploaded_file, uploaded_file, False)
+
+        if not resized and len(encoded) >= uploaded_file.size:
+            self.record(document_type, uploaded_file.size, uploaded_file.size)
+            return NormalizedUpload(uploaded_file, uploaded_file, False)
+
+        normalized = self.spool(uploaded_file, encoded)
+        self.record(document_type, uploaded_file.size, normalized.size)
+        return NormalizedUpload(normalized, uploaded_file, True)
+
+    def _encode(self, uploaded_file):
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            return encode_normalized(uploaded_file.temporary_file_path(), self.max_dimension, self.output_format, self.quality)
+        uploaded_file.seek(0)
+        return encode_normalized(uploaded_file, self.max_dimension, self.output_format, self.quality)
+
+    def spool(self, uploaded_file, encoded):
+        """
+        Write the re-encoded bytes next to incoming uploads, ready to be moved into the blob store
+        """
+        _, content_type, extension = OUTPUT_FORMATS[self.output_format]
+        os.makedirs(settings.DOCUMENT_UPLOAD_TEMP_PATH, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=settings.DOCUMENT_UPLOAD_TEMP_PATH, suffix='.upload')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encoded)
+
+        name = os.path.splitext(uploaded_file.name or 'image')[0] + extension
+        return StreamedUploadedFile(
+            temp_path, name, content_type, len(encoded), None, hashlib.sha256(encoded).hexdigest()
+        )
+
+    def record(self, document_type, original_size, stored_size):
+        logger.info(
+            "Normalized %s image: %s -> %s bytes (%s saved)",
+            document_type, original_size, stored_size, original_size - stored_size
+        )
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+_image_normalizer = None
+_image_normalizer_lock = threading.Lock()
+
+
+def get_image_normalizer():
+    """
+    Process-wide ImageNormalizer, or None when DOCUMENT_IMAGE_NORMALIZE is off
+    """
+    global _image_normalizer
+    if not settings.DOCUMENT_IMAGE_NORMALIZE:
+        return None
+    if _image_normalizer is None:
+        with _image_normalizer_lock:
+            if _image_normalizer is None:
+                _image_normalizer = ImageNormalizer()
+    return _image_normalizer
@@ -0,0 +1,409 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import DocumentPack, PackedFile, batched
+from .storage import COPY_CHUNK_SIZE, LocalDocumentStorage, StorageError
+import hashlib
+import io
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Packing runs and empty-pack cleanup exclude each other across processes
+PACK_LOCK_KEY = 0x6470616b  # 'dpak'
+
+# Pack layout: PACK_MAGIC, then entries of
+#   ENTRY_HEADER (magic, path length, data length) | path (UTF-8) | data | sha256 digest of data
+# so a pack describes itself and its index can be rebuilt by scanning it
+PACK_MAGIC = b'DPK1'
+ENTRY_MAGIC = b'DPE1'
+ENTRY_HEADER = struct.Struct('>4sHQ')
+
+# Cold files: DocumentControl paths no row created in the last N days points at
+COLD_PATHS_SQL = """
+    SELECT "filePath" FROM "DocumentControl"
+    WHERE "filePath" > %s
+    GROUP BY "filePath"
+    HAVING MAX("created") < %s
+        AND NOT EXISTS (SELECT 1 FROM "PackedFile" WHERE "PackedFile"."path" = "DocumentControl"."filePath")
+    ORDER BY "filePath"
+    LIMIT %s
+"""
+
+LIVE_CONTROL_PATHS_SQL = """
+    SELECT DISTINCT "filePath" FROM "DocumentControl" WHERE "filePath" = ANY(%s)
+"""
+
+
+class PackEntryReader(io.RawIOBase):
+    """
+    Seekable read-only view of one file inside a pack
+
+    Reads come straight out of the pack's memory map, or from pread()
+    when the pack could not be mapped.
+    """
+
+    def __init__(self, read_at, offset, length, release=None):
+        super().__init__()
+        self._read_at = read_at
+        self._release = release
+        self._offset = offset
+        self.size = length
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.size - self._position)
+        if count <= 0:
+            return 0
+        data = self._read_at(self._offset + self._position, count)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if self._release is not None and not self.closed:
+            self._release()
+        super().close()
+
+
+class ColdTier:
+    """
+    Reads and restores document files kept in packs
+
+    LocalDocumentStorage falls back to this when a loose file is missing,
+    so packed files stay readable at their original paths. Each pack is
+    memory-mapped once per process and remapped when it has grown past the
+    mapping; packs that cannot be mapped are read with pread().
+    """
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, path):
+        return PackedFile.objects.select_related('pack').filter(path=path).first()
+
+    def _reader(self, pack_path, end):
+        """
+        Random access to a pack at least end bytes long
+
+        Returns:
+            tuple: (read_at(offset, count), release callable or None)
+        """
+        with self._lock:
+            mapped = self._maps.get(pack_path)
+            if mapped is None or len(mapped) < end:
+                try:
+                    with open(pack_path, 'rb') as f:
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError) as e:
+                    if isinstance(e, FileNotFoundError):
+                        raise
+                    mapped = None
+                    logger.warning("Could not map pack %s, reading it with pread: %s", pack_path, e)
+                else:
+                    # Readers of an older, shorter map keep it alive until they are done
+                    self._maps[pack_path] = mapped
+
+        if mapped is not None and len(mapped) >= end:
+            return (lambda offset, count: mapped[offset:offset + count]), None
+
+        fd = os.open(pack_path, os.O_RDONLY)
+        return (lambda offset, count: os.pread(fd, count, offset)), (lambda: os.close(fd))
+
+    def open_entry(self, entry):
+        read_at, release = self._reader(entry.pack.path, entry.offset + entry.length)
+        return PackEntryReader(read_at, entry.offset, entry.length, release)
+
+    def open(self, path):
+        entry = self.lookup(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        return self.open_entry(entry)
+
+    def size(self, path):
+        entry = PackedFile.objects.filter(path=path).values_list('length', flat=True).first()
+        if entry is None:
+            raise FileNotFoundError(path)
+        return entry
+
+    def forget(self, paths):
+        """
+        Drop index entries of deleted files; their bytes stay in the pack until it is emptied
+        """
+        return PackedFile.objects.filter(path__in=list(paths)).delete()[0]
+
+    def restore(self, paths, batch_size=500, stdout=None):
+        """
+        Promote packed files back to loose files in the hot tier
+
+        Each file is written back atomically at its original path and
+        checked against its recorded SHA-256 before its index entry goes.
+        Packs left without entries are deleted.
+
+        Returns:
+            int: Files restored
+        """
+        storage = LocalDocumentStorage()
+        restored = 0
+        for batch in batched(paths, batch_size):
+            done = []
+            for entry in PackedFile.objects.select_related('pack').filter(path__in=batch):
+                if os.path.isfile(entry.path):
+                    # Already loose again (an earlier restore stopped before dropping the entry)
+                    done.append(entry.path)
+                    continue
+
+                digest = hashlib.sha256()
+                with self.open_entry(entry) as source:
+                    def chunks():
+                        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                            digest.update(chunk)
+                            yield chunk
+
+                    storage.save(entry.path, chunks())
+                if digest.hexdigest() != entry.sha256:
+                    os.remove(entry.path)
+                    raise StorageError(f"Packed copy of {entry.path} is corrupt (pack {entry.pack.path} @ {entry.offset})")
+                done.append(entry.path)
+                if stdout is not None:
+                    stdout.write(f"restored: {entry.path}")
+            restored += self.forget(done)
+        drop_empty_packs()
+        return restored
+
+    def close(self):
+        with self._lock:
+            self._maps.clear()
+
+
+def drop_empty_packs():
+    """
+    Delete packs no index entry points into any more, unless packing is running
+
+    Returns:
+        int: Packs deleted
+    """
+    with advisory_lock() as locked:
+        if not locked:
+            return 0
+        dropped = 0
+        for pack in DocumentPack.objects.filter(entries__isnull=True):
+            try:
+                os.remove(pack.path)
+            except FileNotFoundError:
+                pass
+            pack.delete()
+            get_cold_tier().close()
+            dropped += 1
+        return dropped
+
+
+class advisory_lock:
+    """
+    pg_try_advisory_lock(PACK_LOCK_KEY) for the duration of a with block; yields whether it was taken
+    """
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [PACK_LOCK_KEY])
+            self.locked = cursor.fetchone()[0]
+        return self.locked
+
+    def __exit__(self, *exc_info):
+        if self.locked:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [PACK_LOCK_KEY])
+
+
+class DocumentPacker:
+    """
+    Moves cold DocumentControl files into packs
+
+    A file is cold when no row created in the last DOCUMENT_COLD_AFTER_DAYS
+    points at it. Files are appended to the open pack (and fsynced) before
+    their index entries are committed, and the loose files are removed only
+    after that, so every file is readable from somewhere at every moment.
+    Bytes past a pack's committed size are left by an interrupted run and
+    are cut off before the next append. A pack is sealed once it reaches
+    DOCUMENT_PACK_SIZE.
+    """
+
+    def __init__(self, older_than_days=None, pack_size=None, batch_size=500, dry_run=False, stdout=None):
+        self.older_than_days = settings.DOCUMENT_COLD_AFTER_DAYS if older_than_days is None else older_than_days
+        self.pack_size = pack_size or settings.DOCUMENT_PACK_SIZE
+        self.root = settings.DOCUMENT_PACK_PATH
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stdout = stdout
+
+    def report(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def cold_paths(self):
+        cutoff = timezone.now() - timedelta(days=self.older_than_days)
+        last = ''
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(COLD_PATHS_SQL, [last, cutoff, self.batch_size])
+                paths = [row[0] for row in cursor.fetchall()]
+            if not paths:
+                return
+            yield paths
+            last = paths[-1]
+
+    def open_pack(self):
+        """
+        The unsealed pack to append to, creating one when there is none
+        """
+        pack = DocumentPack.objects.filter(sealed=False).order_by('id').first()
+        if pack is None:
+            os.makedirs(self.root, exist_ok=True)
+            with transaction.atomic():
+                pack = DocumentPack.objects.create(path='', size=len(PACK_MAGIC))
+                pack.path = os.path.join(self.root, f"pack-{pack.id:06d}.dpk")
+                pack.save(update_fields=['path'])
+            with open(pack.path, 'wb') as f:
+                f.write(PACK_MAGIC)
+        return pack
+
+    def append(self, pack_file, path):
+        """
+        Append one loose file to the pack
+
+        Returns:
+            tuple | None: (offset of the data, length, sha256), or None if the file is gone
+        """
+        try:
+            source = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with source:
+            length = os.fstat(source.fileno()).st_size
+            encoded = path.encode()
+            pack_file.write(ENTRY_HEADER.pack(ENTRY_MAGIC, len(encoded), length) + encoded)
+            offset = pack_file.tell()
+            digest = hashlib.sha256()
+            copied = 0
+            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                pack_file.write(chunk)
+                copied += len(chunk)
+            if copied != length:
+                raise StorageError(f"{path} changed size while it was being packed")
+            pack_file.write(digest.digest())
+        return offset, length, digest.hexdigest()
+
+    def pack_batch(self, paths, stats):
+        pack = self.open_pack()
+        appended = []
+        with open(pack.path, 'r+b') as pack_file:
+            # Cut off whatever an interrupted run appended without committing
+            pack_file.truncate(pack.size)
+            pack_file.seek(pack.size)
+            for path in paths:
+                result = self.append(pack_file, path)
+                if result is None:
+                    stats['missing'] += 1
+                    continue
+                appended.append((path,) + result)
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+            end = pack_file.tell()
+
+        with transaction.atomic():
+            # Only files some row still points at are indexed; the rest were deleted meanwhile
+            with connection.cursor() as cursor:
+                cursor.execute(LIVE_CONTROL_PATHS_SQL, [[path for path, *_ in appended]])
+                live = {row[0] for row in cursor.fetchall()}
+            PackedFile.objects.bulk_create([
+                PackedFile(path=path, pack=pack, offset=offset, length=length, sha256=sha256)
+                for path, offset, length, sha256 in appended if path in live
+            ], ignore_conflicts=True)
+            pack.size = end
+            pack.entry_count += len(live)
+            pack.sealed = end >= self.pack_size
+            pack.save(update_fields=['size', 'entry_count', 'sealed'])
+
+        for path, _, length, _ in appended:
+            if path not in live:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            stats['packed'] += 1
+            stats['packed_bytes'] += length
+        if pack.sealed:
+            self.report(f"sealed {pack.path} ({pack.entry_count} files, {pack.size / 1024 / 1024:.1f} MB)")
+
+    def run_once(self):
+        """
+        Pack every cold file
+
+        Returns:
+            dict: packed/missing counts, bytes and timings
+        """
+        started = time.monotonic()
+        stats = {'packed': 0, 'packed_bytes': 0, 'missing': 0}
+        for paths in self.cold_paths():
+            if self.dry_run:
+                for path in paths:
+                    self.report(f"would pack: {path}")
+                stats['packed'] += len(paths)
+                continue
+            self.pack_batch(paths, stats)
+        stats['elapsed'] = time.monotonic() - started
+        return stats
+
+    def run(self):
+        """
+        run_once() unless another packing run holds the lock
+
+        Returns:
+            dict | None: Stats, or None if another run is in progress
+        """
+        with advisory_lock() as locked:
+            if not locked:
+                return None
+            return self.run_once()
+
+
+_cold_tier = None
+_cold_tier_lock = threading.Lock()
+
+
+def get_cold_tier():
+    """
+    Process-wide ColdTier
+    """
+    global _cold_tier
+    if _cold_tier is None:
+        with _cold_tier_lock:
+            if _cold_tier is None:
+                _cold_tier = ColdTier()
+    return _cold_tier
@@ -0,0 +1,226 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.conf import settings
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from .storage import fetch_to_temp, get_document_storage
+
+logger = logging.getLogger(__name__)
+
+PDF_CONTENT_TYPE = 'application/pdf'
+
+
+def preview_path(sha256, size=None):
+    """
+    Cache location of a preview: <DOCUMENT_PREVIEW_PATH>/<sha256[:2]>/<sha256>-<size>.webp
+    """
+    size = size or settings.DOCUMENT_PREVIEW_SIZE
+    return os.path.join(settings.DOCUMENT_PREVIEW_PATH, sha256[:2], f"{sha256}-{size}.webp")
+
+
+def _open_pdf_first_page(source_path, size, workdir):
+    """
+    First page of a PDF as a Pillow image, rendered with poppler's pdftoppm
+
+    Falls back to a plain PDF badge when poppler is not installed or the
+    file cannot be rendered.
+    """
+    from PIL import Image, ImageDraw
+
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm:
+        prefix = os.path.join(workdir, 'page')
+        try:
+            subprocess.run(
+                [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(size), source_path, prefix],
+                check=True, capture_output=True, timeout=60
+            )
+            return Image.open(prefix + '.png')
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning("pdftoppm could not render %s: %s", source_path, e)
+
+    badge = Image.new('RGB', (size * 3 // 4, size), 'white')
+    draw = ImageDraw.Draw(badge)
+    draw.rectangle([0, 0, badge.width - 1, badge.height - 1], outline=(200, 200, 200), width=2)
+    draw.rectangle([0, badge.height // 2 - 24, badge.width, badge.height // 2 + 24], fill=(200, 40, 40))
+    draw.text((badge.width // 2, badge.height // 2), 'PDF', fill='white', anchor='mm')
+    return badge
+
+
+def render_preview(source_path, content_type, dest_path, size, quality):
+    """
+    Render a WebP preview of a stored document to dest_path
+
+    Runs inside the preview worker processes, so it only takes plain
+    arguments and does not touch Django settings or the database.
+
+    Returns:
+        str: dest_path
+    """
+    from PIL import Image, ImageOps
+
+    with tempfile.TemporaryDirectory(prefix='preview-') as workdir:
+        if content_type == PDF_CONTENT_TYPE:
+            image = _open_pdf_first_page(source_path, size, workdir)
+        else:
+            image = Image.open(source_path)
+            image.draft('RGB', (size, size))  # Let JPEG decode at reduced scale
+            image = ImageOps.exif_transpose(image)
+
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, 'WEBP', quality=quality, method=4)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return dest_path
+
+
+def copy_outcome(source, target):
+    """
+    Resolve target with the result, exception or cancellation of source
+    """
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class PreviewGenerator:
+    """
+    Thumbnail/first-page previews rendered in a process pool
+
+    Previews are cached on disk by content hash, so every document sharing
+    the same content shares one preview. Uploads schedule their preview in
+    the background; a request for a preview that is not cached yet waits for
+    the pending render or starts one. Concurrent requests for the same
+    content share a single render. With DOCUMENT_PREVIEW_WORKERS = 0 previews
+    are rendered in the calling thread. Sources kept in a remote storage
+    backend are fetched to a temp file for the render, outside the lock so
+    a slow fetch holds up only requests for the same content; previews
+    themselves are always cached locally.
+    """
+
+    def __init__(self, workers=None, size=None, quality=None, timeout=None):
+        self.workers = settings.DOCUMENT_PREVIEW_WORKERS if workers is None else workers
+        self.size = size or settings.DOCUMENT_PREVIEW_SIZE
+        self.quality = quality or settings.DOCUMENT_PREVIEW_QUALITY
+        self.timeout = timeout or settings.DOCUMENT_PREVIEW_TIMEOUT
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pool = None
+        self._pid = os.getpid()
+
+    def _get_pool(self):
+        if self._pid != os.getpid():
+            # Forked child: the parent's pool and pending renders do not carry over
+            self._pid = os.getpid()
+            self._pending = {}
+            self._pool = None
+        if self._pool is None:
+            # spawn: forking a threaded server process with open DB connections is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def schedule(self, sha256, source_path, content_type):
+        """
+        Start rendering a preview unless it is cached or already pending
+
+        Args:
+            source_path: Stored path of the document, as the database holds it
+
+        Returns:
+            Future | None: The pending render, or None if already cached
+        """
+        dest_path = preview_path(sha256, self.size)
+        if os.path.isfile(dest_path):
+            return None
+
+        with self._lock:
+            future = self._pending.get(dest_path)
+            if future is not None:
+                return future
+            # Claimed before fetching, so concurrent requests wait on this render
+            future = self._pending[dest_path] = Future()
+
+        fetched = None
+        try:
+            local_path = get_document_storage().local_path(source_path)
+            if local_path is None:
+                local_path = fetched = fetch_to_temp(get_document_storage(), source_path)
+            if self.workers:
+                with self._lock:
+                    pool = self._get_pool()
+                pool.submit(
+                    render_preview, local_path, content_type, dest_path, self.size, self.quality
+                ).add_done_callback(lambda rendered: copy_outcome(rendered, future))
+            else:
+                future.set_result(render_preview(local_path, content_type, dest_path, self.size, self.quality))
+        except Exception as e:
+            future.set_exception(e)
+
+        future.add_done_callback(lambda done: self._finished(dest_path, done, fetched))
+        return future
+
+    def _finished(self, dest_path, future, fetched=None):
+        with self._lock:
+            self._pending.pop(dest_path, None)
+        if fetched is not None:
+            try:
+                os.remove(fetched)
+            except OSError:
+                pass
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Preview render for %s failed: %s", dest_path, future.exception())
+
+    def get_or_render(self, sha256, source_path, content_type):
+        """
+        Path of the cached preview, rendering it first on a cache miss
+
+        Raises:
+            Exception: Whatever the render raised, or TimeoutError
+        """
+        dest_path = preview_path(sha256, self.size)
+        future = self.schedule(sha256, source_path, content_type)
+        if future is not None:
+            future.result(timeout=self.timeout)
+        return dest_path
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_preview_generator = None
+_preview_generator_lock = threading.Lock()
+
+
+def get_preview_generator():
+    """
+    Process-wide PreviewGenerator configured from settings
+    """
+    global _preview_generator
+    if _preview_generator is None:
+        with _preview_generator_lock:
+            if _preview_generator is None:
+                _preview_generator = PreviewGenerator()
+    return _preview_generator
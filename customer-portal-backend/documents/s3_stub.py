@@ -0,0 +1,193 @@
+import hashlib
+import hmac
+import re
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from .storage import sigv4_signature
+
+AUTHORIZATION_RE = re.compile(
+    r'AWS4-HMAC-SHA256 Credential=(?P<access_key>[^/]+)/(?P<scope>[^,]+), '
+    r'SignedHeaders=(?P<signed_headers>[^,]+), Signature=(?P<signature>[0-9a-f]+)'
+)
+
+RANGE_RE = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+
+class StubS3Server:
+    """
+    Local stand-in for an S3-compatible object store, for tests and development
+
+    Speaks the subset of the S3 REST API that S3DocumentStorage uses
+    (path-style PUT/GET/HEAD/DELETE object, ranged GET, If-None-Match: *,
+    multipart upload) on 127.0.0.1 and keeps objects in memory. Header and
+    presigned-query SigV4 signatures are verified against the configured
+    credentials. Counters let tests check request volume, multipart use and
+    how many connections clients opened.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, access_key_id='stub', secret_access_key='stub-secret', region='us-east-1'):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+
+        self.objects = {}
+        self.uploads = {}
+        self.requests = 0
+        self.connections = 0
+        self.multipart_completed = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def handle_method(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                status, headers, payload = stub.handle(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if 'Content-Length' not in headers:
+                    self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(payload)
+
+            do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = handle_method
+
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # Clients drop connections mid-download when they seek; that is not an error
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self.server = Server((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ----- SIGNATURES -----
+    def authorized(self, method, path, params, headers):
+        if 'X-Amz-Signature' in params:
+            signed = {'host': headers.get('Host')}
+            signature = params.pop('X-Amz-Signature')
+            amz_date = params.get('X-Amz-Date', '')
+            payload_hash = 'UNSIGNED-PAYLOAD'
+            access_key = params.get('X-Amz-Credential', '').split('/')[0]
+        else:
+            match = AUTHORIZATION_RE.match(headers.get('Authorization', ''))
+            if not match:
+                return False
+            signed = {name: headers.get(name) for name in match['signed_headers'].split(';')}
+            signature = match['signature']
+            amz_date = headers.get('x-amz-date', '')
+            payload_hash = headers.get('x-amz-content-sha256', '')
+            access_key = match['access_key']
+
+        expected, _, _ = sigv4_signature(
+            self.secret_access_key, self.region, amz_date, method, path, params, signed, payload_hash
+        )
+        return access_key == self.access_key_id and hmac.compare_digest(expected, signature)
+
+    # ----- REQUESTS -----
+    def handle(self, method, target, headers, body):
+        parts = urlsplit(target)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        with self._lock:
+            self.requests += 1
+
+        if not self.authorized(method, parts.path, dict(params), headers):
+            return 403, {}, b'<Error><Code>SignatureDoesNotMatch</Code></Error>'
+
+        bucket, _, key = unquote(parts.path).lstrip('/').partition('/')
+        name = (bucket, key)
+        with self._lock:
+            if method == 'POST' and 'uploads' in params:
+                upload_id = uuid.uuid4().hex
+                self.uploads[upload_id] = {'parts': {}, 'content_type': headers.get('Content-Type', '')}
+                return 200, {}, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>".encode()
+
+            if method == 'PUT' and 'uploadId' in params:
+                upload = self.uploads.get(params['uploadId'])
+                if upload is None:
+                    return 404, {}, b'<Error><Code>NoSuchUpload</Code></Error>'
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                upload['parts'][int(params['partNumber'])] = (etag, body)
+                return 200, {'ETag': etag}, b''
+
+            if method == 'POST' and 'uploadId' in params:
+                upload = self.uploads.pop(params['uploadId'], None)
+                if upload is None:
+                    return 404, {}, b'<Error><Code>NoSuchUpload</Code></Error>'
+                if headers.get('If-None-Match') == '*' and name in self.objects:
+                    return 412, {}, b'<Error><Code>PreconditionFailed</Code></Error>'
+                data = b''.join(part for _, part in (upload['parts'][n] for n in sorted(upload['parts'])))
+                self.objects[name] = (data, upload['content_type'])
+                self.multipart_completed += 1
+                return 200, {}, b'<CompleteMultipartUploadResult></CompleteMultipartUploadResult>'
+
+            if method == 'DELETE' and 'uploadId' in params:
+                self.uploads.pop(params['uploadId'], None)
+                return 204, {}, b''
+
+            if method == 'PUT':
+                if headers.get('If-None-Match') == '*' and name in self.objects:
+                    return 412, {}, b'<Error><Code>PreconditionFailed</Code></Error>'
+                self.objects[name] = (body, headers.get('Content-Type', ''))
+                return 200, {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}, b''
+
+            if method == 'DELETE':
+                self.objects.pop(name, None)
+                return 204, {}, b''
+
+            stored = self.objects.get(name)
+
+        if stored is None:
+            return 404, {}, b'<Error><Code>NoSuchKey</Code></Error>'
+        data, content_type = stored
+        response_headers = {'Content-Type': params.get('response-content-type') or content_type or 'binary/octet-stream'}
+        if 'response-content-disposition' in params:
+            response_headers['Content-Disposition'] = params['response-content-disposition']
+        if method == 'HEAD':
+            response_headers['Content-Length'] = str(len(data))
+            return 200, response_headers, b''
+
+        match = RANGE_RE.match(headers.get('Range', ''))
+        if match:
+            start = int(match[1])
+            end = min(int(match[2]) if match[2] else len(data) - 1, len(data) - 1)
+            if start >= len(data):
+                return 416, {}, b''
+            response_headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            return 206, response_headers, data[start:end + 1]
+        return 200, response_headers, data
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='s3-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
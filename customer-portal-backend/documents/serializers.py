@@ -4,15 +4,26 @@ from .models import CustomerDocument, DocumentControl
 class DocumentControlSerializer(serializers.ModelSerializer):
     """Serializer for DocumentControl model"""
     type_display = serializers.CharField(source='get_type_display', read_only=True)
+    reference_key = serializers.ReadOnlyField()
+    preview_url = serializers.SerializerMethodField()
     
     class Meta:
         model = DocumentControl
-        fields = ['id', 'name', 'type', 'type_display', 'referenceId', 'filePath', 'created']
+        fields = ['id', 'name', 'type', 'type_display', 'referenceId', 'reference_kind', 'reference_key', 'filePath', 'preview_url', 'created']
         read_only_fields = ['id', 'created']
 
+    def get_preview_url(self, obj):
+        """
+        Return thumbnail URL for the document (absolute when a request is in context)
+        """
+        url = f'/api/documents/control/{obj.id}/preview/'
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
 class CustomerDocumentSerializer(serializers.ModelSerializer):
     document_type_display = serializers.CharField(source='get_document_type_display', read_only=True)
     file_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
     file_exists = serializers.SerializerMethodField()
     file_size_readable = serializers.SerializerMethodField()
 
@@ -21,7 +32,7 @@ class CustomerDocumentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'customer_email', 'document_type', 'document_type_display',
             'file_path', 'original_filename', 'file_size', 'file_size_readable',
-            'file_extension', 'file_url', 'file_exists', 'vehicle', 'driver', 'helper',
+            'file_extension', 'file_url', 'preview_url', 'file_exists', 'vehicle', 'driver', 'helper',
             'uploaded_at', 'updated_at', 'is_active'
         ]
         read_only_fields = ['id', 'uploaded_at', 'updated_at']
@@ -35,11 +46,20 @@ class CustomerDocumentSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(f'/api/documents/{obj.id}/download/')
         return None
 
+    def get_preview_url(self, obj):
+        """
+        Return thumbnail URL for the document
+        """
+        request = self.context.get('request')
+        if request and obj.is_active:
+            return request.build_absolute_uri(f'/api/documents/{obj.id}/preview/')
+        return None
+
     def get_file_exists(self, obj):
         """
-        Check if file exists on storage
+        Check if file exists on storage (from the StoredFile index)
         """
-        return obj.file_exists()
+        return obj.indexed_file_exists()
 
     def get_file_size_readable(self, obj):
         """
@@ -1,3 +1,839 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from authentication.models import CustomerUser
+from drivers.models import DriverHelper
+from submissions.audit import get_audit_writer
+from .blobstore import blob_path, store_uploaded_file, store_uploaded_files
+from .models import CustomerDocument, DocumentBlob, DocumentControl, DocumentPack, PackedFile, StoredFile
+from .garbage import DocumentGarbageCollector
+from .normalize import ImageNormalizer
+from .packs import get_cold_tier
+from .previews import PreviewGenerator, preview_path
+from .s3_stub import StubS3Server
+from . import storage as documents_storage
+from .storage import get_document_storage
+
+PDF = b'%PDF-1.4\n' + b'0' * 4096
+
+
+class StreamingUploadTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_BLOB_PATH=self.storage,
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'incoming'),
+            DOCUMENT_MAX_UPLOAD_SIZE=64 * 1024
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        )
+
+    def upload(self, content, name='document.pdf', content_type='application/pdf'):
+        return self.client.post('/api/documents/upload-to-control/', {
+            'document_type': 'vehicleRegistration',
+            'vehicle_number': 'MH12AB1234',
+            'file': SimpleUploadedFile(name, content, content_type=content_type)
+        }, format='multipart')
+
+    def incoming(self):
+        return os.listdir(os.path.join(self.storage, 'incoming'))
+
+    def test_content_type_comes_from_magic_bytes(self):
+        response = self.upload(PDF, name='scan.png', content_type='image/png')
+
+        self.assertEqual(response.status_code, 201)
+        blob = DocumentBlob.objects.get()
+        self.assertEqual(blob.content_type, 'application/pdf')
+        self.assertEqual(blob.size, len(PDF))
+        with open(blob.path, 'rb') as f:
+            self.assertEqual(f.read(), PDF)
+        self.assertEqual(self.incoming(), [])
+
+    def test_duplicate_upload_discards_spooled_copy(self):
+        self.upload(PDF)
+        self.upload(PDF, name='again.pdf')
+
+        self.assertEqual(DocumentBlob.objects.get().refcount, 2)
+        self.assertEqual(self.incoming(), [])
+
+    def test_spooled_copy_is_discarded_whatever_the_temp_path_spelling(self):
+        with override_settings(DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'incoming') + os.sep):
+            self.upload(PDF)
+            self.upload(PDF, name='again.pdf')
+
+        self.assertEqual(self.incoming(), [])
+        self.assertTrue(os.path.exists(DocumentBlob.objects.get().path))
+
+    def test_disallowed_and_oversize_uploads_are_rejected(self):
+        disguised = self.upload(b'MZ' + b'0' * 4096, name='setup.pdf')
+        oversize = self.upload(b'\xff\xd8\xff' + b'0' * (64 * 1024), name='photo.jpg', content_type='image/jpeg')
+
+        self.assertEqual(disguised.status_code, 400)
+        self.assertEqual(disguised.data['error'], 'Only PDF, JPG, JPEG, and PNG files are allowed')
+        self.assertEqual(oversize.status_code, 400)
+        self.assertEqual(oversize.data['error'], 'File size must be 64KB or smaller')
+        self.assertFalse(DocumentControl.objects.exists())
+        self.assertEqual(self.incoming(), [])
+
+
+class DocumentDownloadTests(TestCase):
+    def setUp(self):
+        storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage, ignore_errors=True)
+        settings_override = override_settings(DOCUMENT_STORAGE_PATH=storage)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.content = bytes(range(256)) * 40
+        path = os.path.join(storage, 'documents', 'po.pdf')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(self.content)
+        self.document = CustomerDocument.objects.create(
+            customer_email='customer@example.com',
+            document_type='po',
+            file_path=path,
+            original_filename='po.pdf',
+            file_size=len(self.content),
+            file_extension='.pdf'
+        )
+        self.url = f'/api/documents/{self.document.pk}/download/'
+
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        )
+
+    def test_full_download_sets_checksum_etag(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.document.refresh_from_db()
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(self.document.sha256, hashlib.sha256(self.content).hexdigest())
+
+        revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+
+    def test_byte_ranges(self):
+        etag = self.client.get(self.url)['ETag']
+
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(partial.streaming_content), self.content[100:200])
+
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-10', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-10:])
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_offloaded_download(self):
+        with override_settings(DOCUMENT_DOWNLOAD_OFFLOAD='x-accel-redirect'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-documents/documents/po.pdf')
+        self.assertEqual(response.content, b'')
+
+
+class DocumentPreviewTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_BLOB_PATH=self.storage,
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'incoming'),
+            DOCUMENT_PREVIEW_PATH=os.path.join(self.storage, 'previews'),
+            DOCUMENT_PREVIEW_SIZE=64
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.staff = CustomerUser.objects.create_user(email='staff@example.com', password='x', username='staff', is_staff=True)
+
+    def upload(self, content, name):
+        return self.client.post('/api/documents/upload-to-control/', {
+            'document_type': 'vehicleRegistration',
+            'vehicle_number': 'MH12AB1234',
+            'file': SimpleUploadedFile(name, content)
+        }, format='multipart')
+
+    def test_preview_rendered_in_pool_and_cached_by_content(self):
+        image = io.BytesIO()
+        Image.new('RGB', (1200, 900), 'navy').save(image, 'PNG')
+
+        generator = PreviewGenerator(workers=1)
+        self.addCleanup(generator.close)
+        with mock.patch('documents.views.get_preview_generator', return_value=generator):
+            with self.captureOnCommitCallbacks(execute=True):
+                uploaded = self.upload(image.getvalue(), 'rc.png')
+            get_audit_writer().flush()
+            self.client.force_authenticate(self.staff)
+            response = self.client.get(uploaded.data['document']['preview_url'])
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/webp')
+            preview = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+            self.assertEqual((preview.format, preview.size), ('WEBP', (64, 48)))
+
+            revalidated = self.client.get(uploaded.data['document']['preview_url'], HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+
+    def test_pdf_preview_rendered_on_miss(self):
+        uploaded = self.upload(PDF, 'po.pdf')
+
+        self.client.force_authenticate(self.staff)
+        with mock.patch('documents.views.get_preview_generator', return_value=PreviewGenerator(workers=0)):
+            response = self.client.get(uploaded.data['document']['preview_url'])
+
+        self.assertEqual(response.status_code, 200)
+        blob = DocumentBlob.objects.get()
+        self.assertTrue(os.path.isfile(preview_path(blob.sha256)))
+
+    def test_customers_cannot_preview_uploads(self):
+        uploaded = self.upload(PDF, 'aadhar.pdf')
+        other = CustomerUser.objects.create_user(email='other@example.com', password='x', username='other')
+
+        for user in (self.customer, other):
+            self.client.force_authenticate(user)
+            self.assertEqual(self.client.get(uploaded.data['document']['preview_url']).status_code, 403)
+        self.assertFalse(os.path.exists(os.path.join(self.storage, 'previews')))
+
+
+class ImageNormalizationTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_BLOB_PATH=self.storage,
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'incoming'),
+            DOCUMENT_MAX_UPLOAD_SIZE=5 * 1024 * 1024,
+            DOCUMENT_IMAGE_KEEP_ORIGINAL=True
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.normalizer = ImageNormalizer(workers=1, max_queue=0, max_dimension=800, output_format='jpeg', quality=80)
+        self.addCleanup(self.normalizer.close)
+        patcher = mock.patch('documents.views.get_image_normalizer', return_value=self.normalizer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.client.force_authenticate(CustomerUser.objects.create_user(
+            email='staff@example.com', password='x', username='staff', is_staff=True
+        ))
+
+    def phone_photo(self):
+        image = Image.new('RGB', (3000, 2000))
+        image.putdata([((x * 7) % 256, (y * 3) % 256, (x * y) % 256) for y in range(2000) for x in range(3000)])
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = 'PhoneMaker'
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=95, exif=exif)
+        return output.getvalue()
+
+    def test_photo_is_downscaled_stripped_and_original_kept(self):
+        photo = self.phone_photo()
+        response = self.client.post('/api/documents/upload-to-control/', {
+            'document_type': 'driverAadhar',
+            'file': SimpleUploadedFile('aadhar.jpeg', photo)
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        document = DocumentControl.objects.select_related('blob', 'original_blob').get()
+        self.assertEqual(document.name, 'aadhar.jpg')
+        self.assertEqual(document.original_size, len(photo))
+        self.assertLess(document.blob.size, len(photo))
+        with Image.open(document.blob.path) as stored:
+            self.assertEqual(stored.size, (533, 800))  # Rotated upright, then downscaled
+            self.assertEqual(len(stored.getexif()), 0)
+        self.assertEqual(document.original_blob.size, len(photo))
+        self.assertEqual(os.listdir(os.path.join(self.storage, 'incoming')), [])
+
+        stats = self.client.get('/api/documents/normalization-stats/')
+        self.assertEqual(stats.data['types'][0]['type'], 'driver_aadhar')
+        self.assertEqual(stats.data['bytes_saved'], len(photo) - document.blob.size)
+
+    def test_normalized_copy_is_released_when_original_fails_to_store(self):
+        stored = []
+
+        def store_then_fail(uploaded_file):
+            if stored:
+                raise OSError('disk full')
+            stored.append(store_uploaded_file(uploaded_file))
+            return stored[0]
+
+        with mock.patch('documents.views.store_uploaded_file', side_effect=store_then_fail):
+            response = self.client.post('/api/documents/upload-to-control/', {
+                'document_type': 'driverAadhar',
+                'file': SimpleUploadedFile('aadhar.jpeg', self.phone_photo())
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(DocumentBlob.objects.exists())
+        self.assertFalse(os.path.exists(stored[0][0].path))
+
+    def test_pdf_is_stored_as_uploaded(self):
+        response = self.client.post('/api/documents/upload-to-control/', {
+            'document_type': 'po',
+            'file': SimpleUploadedFile('po.pdf', PDF)
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        document = DocumentControl.objects.get()
+        self.assertIsNone(document.original_size)
+        self.assertIsNone(document.original_blob_id)
+
+
+class BatchUploadTests(TestCase):
+    def setUp(self):
+        storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_BLOB_PATH=storage,
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(storage, 'incoming')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        DriverHelper.objects.create(uid='123456789012', name='Ravi', type='Driver', phoneNo='+919876543210')
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        )
+
+    def test_batch_resolves_references_once_and_reports_each_file(self):
+        files = [
+            SimpleUploadedFile('rc.pdf', PDF),
+            SimpleUploadedFile('insurance.pdf', PDF + b'1'),
+            SimpleUploadedFile('puc.pdf', PDF + b'2'),
+            SimpleUploadedFile('aadhar.pdf', PDF),
+            SimpleUploadedFile('notes.txt', b'not a document'),
+        ]
+        types = ['vehicleRegistration', 'vehicleInsurance', 'vehiclePuc', 'driverAadhar', 'po']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/documents/upload-batch/', {
+                'files': files,
+                'document_types': types,
+                'vehicle_number': 'MH12AB1234',
+                'driver_phone': '+919876543210'
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['rejected']), (4, 1))
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'created', 'created', 'created', 'rejected']
+        )
+        self.assertEqual(response.data['results'][4]['error'], 'Only PDF, JPG, JPEG, and PNG files are allowed')
+
+        # One vehicle upsert, one driver lookup, one blob upsert, one path lock, a
+        # packed copy lookup per new file, one storage index upsert, one insert
+        self.assertEqual(len([q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]), 9)
+        self.assertEqual(DocumentControl.objects.count(), 4)
+        self.assertEqual(
+            sorted(DocumentBlob.objects.values_list('refcount', flat=True)), [1, 1, 2]
+        )
+
+    def test_types_must_match_files(self):
+        response = self.client.post('/api/documents/upload-batch/', {
+            'files': [SimpleUploadedFile('rc.pdf', PDF)],
+            'document_types': []
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_storage_index_rolls_back_with_the_batch(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            store_uploaded_files([SimpleUploadedFile('rc.pdf', PDF), SimpleUploadedFile('puc.pdf', PDF + b'1')])
+            self.assertEqual(StoredFile.objects.count(), 2)
+            raise RuntimeError('documents failed to save')
+
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(DocumentBlob.objects.exists())
+
+    def test_po_documents_keep_string_reference_and_load_in_one_query(self):
+        response = self.client.post('/api/documents/upload-batch/', {
+            'files': [SimpleUploadedFile('po.pdf', PDF), SimpleUploadedFile('rc.pdf', PDF + b'1')],
+            'document_types': ['po', 'vehicleRegistration'],
+            'po_number': 'po-77',
+            'vehicle_number': 'MH12AB1234'
+        }, format='multipart')
+        get_audit_writer().flush()
+
+        self.assertEqual(response.status_code, 201)
+        po_document = response.data['results'][0]['document']
+        self.assertEqual((po_document['reference_kind'], po_document['reference_key']), ('po', 'PO-77'))
+        self.assertIsNone(po_document['referenceId'])
+        vehicle_id = response.data['results'][1]['document']['referenceId']
+
+        driver_id = DriverHelper.objects.get().id
+        with self.assertNumQueries(1):
+            documents = DocumentControl.for_references([('vehicle', vehicle_id), ('po', 'PO-77'), ('driver', driver_id)])
+
+        self.assertEqual(
+            {reference: [d.name for d in docs] for reference, docs in documents.items()},
+            {('vehicle', vehicle_id): ['rc.pdf'], ('po', 'PO-77'): ['po.pdf'], ('driver', driver_id): []}
+        )
+
+    def test_vehicle_documents_export_as_streamed_zip(self):
+        response = self.client.post('/api/documents/upload-batch/', {
+            'files': [SimpleUploadedFile('rc.pdf', PDF), SimpleUploadedFile('rc.pdf', PDF + b'1'), SimpleUploadedFile('puc.pdf', PDF + b'2')],
+            'document_types': ['vehicleRegistration', 'vehicleRegistration', 'vehiclePuc'],
+            'vehicle_number': 'MH12AB1234'
+        }, format='multipart')
+        get_audit_writer().flush()
+        vehicle_id = response.data['results'][0]['document']['referenceId']
+        os.remove(DocumentControl.objects.get(name='puc.pdf').filePath)
+
+        # Exports include identity documents: employees only
+        self.assertEqual(self.client.get(f'/api/documents/control/export/vehicle/{vehicle_id}/').status_code, 403)
+        self.client.force_authenticate(
+            CustomerUser.objects.create_user(email='staff@example.com', password='x', username='staff', is_staff=True)
+        )
+
+        export = self.client.get(f'/api/documents/control/export/vehicle/{vehicle_id}/')
+        get_audit_writer().flush()
+
+        self.assertEqual(export.status_code, 200)
+        self.assertTrue(export.streaming)
+        with zipfile.ZipFile(io.BytesIO(b''.join(export.streaming_content))) as archive:
+            self.assertEqual(
+                sorted(archive.namelist()),
+                ['MISSING.txt', 'vehicle_registration/rc (2).pdf', 'vehicle_registration/rc.pdf']
+            )
+            self.assertEqual({archive.read('vehicle_registration/rc.pdf'), archive.read('vehicle_registration/rc (2).pdf')}, {PDF, PDF + b'1'})
+            self.assertEqual(archive.getinfo('vehicle_registration/rc.pdf').compress_type, zipfile.ZIP_STORED)
+            self.assertIn(b'vehicle_puc/puc.pdf', archive.read('MISSING.txt'))
+
+        self.assertEqual(self.client.get('/api/documents/control/export/truck/1/').status_code, 400)
+        self.assertEqual(self.client.get('/api/documents/control/export/driver/999/').status_code, 404)
+
+
+class StorageIndexTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_STORAGE_PATH=self.storage,
+            DOCUMENT_FILE_PATH=os.path.join(self.storage, 'files')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.documents = [
+            CustomerDocument.replace_document(
+                'customer@example.com', document_type, SimpleUploadedFile(f'{document_type}.pdf', PDF)
+            )
+            for document_type in ('po', 'do', 'vehicle_puc')
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        )
+
+    def test_list_reads_presence_from_index(self):
+        with mock.patch('os.path.isfile', side_effect=AssertionError('stat on list')), \
+                mock.patch('os.stat', side_effect=AssertionError('stat on list')):
+            response = self.client.get('/api/documents/list/', {'customer_email': 'customer@example.com'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([document['file_exists'] for document in response.data['documents']], [True, True, True])
+
+    def test_reconcile_catches_files_removed_behind_the_app(self):
+        os.remove(self.documents[0].file_path)
+        self.assertTrue(self.documents[0].indexed_file_exists())
+
+        found, missing = StoredFile.reconcile(self.storage)
+
+        self.assertEqual((found, missing), (2, 1))
+        response = self.client.get(f'/api/documents/{self.documents[0].pk}/download/')
+        self.assertEqual(response.status_code, 404)
+
+
+class StorageLayoutTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_STORAGE_PATH=self.storage,
+            DOCUMENT_BLOB_PATH=os.path.join(self.storage, 'blobs'),
+            DOCUMENT_FILE_PATH=os.path.join(self.storage, 'files')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, *parts):
+        path = os.path.join(self.storage, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(PDF)
+        return path
+
+    def test_same_second_uploads_get_separate_fanned_out_files(self):
+        first, second = [
+            CustomerDocument.save_file_to_storage(SimpleUploadedFile('po.pdf', PDF + bytes([i])), 'customer@example.com', 'po')
+            for i in range(2)
+        ]
+
+        self.assertNotEqual(first['file_path'], second['file_path'])
+        for info in (first, second):
+            relative = os.path.relpath(info['file_path'], os.path.join(self.storage, 'files'))
+            self.assertEqual(len(relative.split(os.sep)), 3)
+            with open(info['file_path'], 'rb') as f:
+                self.assertEqual(hashlib.sha256(f.read()).hexdigest(), info['sha256'])
+
+    def test_relocation_moves_files_and_rewrites_paths(self):
+        sha256 = hashlib.sha256(PDF).hexdigest()
+        blob = DocumentBlob.objects.create(sha256=sha256, size=len(PDF), path=self.write('blobs', sha256[:2], sha256), refcount=1)
+        shared = DocumentControl.objects.create(name='po.pdf', type='po', filePath=blob.path, blob=blob)
+        legacy = DocumentControl.objects.create(name='rc.pdf', type='vehicle_registration', filePath=self.write('vehicle_registration', 'vehicle_registration_20240101_120000.pdf'))
+        flat = CustomerDocument.objects.create(
+            customer_email='customer@example.com', document_type='do', file_path=self.write('documents', 'customer', 'do', 'do_20240101_120000.pdf'),
+            original_filename='do.pdf', file_size=len(PDF), file_extension='.pdf'
+        )
+        gone = CustomerDocument.objects.create(
+            customer_email='customer@example.com', document_type='po', file_path=os.path.join(self.storage, 'missing.pdf'),
+            original_filename='po.pdf', file_size=len(PDF), file_extension='.pdf'
+        )
+        old_paths = [blob.path, legacy.filePath, flat.file_path]
+
+        call_command('relocate_document_files', workers=2, batch_size=1, stdout=io.StringIO())
+
+        blob.refresh_from_db()
+        for obj in (shared, legacy, flat, gone):
+            obj.refresh_from_db()
+        self.assertEqual(blob.path, os.path.join(self.storage, 'blobs', sha256[:2], sha256[2:4], sha256))
+        self.assertEqual(shared.filePath, blob.path)
+        self.assertTrue(legacy.filePath.startswith(os.path.join(self.storage, 'files') + os.sep))
+        self.assertTrue(flat.file_path.startswith(os.path.join(self.storage, 'files') + os.sep))
+        self.assertEqual(gone.file_path, os.path.join(self.storage, 'missing.pdf'))
+        for path in (blob.path, legacy.filePath, flat.file_path):
+            self.assertTrue(StoredFile.is_present(path))
+        for path in old_paths:
+            self.assertFalse(os.path.exists(path))
+
+        # Running again only finds the row whose file is missing
+        output = io.StringIO()
+        call_command('relocate_document_files', dry_run=True, stdout=output)
+        self.assertEqual(output.getvalue().splitlines(), [
+            'blobs: 0 would move', 'DocumentControl files: 0 would move', 'CustomerDocument files: 1 would move'
+        ])
+
+
+class GarbageCollectionTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_STORAGE_PATH=self.storage,
+            DOCUMENT_BLOB_PATH=os.path.join(self.storage, 'blobs'),
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'blobs', 'incoming'),
+            DOCUMENT_FILE_PATH=os.path.join(self.storage, 'files')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, *parts, age_hours=48):
+        path = os.path.join(self.storage, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(PDF)
+        mtime = time.time() - age_hours * 3600
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_collects_unreferenced_and_superseded_files_only(self):
+        old = CustomerDocument.replace_document('customer@example.com', 'po', SimpleUploadedFile('po.pdf', PDF))
+        new = CustomerDocument.replace_document('customer@example.com', 'po', SimpleUploadedFile('po.pdf', PDF + b'1'))
+        for path in (old.file_path, new.file_path):
+            os.utime(path, (time.time() - 48 * 3600,) * 2)
+        sha256 = hashlib.sha256(PDF).hexdigest()
+        blob = DocumentBlob.objects.create(sha256=sha256, size=len(PDF), path=self.write('blobs', 'ab', 'cd', sha256), refcount=1)
+        DocumentControl.objects.create(name='po.pdf', type='po', filePath=blob.path, blob=blob)
+        DocumentControl.objects.create(name='do.pdf', type='do', filePath=os.path.join(self.storage, 'do', 'gone.pdf'))
+        leaked = self.write('blobs', 'ef', '01', 'ef01' + '0' * 60)
+        recent = self.write('files', 'aa', 'bb', 'po_recent.pdf', age_hours=1)
+        in_flight = self.write('blobs', 'incoming', 'tmp.upload')
+
+        output = io.StringIO()
+        call_command('collect_document_garbage', dry_run=True, stdout=output)
+        self.assertIn(f"would delete: {leaked}", output.getvalue())
+        self.assertIn(f"would delete: {old.file_path}", output.getvalue())
+        self.assertIn(f"missing file: {os.path.join(self.storage, 'do', 'gone.pdf')} (DocumentControl)", output.getvalue())
+        self.assertTrue(os.path.exists(leaked))
+
+        stats = DocumentGarbageCollector().run()
+
+        self.assertEqual(
+            {key: stats[key] for key in ('scanned', 'deleted', 'too_recent', 'missing')},
+            {'scanned': 5, 'deleted': 2, 'too_recent': 1, 'missing': 1}
+        )
+        self.assertFalse(os.path.exists(leaked))
+        self.assertFalse(os.path.exists(old.file_path))
+        for path in (blob.path, new.file_path, recent, in_flight):
+            self.assertTrue(os.path.exists(path))
+        self.assertFalse(StoredFile.is_present(old.file_path))
+
+    def test_relative_stored_paths_keep_their_files(self):
+        kept = self.write('files', 'aa', 'bb', 'po_kept.pdf')
+        DocumentControl.objects.create(name='po.pdf', type='po', filePath=os.path.relpath(kept))
+        DocumentControl.objects.create(name='do.pdf', type='do', filePath=os.path.relpath(os.path.join(self.storage, 'files', 'gone.pdf')))
+
+        stats = DocumentGarbageCollector().run()
+
+        self.assertEqual((stats['scanned'], stats['orphaned'], stats['missing']), (1, 0, 1))
+        self.assertTrue(os.path.exists(kept))
+
+
+class GarbageCollectionRaceTests(TransactionTestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_STORAGE_PATH=self.storage,
+            DOCUMENT_BLOB_PATH=os.path.join(self.storage, 'blobs'),
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'blobs', 'incoming'),
+            DOCUMENT_FILE_PATH=os.path.join(self.storage, 'files')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_orphan_reused_by_an_upload_in_flight_is_kept(self):
+        # A file left behind by a deleted blob, at the path the same content maps to
+        path = blob_path(hashlib.sha256(PDF).hexdigest())
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(PDF)
+        os.utime(path, (time.time() - 48 * 3600,) * 2)
+
+        stored, commit = threading.Event(), threading.Event()
+        results = {}
+
+        def upload():
+            try:
+                with transaction.atomic():
+                    store_uploaded_files([SimpleUploadedFile('po.pdf', PDF)])
+                    stored.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        def collect():
+            try:
+                results['stats'] = DocumentGarbageCollector().run()
+            finally:
+                connection.close()
+
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        self.assertTrue(stored.wait(10))
+        collector = threading.Thread(target=collect)
+        collector.start()
+        # The collector waits for the upload's path lock
+        collector.join(0.5)
+        self.assertTrue(collector.is_alive())
+        commit.set()
+        uploader.join(10)
+        collector.join(10)
+
+        self.assertEqual(results['stats']['deleted'], 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(DocumentBlob.objects.get().path, path)
+
+
+class S3StorageTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        self.stub = StubS3Server().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(
+            DOCUMENT_STORAGE_PATH=self.storage,
+            DOCUMENT_BLOB_PATH=os.path.join(self.storage, 'blobs'),
+            DOCUMENT_UPLOAD_TEMP_PATH=os.path.join(self.storage, 'incoming'),
+            DOCUMENT_FILE_PATH=os.path.join(self.storage, 'files'),
+            DOCUMENT_STORAGE_BACKEND='documents.storage.S3DocumentStorage',
+            DOCUMENT_S3_ENDPOINT_URL=self.stub.url,
+            DOCUMENT_S3_BUCKET='documents',
+            DOCUMENT_S3_ACCESS_KEY_ID='stub',
+            DOCUMENT_S3_SECRET_ACCESS_KEY='stub-secret',
+            DOCUMENT_S3_MAX_CONNECTIONS=2,
+            DOCUMENT_S3_MULTIPART_THRESHOLD=8 * 1024,
+            DOCUMENT_S3_PART_SIZE=4 * 1024
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        )
+
+    def test_documents_round_trip_through_the_bucket(self):
+        content = bytes(range(256)) * 100
+        document = CustomerDocument.replace_document('customer@example.com', 'po', SimpleUploadedFile('po.pdf', content))
+
+        key = os.path.relpath(document.file_path, os.path.join(self.storage, 'files'))
+        self.assertEqual(self.stub.objects[('documents', f'files/{key}')][0], content)
+        self.assertEqual(self.stub.multipart_completed, 1)
+        self.assertFalse(os.path.exists(document.file_path))
+
+        url = f'/api/documents/{document.pk}/download/'
+        partial = self.client.get(url, HTTP_RANGE='bytes=5000-5999')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), content[5000:6000])
+        full = self.client.get(url)
+        self.assertEqual(b''.join(full.streaming_content), content)
+
+        with override_settings(DOCUMENT_DOWNLOAD_OFFLOAD='redirect'):
+            redirect = self.client.get(url)
+        self.assertEqual(redirect.status_code, 302)
+        with urllib.request.urlopen(redirect['Location']) as response:
+            self.assertEqual(response.read(), content)
+            self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="po.pdf"')
+
+        document.delete(hard_delete=True)
+        self.assertNotIn(('documents', f'files/{key}'), self.stub.objects)
+
+    def test_concurrent_uploads_share_a_bounded_connection_pool(self):
+        storage = get_document_storage()
+        paths = [os.path.join(self.storage, 'files', f'{i}.pdf') for i in range(12)]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(pool.map(lambda path: storage.save(path, [PDF], 'application/pdf'), paths))
+
+        self.assertEqual(len(self.stub.objects), 12)
+        self.assertLessEqual(self.stub.connections, 2)
+        with self.assertRaises(FileExistsError):
+            storage.save(paths[0], [PDF], exclusive=True)
+
+    def test_slow_preview_fetch_does_not_hold_up_other_previews(self):
+        storage = get_document_storage()
+        image = io.BytesIO()
+        Image.new('RGB', (640, 480), 'navy').save(image, 'PNG')
+        slow, fast = (os.path.join(self.storage, 'files', name) for name in ('slow.png', 'fast.png'))
+        for path in (slow, fast):
+            storage.save(path, [image.getvalue()], 'image/png')
+
+        fetching, release = threading.Event(), threading.Event()
+        fetch_to_temp = documents_storage.fetch_to_temp
+
+        def gated_fetch(storage, path):
+            if path == slow:
+                fetching.set()
+                release.wait(10)
+            return fetch_to_temp(storage, path)
+
+        generator = PreviewGenerator(workers=0, size=64)
+        with override_settings(DOCUMENT_PREVIEW_PATH=os.path.join(self.storage, 'previews')), \
+                mock.patch('documents.previews.fetch_to_temp', side_effect=gated_fetch):
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                slow_render = pool.submit(generator.schedule, 'a' * 64, slow, 'image/png')
+                self.assertTrue(fetching.wait(10))
+
+                # Another document renders, and the same one joins the pending render
+                generator.schedule('b' * 64, fast, 'image/png').result(timeout=10)
+                self.assertTrue(os.path.isfile(preview_path('b' * 64, 64)))
+                pending = generator.schedule('a' * 64, slow, 'image/png')
+                self.assertFalse(pending.done())
+
+                release.set()
+                self.assertIs(slow_render.result(timeout=10), pending)
+                pending.result(timeout=10)
+            self.assertTrue(os.path.isfile(preview_path('a' * 64, 64)))
+        self.assertEqual(os.listdir(os.path.join(self.storage, 'incoming')), [])
+
+
+class ColdTierTests(TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage, ignore_errors=True)
+        settings_override = override_settings(
+            DOCUMENT_STORAGE_PATH=self.storage,
+            DOCUMENT_BLOB_PATH=os.path.join(self.storage, 'blobs'),
+            DOCUMENT_FILE_PATH=os.path.join(self.storage, 'files'),
+            DOCUMENT_PACK_PATH=os.path.join(self.storage, 'packs')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(get_cold_tier().close)
+
+    def document(self, content, days_old, path=None, **reference):
+        if path is None:
+            path = os.path.join(self.storage, 'blobs', hashlib.sha256(content).hexdigest())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+            StoredFile.record(path, len(content))
+        document = DocumentControl.objects.create(
+            name='receipt.pdf', type='after_weighing', filePath=path,
+            **DocumentControl.reference_fields('after_weighing', 'PO-1')
+        )
+        DocumentControl.objects.filter(pk=document.pk).update(created=document.created - timedelta(days=days_old))
+        return document
+
+    def test_cold_files_are_packed_read_in_place_and_restored(self):
+        cold = self.document(PDF, days_old=200)
+        shared = self.document(PDF + b'1', days_old=200)
+        self.document(PDF + b'1', days_old=1, path=shared.filePath)
+
+        call_command('pack_cold_documents', stdout=io.StringIO())
+
+        self.assertFalse(os.path.exists(cold.filePath))
+        self.assertTrue(os.path.exists(shared.filePath))
+        self.assertEqual(list(PackedFile.objects.values_list('path', flat=True)), [cold.filePath])
+        with get_document_storage().open(cold.filePath) as f:
+            f.seek(9)
+            self.assertEqual(f.read(), PDF[9:])
+        self.assertEqual(cold.content_sha256(), hashlib.sha256(PDF).hexdigest())
+        self.assertTrue(StoredFile.refresh(cold.filePath))
+
+        stats = DocumentGarbageCollector(grace_hours=0).run()
+        self.assertEqual((stats['missing'], stats['deleted']), (0, 0))
+
+        output = io.StringIO()
+        call_command('restore_packed_documents', '--reference', 'po', 'PO-1', stdout=output)
+
+        self.assertIn('1 files restored', output.getvalue())
+        with open(cold.filePath, 'rb') as f:
+            self.assertEqual(f.read(), PDF)
+        self.assertFalse(PackedFile.objects.exists())
+        self.assertFalse(DocumentPack.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.storage, 'packs')), [])
@@ -0,0 +1,192 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+import hashlib
+import os
+import tempfile
+
+# Leading bytes of every accepted document format
+MAGIC_NUMBERS = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+)
+MAGIC_LENGTH = max(len(magic) for magic, _ in MAGIC_NUMBERS)
+
+# Room for form fields and multipart headers on top of the file bytes
+MULTIPART_OVERHEAD = 64 * 1024
+
+DISALLOWED_TYPE_ERROR = "Only PDF, JPG, JPEG, and PNG files are allowed"
+
+
+def sniff_content_type(header):
+    """
+    Content type of a document from its first bytes, or None if not accepted
+    """
+    for magic, content_type in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return content_type
+    return None
+
+
+def size_error(max_size):
+    if max_size % (1024 * 1024):
+        return f"File size must be {max_size // 1024}KB or smaller"
+    return f"File size must be {max_size // (1024 * 1024)}MB or smaller"
+
+
+def upload_errors(request):
+    """
+    Files rejected by DocumentUploadHandler, as {field_name: message}
+    """
+    return getattr(request, 'document_upload_errors', {})
+
+
+def upload_outcomes(request, field_name):
+    """
+    Every file sent in a field, accepted or not, in request order
+    """
+    return [outcome for outcome in getattr(request, 'document_upload_outcomes', []) if outcome.field_name == field_name]
+
+
+class UploadOutcome:
+    """
+    One file seen by DocumentUploadHandler: the stored file or why it was rejected
+    """
+
+    def __init__(self, field_name, file_name):
+        self.field_name = field_name
+        self.file_name = file_name
+        self.file = None
+        self.error = None
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    Upload already written to DOCUMENT_UPLOAD_TEMP_PATH and hashed
+
+    move_to() renames it into place; an unmoved file is deleted on close.
+    """
+
+    def __init__(self, temp_path, name, content_type, size, charset, sha256, content_type_extra=None):
+        super().__init__(open(temp_path, 'rb'), name, content_type, size, charset, content_type_extra)
+        self.temp_path = temp_path
+        self.sha256 = sha256
+        # Whether temp_path is still the handler's spool file, ours to delete
+        self.spooled = True
+
+    def temporary_file_path(self):
+        return self.temp_path
+
+    def move_to(self, path):
+        """
+        Atomically rename the upload to path
+        """
+        self.file.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.temp_path, path)
+        self.temp_path = path
+        self.spooled = False
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            if self.spooled:
+                try:
+                    os.remove(self.temp_path)
+                except FileNotFoundError:
+                    pass
+
+
+class DocumentUploadHandler(FileUploadHandler):
+    """
+    Validate, hash and spool document uploads while they stream in
+
+    The first bytes decide the content type (PDF, PNG or JPEG), so a
+    disallowed file is dropped after one chunk and an oversize one as soon as
+    it crosses DOCUMENT_MAX_UPLOAD_SIZE. Accepted bytes are hashed and written
+    once, to a temp file on the same filesystem as the blob store, from where
+    the store renames them into place. Rejections are recorded on the request
+    (see upload_errors / upload_outcomes) and the file is left out of
+    request.FILES.
+    """
+
+    def __init__(self, request=None, max_size=None, max_files=1, field_name='file'):
+        super().__init__(request)
+        self.max_size = max_size or settings.DOCUMENT_MAX_UPLOAD_SIZE
+        self.max_files = max_files
+        self.request_field_name = field_name
+        self.request.document_upload_errors = {}
+        self.request.document_upload_outcomes = []
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Refuse bodies that cannot fit the limits before reading any of them
+        if content_length > self.max_size * self.max_files + MULTIPART_OVERHEAD:
+            self.request.document_upload_errors[self.request_field_name] = size_error(self.max_size * self.max_files)
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(settings.DOCUMENT_UPLOAD_TEMP_PATH, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=settings.DOCUMENT_UPLOAD_TEMP_PATH, suffix='.upload')
+        self.destination = os.fdopen(fd, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.header = b''
+        self.sniffed_type = None
+        self.outcome = UploadOutcome(self.field_name, self.file_name)
+        self.request.document_upload_outcomes.append(self.outcome)
+
+    def reject(self, message):
+        self.destination.close()
+        os.remove(self.temp_path)
+        self.request.document_upload_errors[self.field_name] = message
+        self.outcome.error = message
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.sniffed_type is None:
+            self.header += raw_data[:MAGIC_LENGTH]
+            if len(self.header) >= MAGIC_LENGTH:
+                self.sniffed_type = sniff_content_type(self.header)
+                if self.sniffed_type is None:
+                    self.reject(DISALLOWED_TYPE_ERROR)
+
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.reject(size_error(self.max_size))
+
+        self.digest.update(raw_data)
+        self.destination.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.destination.close()
+        if self.sniffed_type is None:
+            # Shorter than the longest magic number
+            self.sniffed_type = sniff_content_type(self.header)
+            if self.sniffed_type is None:
+                os.remove(self.temp_path)
+                self.request.document_upload_errors[self.field_name] = DISALLOWED_TYPE_ERROR
+                self.outcome.error = DISALLOWED_TYPE_ERROR
+                return None
+
+        self.outcome.file = StreamedUploadedFile(
+            self.temp_path,
+            self.file_name,
+            self.sniffed_type,
+            self.size,
+            self.charset,
+            self.digest.hexdigest(),
+            self.content_type_extra
+        )
+        return self.outcome.file
+
+    def upload_interrupted(self):
+        if getattr(self, 'destination', None) is not None and not self.destination.closed:
+            self.destination.close()
+            os.remove(self.temp_path)
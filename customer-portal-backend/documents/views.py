@@ -2,26 +2,68 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import FileResponse, Http404
+from django.http import Http404, StreamingHttpResponse
 from django.conf import settings
-from .models import CustomerDocument, DocumentControl
+from django.db import transaction
+from django.db.models import Count, Sum
+from .models import CustomerDocument, DocumentControl, DocumentBlob, StoredFile, EXTENSION_CONTENT_TYPES, REFERENCE_KIND_TYPES
+from .archive import ArchiveEntry, iter_zip, unique_names
+from .blobstore import store_uploaded_file, store_uploaded_files
+from .downloads import file_download_response
+from .layout import UNSAFE_NAME_CHARS
+from .normalize import NormalizedUpload, get_image_normalizer
+from .previews import get_preview_generator
+from .upload_handlers import DocumentUploadHandler, upload_errors, upload_outcomes
 from .serializers import CustomerDocumentSerializer, DocumentUploadSerializer, DocumentControlSerializer
+from .storage import LocalDocumentStorage, get_document_storage
 from vehicles.models import VehicleDetails
+from vehicles.profile_cache import invalidate_vehicle_profiles
 from po_details.models import PODetails
 from drivers.models import DriverHelper
+from submissions.audit import audit, audit_many
+from customer_portal.permissions import IsEmployee
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import os
-from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Frontend document types to backend types
+DOC_TYPE_MAPPING = {
+    'vehicleRegistration': 'vehicle_registration',
+    'vehicleInsurance': 'vehicle_insurance',
+    'vehiclePuc': 'vehicle_puc',
+    'driverAadhar': 'driver_aadhar',
+    'helperAadhar': 'helper_aadhar',
+    'po': 'po',
+    'do': 'do',
+    'beforeWeighing': 'before_weighing',
+    'afterWeighing': 'after_weighing',
+}
+
 
 class CustomerDocumentViewSet(viewsets.ModelViewSet):
     queryset = CustomerDocument.objects.filter(is_active=True)
     serializer_class = CustomerDocumentSerializer
     parser_classes = (MultiPartParser, FormParser)
+    cursor_ordering = ('-uploaded_at', '-id')
+
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        # Uploads are validated, hashed and spooled while they stream in
+        if self.action == 'upload_to_document_control':
+            request.upload_handlers = [DocumentUploadHandler(request)]
+        elif self.action == 'upload_batch':
+            request.upload_handlers = [
+                DocumentUploadHandler(request, max_files=settings.DOCUMENT_BATCH_MAX_FILES, field_name='files')
+            ]
+        return drf_request
 
     def get_queryset(self):
         """
         Filter documents by customer email
         """
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().annotate(file_present=StoredFile.presence_subquery('file_path'))
         customer_email = self.request.query_params.get('customer_email', None)
         if customer_email:
             queryset = queryset.filter(customer_email=customer_email)
@@ -51,16 +93,31 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
             
             # Store file path before deletion
             file_path = document.filePath
+            blob_id = document.blob_id
+            original_blob_id = document.original_blob_id
             document_name = document.name
             document_type = document.get_type_display()
             
             # Delete the document record from database
             document.delete()
+
+            audit(
+                request, 'document.deleted',
+                f"{document_type} '{document_name}' deleted from document control",
+                reference_type='DocumentControl',
+                reference_id=document_id
+            )
             
+            # Shared blobs are only removed with their last reference
+            if original_blob_id:
+                DocumentBlob.release(original_blob_id)
+            if blob_id:
+                DocumentBlob.release(blob_id)
             # Delete the physical file from storage
-            if file_path and os.path.exists(file_path):
+            elif file_path:
                 try:
-                    os.remove(file_path)
+                    get_document_storage().delete(file_path)
+                    StoredFile.record_missing(file_path)
                 except OSError as e:
                     # Log error but don't fail the request
                     print(f"Warning: Could not delete file {file_path}: {e}")
@@ -81,65 +138,19 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
                 "error": f"Failed to delete document: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    @action(detail=False, methods=['post'], url_path='upload-to-control')
-    def upload_to_document_control(self, request):
+    def resolve_document_reference(self, request, mapped_type, resolved=None):
         """
-        Upload document to DocumentControl table with local file storage
+        Find the referenced entity's key for a document type from the request's
+        vehicle_number / po_number / driver_phone / helper_phone
         
-        POST /api/documents/upload-to-control/
+        Pass the same resolved dict for every file of a batch so each
+        vehicle, PO, driver and helper is looked up once.
         
-        Form Data:
-        - document_type: string (e.g., 'vehicleRegistration', 'po', etc.)
-        - file: file (PDF, JPG, JPEG, PNG - max 5MB)
-        - vehicle_number: string (optional - for vehicle-related docs)
-        - po_number: string (optional - for PO-related docs)
-        - driver_phone: string (optional - for driver-related docs)
-        - helper_phone: string (optional - for helper-related docs)
+        Returns:
+            tuple: (reference_id, error message or None)
         """
-        # Validate file
-        file = request.FILES.get('file')
-        if not file:
-            return Response({
-                "error": "No file provided"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Validate file type and size
-        ACCEPTED_TYPES = ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']
-        MAX_SIZE = 5 * 1024 * 1024  # 5MB
-        
-        if file.content_type not in ACCEPTED_TYPES:
-            return Response({
-                "error": "Only PDF, JPG, JPEG, and PNG files are allowed"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        if file.size > MAX_SIZE:
-            return Response({
-                "error": "File size must be 5MB or smaller"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Get document type
-        document_type = request.data.get('document_type')
-        if not document_type:
-            return Response({
-                "error": "Document type is required"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Map frontend document types to backend types
-        doc_type_mapping = {
-            'vehicleRegistration': 'vehicle_registration',
-            'vehicleInsurance': 'vehicle_insurance',
-            'vehiclePuc': 'vehicle_puc',
-            'driverAadhar': 'driver_aadhar',
-            'helperAadhar': 'helper_aadhar',
-            'po': 'po',
-            'do': 'do',
-            'beforeWeighing': 'before_weighing',
-            'afterWeighing': 'after_weighing',
-        }
-        
-        mapped_type = doc_type_mapping.get(document_type, document_type)
-        
-        # Determine reference ID based on document type
+        if resolved is None:
+            resolved = {}
         reference_id = None
         
         try:
@@ -148,105 +159,157 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
                 vehicle_number = request.data.get('vehicle_number')
                 if not vehicle_number:
                     # Try to get from user's context (if available in session/token)
-                    return Response({
-                        "error": "Vehicle number is required for vehicle documents"
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                    return None, "Vehicle number is required for vehicle documents"
                 
+                if 'vehicle' in resolved:
+                    return resolved['vehicle'], None
                 try:
                     # Get or create vehicle to ensure it exists
-                    vehicle, created = VehicleDetails.objects.get_or_create(
-                        vehicleRegistrationNo=vehicle_number.strip().upper()
-                    )
-                    reference_id = vehicle.id
+                    vehicle, created = VehicleDetails.upsert(vehicle_number.strip().upper())
+                    reference_id = resolved['vehicle'] = vehicle.id
                     print(f"Vehicle ID set as referenceId: {reference_id}")  # Debug log
                 except Exception as e:
                     print(f"Vehicle lookup error: {str(e)}")  # Debug log
-                    return Response({
-                        "error": f"Failed to find or create vehicle: {str(e)}"
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                    return None, f"Failed to find or create vehicle: {str(e)}"
             
             # For PO/DO documents
             elif mapped_type in ['po', 'do', 'before_weighing', 'after_weighing']:
                 po_number = request.data.get('po_number')
+                if po_number and 'po' in resolved:
+                    return resolved['po'], None
                 if po_number:
                     try:
-                        po, created = PODetails.objects.get_or_create(
-                            id=po_number.strip().upper(),
-                            defaults={'customerUserId': request.user}
-                        )
-                        reference_id = po.id  # Note: PODetails uses string ID
-                        print(f"PO ID set as referenceId: {reference_id}")  # Debug log
+                        po, created = PODetails.upsert(po_number.strip().upper(), request.user)
+                        reference_id = resolved['po'] = po.id  # PO number, stored as reference_str_key
+                        logger.debug("PO ID set as reference: %s", reference_id)
                     except Exception as e:
                         print(f"PO lookup error: {str(e)}")  # Debug log
-                        return Response({
-                            "error": f"Failed to find or create PO: {str(e)}"
-                        }, status=status.HTTP_400_BAD_REQUEST)
+                        return None, f"Failed to find or create PO: {str(e)}"
             
             # For driver documents
             elif mapped_type == 'driver_aadhar':
                 driver_phone = request.data.get('driver_phone')
+                if driver_phone and 'driver' in resolved:
+                    return resolved['driver'], None
                 if driver_phone:
                     try:
                         driver = DriverHelper.objects.get(phoneNo=driver_phone, type='Driver')
-                        reference_id = driver.id
+                        reference_id = resolved['driver'] = driver.id
                         print(f"Driver ID set as referenceId: {reference_id}")  # Debug log
                     except DriverHelper.DoesNotExist:
-                        return Response({
-                            "error": "Driver not found. Please add driver information first."
-                        }, status=status.HTTP_400_BAD_REQUEST)
+                        return None, "Driver not found. Please add driver information first."
             
             # For helper documents
             elif mapped_type == 'helper_aadhar':
                 helper_phone = request.data.get('helper_phone')
+                if helper_phone and 'helper' in resolved:
+                    return resolved['helper'], None
                 if helper_phone:
                     try:
                         helper = DriverHelper.objects.get(phoneNo=helper_phone, type='Helper')
-                        reference_id = helper.id
+                        reference_id = resolved['helper'] = helper.id
                         print(f"Helper ID set as referenceId: {reference_id}")  # Debug log
                     except DriverHelper.DoesNotExist:
-                        return Response({
-                            "error": "Helper not found. Please add helper information first."
-                        }, status=status.HTTP_400_BAD_REQUEST)
+                        return None, "Helper not found. Please add helper information first."
         
         except Exception as e:
             print(f"Error determining referenceId: {str(e)}")  # Debug log
+            return None, f"Failed to determine reference: {str(e)}"
+        
+        return reference_id, None
+
+    @action(detail=False, methods=['post'], url_path='upload-to-control')
+    def upload_to_document_control(self, request):
+        """
+        Upload document to DocumentControl table with local file storage
+        
+        POST /api/documents/upload-to-control/
+        
+        Form Data:
+        - document_type: string (e.g., 'vehicleRegistration', 'po', etc.)
+        - file: file (PDF, JPG, JPEG, PNG - max 5MB)
+        - vehicle_number: string (optional - for vehicle-related docs)
+        - po_number: string (optional - for PO-related docs)
+        - driver_phone: string (optional - for driver-related docs)
+        - helper_phone: string (optional - for helper-related docs)
+        """
+        # Validate file (type and size are checked by DocumentUploadHandler while it streams in)
+        file = request.FILES.get('file')
+        upload_error = upload_errors(request).get('file')
+        if upload_error:
+            return Response({
+                "error": upload_error
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not file:
+            return Response({
+                "error": "No file provided"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Get document type
+        document_type = request.data.get('document_type')
+        if not document_type:
             return Response({
-                "error": f"Failed to determine reference: {str(e)}"
+                "error": "Document type is required"
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create storage directory
-        base_storage = getattr(settings, 'DOCUMENT_STORAGE_PATH', os.path.join(settings.BASE_DIR, 'documents'))
-        storage_path = os.path.join(base_storage, mapped_type)
-        os.makedirs(storage_path, exist_ok=True)
+        mapped_type = DOC_TYPE_MAPPING.get(document_type, document_type)
+        
+        # Determine reference ID based on document type
+        reference_id, reference_error = self.resolve_document_reference(request, mapped_type)
+        if reference_error:
+            return Response({
+                "error": reference_error
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_extension = os.path.splitext(file.name)[1]
-        safe_filename = f"{mapped_type}_{timestamp}{file_extension}"
-        file_path = os.path.join(storage_path, safe_filename)
+        # Optionally strip, downscale and recompress phone-camera images
+        normalizer = get_image_normalizer()
+        upload = normalizer.normalize(file, mapped_type) if normalizer else NormalizedUpload(file, file, False)
+        if upload.normalized:
+            logger.debug("Image normalized: %s -> %s bytes", upload.original_size, upload.file.size)
         
-        # Save file to disk
+        # Store the content once; duplicates only gain a reference
+        blob = original_blob = None
         try:
-            with open(file_path, 'wb+') as destination:
-                for chunk in file.chunks():
-                    destination.write(chunk)
-            print(f"File saved to: {file_path}")  # Debug log
+            blob, created = store_uploaded_file(upload.file)
+            logger.debug("File stored as blob %s (new: %s)", blob.sha256, created)
+            if upload.normalized and settings.DOCUMENT_IMAGE_KEEP_ORIGINAL:
+                original_blob, _ = store_uploaded_file(file)
         except Exception as e:
+            # Give back the normalized copy when keeping the original fails
+            if blob is not None:
+                DocumentBlob.release(blob.id)
             print(f"File save error: {str(e)}")  # Debug log
             return Response({
                 "error": f"Failed to save file: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if upload.normalized:
+                upload.file.close()
         
         # Create DocumentControl record
         try:
             document = DocumentControl.objects.create(
-                name=file.name,
+                name=upload.file.name,
                 type=mapped_type,
-                referenceId=reference_id,  # This should NOT be null now
-                filePath=file_path
+                **DocumentControl.reference_fields(mapped_type, reference_id),
+                filePath=blob.path,
+                blob=blob,
+                original_size=upload.original_size if upload.normalized else None,
+                original_blob=original_blob
             )
             
-            print(f"Document created with ID: {document.id}, referenceId: {document.referenceId}")  # Debug log
+            print(f"Document created with ID: {document.id}, reference: {document.reference_kind} {document.reference_key}")  # Debug log
+
+            # Render the list thumbnail in the background
+            transaction.on_commit(lambda: get_preview_generator().schedule(blob.sha256, blob.path, blob.content_type))
+
+            audit(
+                request, 'document.uploaded',
+                f"{document.get_type_display()} '{document.name}' uploaded (referenceId {reference_id})",
+                reference_type='DocumentControl',
+                reference_id=document.id
+            )
             
             return Response({
                 "document": DocumentControlSerializer(document).data,
@@ -254,15 +317,190 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_201_CREATED)
         
         except Exception as e:
-            # If database save fails, delete the file
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # If database save fails, give the blob references back
+            DocumentBlob.release(blob.id)
+            if original_blob is not None:
+                DocumentBlob.release(original_blob.id)
             
             print(f"Database save error: {str(e)}")  # Debug log
             return Response({
                 "error": f"Failed to save document record: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'], url_path='upload-batch')
+    def upload_batch(self, request):
+        """
+        Upload several documents to DocumentControl in one request
+        
+        POST /api/documents/upload-batch/
+        
+        Form Data:
+        - files: file, repeated (PDF, JPG, JPEG, PNG - max 5MB each)
+        - document_types: string, repeated in the same order as files
+        - vehicle_number, po_number, driver_phone, helper_phone: as for
+          upload-to-control, shared by all files
+        
+        References are resolved once per batch, files are stored together
+        and all rows are inserted with one bulk_create. Each file gets its
+        own result; the batch is 201 if any file was stored, else 400.
+        
+        Response:
+        {
+            "results": [
+                {"index": 0, "name": "rc.pdf", "document_type": "vehicleRegistration",
+                 "status": "created", "document": {...}},
+                {"index": 1, "name": "notes.txt", "document_type": "po",
+                 "status": "rejected", "error": "Only PDF, JPG, JPEG, and PNG files are allowed"}
+            ],
+            "created": 1,
+            "rejected": 1
+        }
+        """
+        # Reading the form runs DocumentUploadHandler over every file
+        document_types = request.data.getlist('document_types')
+        outcomes = upload_outcomes(request, 'files')
+        request_error = upload_errors(request).get('files')
+        if request_error and not outcomes:
+            return Response({
+                "error": request_error
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not outcomes:
+            return Response({
+                "error": "No files provided"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(outcomes) > settings.DOCUMENT_BATCH_MAX_FILES:
+            return Response({
+                "error": f"At most {settings.DOCUMENT_BATCH_MAX_FILES} files can be uploaded at once"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(document_types) != len(outcomes):
+            return Response({
+                "error": "Provide one document_types entry per file, in the same order"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Validate every file and resolve its reference, each reference only once
+        results = []
+        accepted = []
+        resolved = {}
+        for index, (outcome, document_type) in enumerate(zip(outcomes, document_types)):
+            result = {"index": index, "name": outcome.file_name, "document_type": document_type}
+            results.append(result)
+            
+            error = outcome.error
+            if not error and not document_type:
+                error = "Document type is required"
+            mapped_type = DOC_TYPE_MAPPING.get(document_type, document_type)
+            if not error:
+                reference_id, error = self.resolve_document_reference(request, mapped_type, resolved)
+            
+            if error:
+                result.update(status="rejected", error=error)
+            else:
+                accepted.append((result, outcome.file, mapped_type, reference_id))
+        
+        # Normalize images concurrently (no-op unless DOCUMENT_IMAGE_NORMALIZE)
+        normalizer = get_image_normalizer()
+        if normalizer:
+            with ThreadPoolExecutor(max_workers=settings.DOCUMENT_BATCH_WORKERS) as pool:
+                uploads = list(pool.map(lambda item: normalizer.normalize(item[1], item[2]), accepted))
+        else:
+            uploads = [NormalizedUpload(file, file, False) for _, file, _, _ in accepted]
+        
+        keep_originals = [upload.original for upload in uploads if upload.normalized and settings.DOCUMENT_IMAGE_KEEP_ORIGINAL]
+        documents = []
+        try:
+            with transaction.atomic():
+                stored = store_uploaded_files([upload.file for upload in uploads] + keep_originals)
+                original_blobs = iter(blob for blob, _ in stored[len(uploads):])
+                for (result, _, mapped_type, reference_id), upload, (blob, _) in zip(accepted, uploads, stored):
+                    keep_original = upload.normalized and settings.DOCUMENT_IMAGE_KEEP_ORIGINAL
+                    documents.append(DocumentControl(
+                        name=upload.file.name,
+                        type=mapped_type,
+                        **DocumentControl.reference_fields(mapped_type, reference_id),
+                        filePath=blob.path,
+                        blob=blob,
+                        original_size=upload.original_size if upload.normalized else None,
+                        original_blob=next(original_blobs) if keep_original else None
+                    ))
+                DocumentControl.objects.bulk_create(documents)
+                invalidate_vehicle_profiles(documents=documents)
+        except Exception as e:
+            logger.exception("Batch upload save error")
+            return Response({
+                "error": f"Failed to save documents: {str(e)}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            for upload in uploads:
+                if upload.normalized:
+                    upload.file.close()
+        
+        logger.info("Batch upload stored %s of %s files", len(documents), len(outcomes))
+        
+        for (result, _, _, _), document in zip(accepted, documents):
+            result.update(status="created", document=DocumentControlSerializer(document).data)
+        
+        audit_many(request, [
+            {
+                'action': 'document.uploaded',
+                'description': f"{document.get_type_display()} '{document.name}' uploaded (referenceId {document.reference_key})",
+                'reference_type': 'DocumentControl',
+                'reference_id': document.id
+            }
+            for document in documents
+        ])
+        
+        # Render the list thumbnails in the background
+        previews = {document.blob.sha256: document.blob for document in documents}
+        transaction.on_commit(lambda: [
+            get_preview_generator().schedule(blob.sha256, blob.path, blob.content_type) for blob in previews.values()
+        ])
+        
+        return Response({
+            "results": results,
+            "created": len(documents),
+            "rejected": len(results) - len(documents)
+        }, status=status.HTTP_201_CREATED if documents else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'], url_path='normalization-stats', permission_classes=[IsEmployee])
+    def normalization_stats(self, request):
+        """
+        Storage saved by upload-time image normalization, per document type
+        
+        GET /api/documents/normalization-stats/
+        
+        Response:
+        {
+            "types": [
+                {
+                    "type": "driver_aadhar",
+                    "images": 120,
+                    "original_bytes": 452984832,
+                    "stored_bytes": 61865984,
+                    "bytes_saved": 391118848
+                }
+            ],
+            "bytes_saved": 391118848
+        }
+        """
+        rows = (
+            DocumentControl.objects
+            .filter(original_size__isnull=False)
+            .values('type')
+            .annotate(images=Count('id'), original_bytes=Sum('original_size'), stored_bytes=Sum('blob__size'))
+            .order_by('type')
+        )
+        types = [
+            dict(row, bytes_saved=row['original_bytes'] - (row['stored_bytes'] or 0))
+            for row in rows
+        ]
+        return Response({
+            "types": types,
+            "bytes_saved": sum(row['bytes_saved'] for row in types)
+        })
+
     @action(detail=True, methods=['delete'], url_path='remove')
     def remove_document(self, request, pk=None):
         """
@@ -284,6 +522,13 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
         
         document.delete(hard_delete=hard_delete)
 
+        audit(
+            request, 'document.removed',
+            f"Customer document '{document.original_filename}' {'permanently deleted' if hard_delete else 'removed'}",
+            reference_type='CustomerDocument',
+            reference_id=pk
+        )
+
         return Response({
             "message": "Document permanently deleted" if hard_delete else "Document removed successfully",
             "hard_deleted": hard_delete
@@ -294,11 +539,13 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
         """
         List all active documents for a customer
         
-        GET /api/documents/list/?customer_email=user@example.com
+        GET /api/documents/list/?customer_email=user@example.com[&count=true]
         
         Response:
         {
-            "count": 5,
+            "next": "http://.../api/documents/list/?cursor=...",
+            "previous": null,
+            "count": 5,  (only with count=true)
             "documents": [
                 {
                     "id": 1,
@@ -320,14 +567,12 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
         documents = CustomerDocument.objects.filter(
             customer_email=customer_email,
             is_active=True
-        ).order_by('-uploaded_at')
+        ).annotate(file_present=StoredFile.presence_subquery('file_path'))
 
-        serializer = CustomerDocumentSerializer(documents, many=True, context={'request': request})
+        page = self.paginate_queryset(documents)
+        serializer = CustomerDocumentSerializer(page, many=True, context={'request': request})
         
-        return Response({
-            "count": documents.count(),
-            "documents": serializer.data
-        })
+        return Response(self.paginator.get_paginated_data(serializer.data, results_key='documents'))
 
     @action(detail=True, methods=['get'], url_path='download')
     def download_document(self, request, pk=None):
@@ -336,42 +581,190 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
         
         GET /api/documents/{id}/download/
         
+        Supports If-None-Match / If-Modified-Since (304) and single byte
+        ranges (206). The ETag is the SHA-256 of the file content. With
+        DOCUMENT_DOWNLOAD_OFFLOAD set, the bytes are sent by the web server
+        via X-Accel-Redirect or X-Sendfile once access is checked.
+        
         Returns: File download response
         """
         document = self.get_object()
         
-        # Check if file exists on storage
-        if not document.file_exists():
+        # Check if file exists on storage (indexed; opening the file confirms it)
+        if not document.indexed_file_exists():
             return Response({
                 "error": "File not found on storage",
                 "file_path": document.file_path
             }, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            # Open file from storage path
-            file_handle = open(document.file_path, 'rb')
-            
             # Determine content type based on extension
-            content_type_map = {
-                '.pdf': 'application/pdf',
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-            }
-            content_type = content_type_map.get(document.file_extension.lower(), 'application/octet-stream')
+            content_type = EXTENSION_CONTENT_TYPES.get(document.file_extension.lower(), 'application/octet-stream')
             
-            # Return file as response
-            response = FileResponse(file_handle, content_type=content_type)
-            response['Content-Disposition'] = f'attachment; filename="{document.original_filename}"'
-            response['Content-Length'] = document.file_size
-            
-            return response
+            return file_download_response(
+                request,
+                document.file_path,
+                document.ensure_checksum(),
+                content_type,
+                document.original_filename,
+                last_modified=document.updated_at
+            )
+
+        except FileNotFoundError:
+            # Removed behind the index's back
+            StoredFile.record_missing(document.file_path)
+            return Response({
+                "error": "File not found on storage",
+                "file_path": document.file_path
+            }, status=status.HTTP_404_NOT_FOUND)
 
         except Exception as e:
             return Response({
                 "error": f"Failed to read file: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    # ----- PREVIEWS -----
+    def preview_response(self, request, sha256, source_path, content_type, name, last_modified=None):
+        """
+        WebP preview of a stored file, rendered on a cache miss
+        """
+        try:
+            path = get_preview_generator().get_or_render(sha256, source_path, content_type)
+        except Exception as e:
+            logger.exception("Preview render for %s failed", source_path)
+            return Response({
+                "error": f"Failed to render preview: {str(e)}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Previews are a local cache whatever backend holds the documents
+        return file_download_response(
+            request,
+            path,
+            os.path.basename(path)[:-len('.webp')],
+            'image/webp',
+            f"{os.path.splitext(name)[0]}.webp",
+            last_modified=last_modified,
+            as_attachment=False,
+            storage=LocalDocumentStorage()
+        )
+
+    @action(detail=True, methods=['get'], url_path='preview')
+    def preview_document(self, request, pk=None):
+        """
+        Small WebP preview of a document (image thumbnail or PDF first page)
+        
+        GET /api/documents/{id}/preview/
+        
+        Previews are cached by content hash; the first request for new
+        content waits for the render.
+        """
+        document = self.get_object()
+        if not document.indexed_file_exists():
+            return Response({
+                "error": "File not found on storage"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return self.preview_response(
+            request,
+            document.ensure_checksum(),
+            document.file_path,
+            EXTENSION_CONTENT_TYPES.get(document.file_extension.lower(), 'application/octet-stream'),
+            document.original_filename,
+            last_modified=document.updated_at
+        )
+
+    @action(detail=False, methods=['get'], url_path=r'control/(?P<document_id>\d+)/preview', permission_classes=[IsEmployee])
+    def preview_document_control(self, request, document_id=None):
+        """
+        Small WebP preview of a DocumentControl upload
+        
+        GET /api/documents/control/{document_id}/preview/
+        
+        Employees only: uploads are not tied to a customer and can hold
+        identity documents.
+        """
+        try:
+            document = DocumentControl.objects.select_related('blob').get(id=document_id)
+        except DocumentControl.DoesNotExist:
+            return Response({
+                "error": "Document not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        if not StoredFile.is_present(document.filePath):
+            return Response({
+                "error": "File not found on storage"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return self.preview_response(
+            request,
+            document.content_sha256(),
+            document.filePath,
+            document.content_type(),
+            document.name or 'preview',
+            last_modified=document.created
+        )
+
+    # ----- EXPORTS -----
+    @action(detail=False, methods=['get'], url_path=r'control/export/(?P<kind>[a-z]+)/(?P<key>[^/]+)', permission_classes=[IsEmployee])
+    def export_documents(self, request, kind=None, key=None):
+        """
+        ZIP archive of every document of a vehicle, driver, helper or PO
+        
+        GET /api/documents/control/export/{kind}/{key}/
+        
+        kind is vehicle, driver, helper or po; key is the vehicle or
+        driver/helper id, or the PO number. Entries are named
+        <document type>/<file name>. The archive is streamed while it is
+        built, with upcoming files read ahead in parallel; PDFs and images
+        are stored without recompressing them. Files missing from storage
+        are listed in MISSING.txt inside the archive. Employees only: the
+        archive can hold identity documents.
+        
+        Returns: application/zip download
+        """
+        if kind not in REFERENCE_KIND_TYPES:
+            return Response({
+                "error": f"Unknown reference kind '{kind}'. Use one of: {', '.join(REFERENCE_KIND_TYPES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            reference = (kind, DocumentControl.normalize_reference_key(kind, key))
+        except ValueError:
+            return Response({
+                "error": f"Invalid {kind} id '{key}'"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        documents = DocumentControl.for_references([reference]).get(reference, [])
+        if not documents:
+            return Response({
+                "error": f"No documents found for {kind} {key}"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        def entry_name(document):
+            name = os.path.basename(document.name or '') or os.path.basename(document.filePath)
+            if not os.path.splitext(name)[1]:
+                name += os.path.splitext(document.filePath)[1]
+            return f"{document.type}/{name}"
+
+        names = unique_names(entry_name(document) for document in documents)
+        entries = [
+            ArchiveEntry(name, document.filePath, modified=document.created)
+            for name, document in zip(names, documents)
+        ]
+        logger.info("Exporting %s documents for %s %s", len(entries), kind, key)
+
+        audit(
+            request, 'document.exported',
+            f"{len(entries)} documents of {kind} {key} exported as ZIP",
+            reference_type=kind,
+            reference_id=str(key)
+        )
+
+        response = StreamingHttpResponse(iter_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{kind}-{UNSAFE_NAME_CHARS.sub("_", str(key))}-documents.zip"'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
     @action(detail=True, methods=['get'], url_path='info')
     def document_info(self, request, pk=None):
         """
@@ -410,7 +803,7 @@ class CustomerDocumentViewSet(viewsets.ModelViewSet):
             "file_size": document.file_size,
             "file_size_readable": format_size(document.file_size),
             "file_extension": document.file_extension,
-            "file_exists": document.file_exists(),
+            "file_exists": document.indexed_file_exists(),
             "is_active": document.is_active,
             "uploaded_at": document.uploaded_at,
             "updated_at": document.updated_at
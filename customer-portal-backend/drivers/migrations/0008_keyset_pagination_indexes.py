@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-16 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0007_alter_driverhelper_uid_nonnull'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driverhelper',
+            index=models.Index(fields=['created', 'id'], name='DriverHelpe_created_e8bf12_idx'),
+        ),
+    ]
@@ -2,6 +2,9 @@
 from django.db import models
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from customer_portal.upsert import column_list, upsert_returning
+from vehicles.profile_cache import invalidate_vehicle_profiles
 
 DRIVER_TYPES = (
     ('Driver', 'Driver'),
@@ -60,6 +63,7 @@ class DriverHelper(models.Model):
         indexes = [
             models.Index(fields=['phoneNo']),
             models.Index(fields=['type']),
+            models.Index(fields=['created', 'id']),  # Keyset pagination
         ]
 
     def __str__(self):
@@ -77,34 +81,89 @@ class DriverHelper(models.Model):
                 )
 
     @classmethod
-    def validate_or_create(cls, name, phone_no, driver_type, language='en'):
+    def upsert(cls, name, phone_no, driver_type, language='en', uid=None):
+        """
+        Resolve a driver/helper by phone in a single statement
+
+        - Phone exists, name matches (case-insensitive) → language is updated
+          if it changed and the row is returned
+        - Phone exists, name differs → row is returned unchanged with
+          name_matches = False
+        - Phone doesn't exist → row is created unless uid is None (a blank
+          uid is stored as given)
+
+        Returns:
+            tuple: (instance, created, name_matches), or None if the phone is
+            not registered and no row could be created (uid is None, or the
+            uid belongs to another phone number)
+        """
+        columns = column_list(cls)
+        sql = f"""
+            WITH updated AS (
+                UPDATE "DriverHelper" SET "language" = %(language)s
+                WHERE "phoneNo" = %(phone)s
+                  AND lower("name") = lower(%(name)s)
+                  AND "language" <> %(language)s
+                RETURNING {columns}
+            ), inserted AS (
+                INSERT INTO "DriverHelper"
+                    ("uid", "name", "type", "phoneNo", "language", "isBlacklisted", "rating", "created")
+                SELECT %(uid)s, %(name)s, %(type)s, %(phone)s, %(language)s, false, NULL, %(now)s
+                WHERE %(uid)s IS NOT NULL
+                ON CONFLICT DO NOTHING
+                RETURNING {columns}
+            )
+            SELECT {columns}, false, true, true FROM updated
+            UNION ALL
+            SELECT {columns}, true, true, false FROM inserted
+            UNION ALL
+            SELECT {columns}, false, lower("name") = lower(%(name)s), false FROM "DriverHelper"
+            WHERE "phoneNo" = %(phone)s
+              AND NOT EXISTS (SELECT 1 FROM updated)
+              AND NOT EXISTS (SELECT 1 FROM inserted)
+        """
+        params = {
+            'name': name,
+            'phone': phone_no,
+            'type': driver_type,
+            'language': language,
+            'uid': uid,
+            'now': timezone.now(),
+        }
+
+        result = upsert_returning(cls, sql, params)
+        if result is None and uid and not cls.objects.filter(uid=uid).exists():
+            # Phone was inserted concurrently outside this statement's snapshot
+            result = upsert_returning(cls, sql, params)
+        if result is None:
+            return None
+
+        instance, created, name_matches, language_changed = result
+        if language_changed:
+            # Raw SQL sends no post_save; the language is part of cached vehicle profiles
+            invalidate_vehicle_profiles(people=[instance.id])
+        return instance, created, name_matches
+
+    @classmethod
+    def validate_or_create(cls, name, phone_no, driver_type, language='en', uid=None):
         """
         Workflow validation logic:
         - If phone exists and name matches → return existing
         - If phone exists but name mismatch → raise error
-        - If phone doesn't exist → create new
+        - If phone doesn't exist → create new (with a blank uid when none is given)
         """
-        try:
-            existing = cls.objects.get(phoneNo=phone_no)
-            if existing.name.lower() == name.lower():
-                # Update language if changed
-                if existing.language != language:
-                    existing.language = language
-                    existing.save()
-                return existing, False  # (instance, created)
-            else:
-                raise ValidationError(
-                    f"This Phone number is already registered with a different person. "
-                    f"Enter a different Phone number"
-                )
-        except cls.DoesNotExist:
-            # Create new driver/helper
-            instance = cls.objects.create(
-                name=name,
-                phoneNo=phone_no,
-                type=driver_type,
-                language=language,
-                isBlacklisted=False,
-                rating=None
+        result = cls.upsert(name, phone_no, driver_type, language=language, uid=uid or '')
+
+        if result is None:
+            raise ValidationError(
+                f"Aadhar number is already registered with a different phone number. "
+                f"Please verify the Aadhar number."
+            )
+
+        instance, created, name_matches = result
+        if not name_matches:
+            raise ValidationError(
+                f"This Phone number is already registered with a different person. "
+                f"Enter a different Phone number"
             )
-            return instance, True  # (instance, created)
\ No newline at end of file
+        return instance, created  # (instance, created)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-16 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('po_details', '0003_alter_podetails_dapname'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='podetails',
+            index=models.Index(fields=['customerUserId', 'created_at', 'id'], name='PODetails_custome_3950b9_idx'),
+        ),
+    ]
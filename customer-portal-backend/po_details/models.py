@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from customer_portal.upsert import column_list, upsert_returning
 from authentication.models import Zone
 
 class PODetails(models.Model):
@@ -29,6 +31,39 @@ class PODetails(models.Model):
         verbose_name = 'PO Detail'
         verbose_name_plural = 'PO Details'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['customerUserId', 'created_at', 'id']),  # Keyset pagination
+        ]
 
     def __str__(self):
-        return self.id
\ No newline at end of file
+        return self.id
+
+    @classmethod
+    def upsert(cls, po_number, customer):
+        """
+        Get or create a PO in a single INSERT ... ON CONFLICT statement
+
+        Returns:
+            tuple: (po, created)
+        """
+        columns = column_list(cls)
+        sql = f"""
+            WITH inserted AS (
+                INSERT INTO "PODetails" ("id", "customerUserId", "created_at")
+                VALUES (%(number)s, %(customer)s, %(now)s)
+                ON CONFLICT ("id") DO NOTHING
+                RETURNING {columns}
+            )
+            SELECT {columns}, true FROM inserted
+            UNION ALL
+            SELECT {columns}, false FROM "PODetails"
+            WHERE "id" = %(number)s AND NOT EXISTS (SELECT 1 FROM inserted)
+        """
+        params = {'number': po_number, 'customer': customer.pk, 'now': timezone.now()}
+
+        # Retry once for a concurrent insert outside this statement's snapshot
+        for _ in range(2):
+            result = upsert_returning(cls, sql, params)
+            if result:
+                return result
+        raise cls.DoesNotExist(f"PO {po_number} could not be created or found")
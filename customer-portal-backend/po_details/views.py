@@ -9,6 +9,7 @@ class PODetailsViewSet(viewsets.ModelViewSet):
     queryset = PODetails.objects.all()
     serializer_class = PODetailsSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         """
@@ -32,20 +33,10 @@ class PODetailsViewSet(viewsets.ModelViewSet):
         po_number = serializer.validated_data['po_number'].strip().upper()
         
         # Get or create PO - ALWAYS associate with current user
-        po, created = PODetails.objects.get_or_create(
-            id=po_number,
-            defaults={
-                'customerUserId': request.user
-            }
-        )
-        
-        # If PO exists but has no customer, assign current user
-        if not created and not po.customerUserId:
-            po.customerUserId = request.user
-            po.save()
+        po, created = PODetails.upsert(po_number, request.user)
         
         # If PO exists and belongs to a different customer, create error message
-        if not created and po.customerUserId != request.user:
+        if not created and po.customerUserId_id != request.user.pk:
             return Response({
                 "error": f"PO {po_number} is already associated with another customer",
                 "po": None,
@@ -63,12 +54,8 @@ class PODetailsViewSet(viewsets.ModelViewSet):
         """
         Get all POs for current user
         """
-        pos = PODetails.objects.filter(
-            customerUserId=request.user
-        ).order_by('-created_at')
-        
-        serializer = PODetailsSerializer(pos, many=True)
-        return Response({
-            "pos": serializer.data,
-            "count": pos.count()
-        })
\ No newline at end of file
+        pos = PODetails.objects.filter(customerUserId=request.user)
+
+        page = self.paginate_queryset(pos)
+        serializer = PODetailsSerializer(page, many=True)
+        return Response(self.paginator.get_paginated_data(serializer.data, results_key='pos'))
\ No newline at end of file
@@ -0,0 +1,420 @@
+import atexit
+import glob
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, InterfaceError, OperationalError, close_old_connections, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Fields persisted to the spool file when the database is unavailable
+SPOOL_FIELDS = (
+    'action', 'description', 'user_email', 'ip_address',
+    'submission_id', 'reference_type', 'reference_id'
+)
+
+# Pending spool files are retried at most this often
+SPOOL_REPLAY_SECONDS = 60
+
+
+def valid_ip(value):
+    """
+    value as a normalized IP address, or None if it is not one
+
+    AuditLog.ip_address is an inet column: a single bad address would make
+    the database reject a whole batch.
+    """
+    try:
+        return str(ipaddress.ip_address((value or '').strip()))
+    except ValueError:
+        return None
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"AuditLog_y{month.year:04d}m{month.month:02d}"
+
+
+def ensure_audit_partitions(months):
+    """
+    Create the monthly AuditLog partitions for the given months if missing
+
+    Args:
+        months: Iterable of dates, any day within the month
+
+    Returns:
+        list: Names of the partitions that were created
+    """
+    created = []
+    with connection.cursor() as cursor:
+        for month in sorted({month_start(m) for m in months}):
+            name = partition_name(month)
+            cursor.execute("SELECT to_regclass(%s)", [f'"{name}"'])
+            if cursor.fetchone()[0] is not None:
+                continue
+            try:
+                with transaction.atomic():
+                    cursor.execute(
+                        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "AuditLog" '
+                        f'FOR VALUES FROM (%s) TO (%s)',
+                        [month, next_month(month)]
+                    )
+                created.append(name)
+            except Exception as e:
+                # Typically rows for that month already sit in the default partition
+                logger.warning("Could not create audit partition %s: %s", name, e)
+    return created
+
+
+class AuditLogWriter:
+    """
+    In-process buffer that writes AuditLog rows in batches
+
+    Requests only append an unsaved AuditLog to a list; a daemon thread
+    bulk-inserts the buffer whenever AUDIT_LOG_BATCH_SIZE events are waiting
+    or AUDIT_LOG_FLUSH_SECONDS have passed, creating the monthly partition
+    first if needed. Whatever is still buffered is flushed at interpreter
+    exit. Batches the database rejects are appended to a JSONL file in
+    AUDIT_LOG_SPOOL_DIR and replayed on a later flush, and events beyond
+    AUDIT_LOG_MAX_BUFFER are spooled straight away instead of growing memory.
+    """
+
+    def __init__(self, batch_size=None, flush_seconds=None, max_buffer=None, spool_dir=None):
+        self.batch_size = batch_size or settings.AUDIT_LOG_BATCH_SIZE
+        self.flush_seconds = flush_seconds or settings.AUDIT_LOG_FLUSH_SECONDS
+        self.max_buffer = max_buffer or settings.AUDIT_LOG_MAX_BUFFER
+        self.spool_dir = str(spool_dir or settings.AUDIT_LOG_SPOOL_DIR)
+
+        self._flush_lock = threading.Lock()
+        self._known_months = set()
+        self._replayed_at = None
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        # Called again in a forked child: the parent's thread and buffer do not carry over
+        self._pid = os.getpid()
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    # ---------------------------------------------------------
+    # BUFFER
+    # ---------------------------------------------------------
+    def log(self, action, description, user_email=None, ip_address=None,
+            submission_id=None, reference_type=None, reference_id=None):
+        """
+        Buffer one audit event; never touches the database
+        """
+        event = AuditLog(
+            action=action,
+            description=description,
+            user_email=user_email or None,
+            ip_address=valid_ip(ip_address),
+            submission_id=submission_id,
+            reference_type=reference_type,
+            reference_id=str(reference_id) if reference_id is not None else None,
+            timestamp=timezone.now()
+        )
+
+        self._ensure_thread()
+        overflow = None
+        with self._condition:
+            self._buffer.append(event)
+            if len(self._buffer) > self.max_buffer:
+                overflow, self._buffer = self._buffer, []
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+        if overflow:
+            self.spool(overflow)
+
+    def log_many(self, events):
+        """
+        Buffer several audit events given as dicts of log() arguments
+        """
+        for event in events:
+            self.log(**event)
+
+    def _take(self):
+        with self._condition:
+            events, self._buffer = self._buffer, []
+        return events
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopping and len(self._buffer) < self.batch_size:
+                    self._condition.wait(self.flush_seconds)
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Audit log flush failed: %s", e)
+            finally:
+                close_old_connections()
+            if stopping:
+                return
+
+    # ---------------------------------------------------------
+    # WRITE
+    # ---------------------------------------------------------
+    def flush(self):
+        """
+        Write everything buffered so far
+
+        Returns:
+            int: Number of events written to the database
+        """
+        events = self._take()
+        with self._flush_lock:
+            written = self._write(events) if events else 0
+            if self._replayed_at is None or time.monotonic() - self._replayed_at > SPOOL_REPLAY_SECONDS:
+                self._replayed_at = time.monotonic()
+                written += self.replay_spool()
+        return written
+
+    def _write(self, events):
+        try:
+            months = {month_start(event.timestamp) for event in events} - self._known_months
+            if months:
+                ensure_audit_partitions(months)
+                self._known_months |= months
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(events, batch_size=self.batch_size)
+            return len(events)
+        except Exception as e:
+            logger.error("Could not write %s audit events, spooling: %s", len(events), e)
+            self.spool(events)
+            return 0
+
+    def close(self):
+        """
+        Stop the flusher thread and write the remaining buffer
+        """
+        if self._pid != os.getpid():
+            return
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            thread.join(timeout=max(self.flush_seconds * 5, 10))
+        if self._buffer:
+            self.flush()
+
+    # ---------------------------------------------------------
+    # SPOOL
+    # ---------------------------------------------------------
+    def spool(self, events):
+        """
+        Append events to this process' JSONL spool file
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        write_spool_file(os.path.join(self.spool_dir, f"audit-{os.getpid()}.jsonl"), events)
+
+    def replay_spool(self):
+        """
+        Write spooled events back to the database and remove their files
+
+        Files that cannot be parsed, and events the database rejects, are
+        set aside as <file>.bad so they do not block later replays. If the
+        database is unreachable the file is kept for the next attempt.
+
+        Returns:
+            int: Number of events replayed
+        """
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, 'audit-*.jsonl'))):
+            # Claim the file so concurrent writers do not replay it twice
+            claimed = f"{path}.{os.getpid()}.replay"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+
+            try:
+                events = read_spool_file(claimed)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.error("Audit spool file %s is unreadable, moving it aside: %s", path, e)
+                os.rename(claimed, f"{path}.bad")
+                continue
+
+            try:
+                months = {month_start(event.timestamp) for event in events}
+                ensure_audit_partitions(months - self._known_months)
+                self._known_months |= months
+                rejected = self._insert_valid(events)
+            except (OperationalError, InterfaceError) as e:
+                logger.error("Audit spool replay of %s failed: %s", path, e)
+                os.rename(claimed, path)
+                break
+
+            if rejected:
+                logger.error("Database rejected %s spooled audit events from %s", len(rejected), path)
+                write_spool_file(f"{path}.bad", rejected)
+            os.remove(claimed)
+            replayed += len(events) - len(rejected)
+        return replayed
+
+    def _insert_valid(self, events):
+        """
+        Insert events, row by row if the batch is rejected
+
+        Returns:
+            list: Events the database rejected
+        """
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(events, batch_size=self.batch_size)
+            return []
+        except (OperationalError, InterfaceError):
+            raise
+        except DatabaseError:
+            pass
+
+        rejected = []
+        with transaction.atomic():
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        AuditLog.objects.bulk_create([event])
+                except (OperationalError, InterfaceError):
+                    raise
+                except DatabaseError:
+                    rejected.append(event)
+        return rejected
+
+
+def write_spool_file(path, events):
+    """
+    Append events to a JSONL spool file
+    """
+    with open(path, 'a') as f:
+        for event in events:
+            record = {field: getattr(event, field) for field in SPOOL_FIELDS}
+            record['timestamp'] = event.timestamp.isoformat()
+            f.write(json.dumps(record) + '\n')
+
+
+def read_spool_file(path):
+    """
+    Unsaved AuditLog events from a JSONL spool file
+
+    Raises:
+        ValueError, TypeError, KeyError: A line is not a spooled event
+    """
+    events = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            events.append(AuditLog(**record))
+    return events
+
+
+_audit_writer = None
+_audit_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    """
+    Process-wide AuditLogWriter configured from settings
+    """
+    global _audit_writer
+    if _audit_writer is None:
+        with _audit_writer_lock:
+            if _audit_writer is None:
+                _audit_writer = AuditLogWriter()
+    return _audit_writer
+
+
+@receiver(setting_changed)
+def reset_audit_writer(setting, **kwargs):
+    global _audit_writer
+    if setting.startswith('AUDIT_LOG_'):
+        with _audit_writer_lock:
+            if _audit_writer is not None:
+                _audit_writer.close()
+            _audit_writer = None
+
+
+def get_client_ip(request):
+    """
+    Get client IP address from request
+
+    The first X-Forwarded-For entry is used if it is a valid address, else
+    REMOTE_ADDR; None if neither is.
+    """
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = valid_ip(x_forwarded_for.split(',')[0])
+        if ip:
+            return ip
+    return valid_ip(request.META.get('REMOTE_ADDR'))
+
+
+def audit(request, action, description, submission_id=None, reference_type=None, reference_id=None):
+    """
+    Record an audit event for the current request
+
+    The event is buffered once the surrounding transaction commits, so
+    rolled back work never shows up in the trail.
+    """
+    user = getattr(request, 'user', None)
+    user_email = user.email if user is not None and user.is_authenticated else None
+    ip_address = get_client_ip(request)
+
+    transaction.on_commit(lambda: get_audit_writer().log(
+        action=action,
+        description=description,
+        user_email=user_email,
+        ip_address=ip_address,
+        submission_id=submission_id,
+        reference_type=reference_type,
+        reference_id=reference_id
+    ))
+
+
+def audit_many(request, events):
+    """
+    Record several audit events for the current request with one commit hook
+
+    Args:
+        events: Dicts with action, description and optionally submission_id,
+            reference_type and reference_id
+    """
+    user = getattr(request, 'user', None)
+    user_email = user.email if user is not None and user.is_authenticated else None
+    ip_address = get_client_ip(request)
+
+    events = [dict(event, user_email=user_email, ip_address=ip_address) for event in events]
+    if events:
+        transaction.on_commit(lambda: get_audit_writer().log_many(events))
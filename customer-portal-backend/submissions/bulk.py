@@ -0,0 +1,255 @@
+from django.db import transaction
+from vehicles.models import VehicleDetails
+from vehicles.profile_cache import invalidate_vehicle_profiles
+from drivers.models import DriverHelper
+from po_details.models import PODetails
+from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
+from .models import GateEntrySubmission, EmailOutbox
+from .serializers import SubmissionCreateSerializer
+from .qr_generator import qr_payload_hash
+from .sms import enqueue_qr_sms
+
+
+def resolve_vehicles(vehicle_numbers):
+    """
+    Fetch or create vehicles by registration number with set-based queries
+
+    Returns:
+        dict: vehicleRegistrationNo -> VehicleDetails
+    """
+    vehicles = {
+        v.vehicleRegistrationNo: v
+        for v in VehicleDetails.objects.filter(vehicleRegistrationNo__in=vehicle_numbers)
+    }
+    missing = set(vehicle_numbers) - vehicles.keys()
+    if missing:
+        VehicleDetails.objects.bulk_create(
+            [VehicleDetails(vehicleRegistrationNo=number) for number in missing],
+            ignore_conflicts=True
+        )
+        vehicles.update({
+            v.vehicleRegistrationNo: v
+            for v in VehicleDetails.objects.filter(vehicleRegistrationNo__in=missing)
+        })
+    return vehicles
+
+
+def resolve_pos(po_numbers, user):
+    """
+    Fetch or create POs by number with set-based queries
+
+    Returns:
+        dict: PO number -> PODetails
+    """
+    pos = {po.id: po for po in PODetails.objects.filter(id__in=po_numbers)}
+    missing = set(po_numbers) - pos.keys()
+    if missing:
+        PODetails.objects.bulk_create(
+            [PODetails(id=number, customerUserId=user) for number in missing],
+            ignore_conflicts=True
+        )
+        pos.update({po.id: po for po in PODetails.objects.filter(id__in=missing)})
+    return pos
+
+
+PHONE_TAKEN = (
+    "This Phone number is already registered with a different person. "
+    "Enter a different Phone number"
+)
+UID_TAKEN = (
+    "Aadhar number is already registered with a different phone number. "
+    "Please verify the Aadhar number."
+)
+
+
+def resolve_people(entries):
+    """
+    Apply DriverHelper.validate_or_create rules to every driver and helper in
+    a batch with set-based queries; new drivers and helpers need a uid here
+
+    Args:
+        entries (dict): index -> validated SubmissionCreateSerializer data
+
+    Returns:
+        tuple: (phone -> DriverHelper, index -> error message)
+    """
+    wanted = []
+    for index, data in entries.items():
+        wanted.append((
+            index, 'Driver', data['driver_name'], data['driver_phone'],
+            data.get('driver_language', 'en'), data.get('driver_uid')
+        ))
+        if data.get('helper_name') and data.get('helper_phone'):
+            wanted.append((
+                index, 'Helper', data['helper_name'], data['helper_phone'],
+                data.get('helper_language', 'en'), data.get('helper_uid')
+            ))
+
+    people = {
+        p.phoneNo: p
+        for p in DriverHelper.objects.filter(phoneNo__in={w[3] for w in wanted})
+    }
+    new_uids = {w[5] for w in wanted if w[3] not in people and w[5]}
+    taken_uids = set(
+        DriverHelper.objects.filter(uid__in=new_uids).values_list('uid', flat=True)
+    ) if new_uids else set()
+
+    errors = {}
+    to_create = {}
+    created_for = {}
+    language_changed = {}
+    for index, driver_type, name, phone, language, uid in wanted:
+        if index in errors:
+            continue
+
+        person = people.get(phone) or to_create.get(phone)
+        if person:
+            if person.name.lower() != name.lower():
+                errors[index] = PHONE_TAKEN
+            else:
+                if person.language != language:
+                    person.language = language
+                    if person.pk:
+                        language_changed[phone] = person
+                if not person.pk:
+                    created_for[phone].append(index)
+            continue
+
+        if not uid:
+            errors[index] = (
+                f"{driver_type} {phone} is not registered. "
+                f"Provide {driver_type.lower()}_uid (Aadhar number) to create it."
+            )
+        elif uid in taken_uids:
+            errors[index] = UID_TAKEN
+        else:
+            taken_uids.add(uid)
+            created_for[phone] = [index]
+            to_create[phone] = DriverHelper(
+                uid=uid,
+                name=name,
+                phoneNo=phone,
+                type=driver_type,
+                language=language,
+                isBlacklisted=False,
+                rating=None
+            )
+
+    if language_changed:
+        DriverHelper.objects.bulk_update(language_changed.values(), ['language'])
+        invalidate_vehicle_profiles(people=[person.id for person in language_changed.values()])
+    if to_create:
+        # A concurrent request may insert the same phone or uid first: skip
+        # those rows and re-select, then check what was actually stored
+        DriverHelper.objects.bulk_create(to_create.values(), ignore_conflicts=True)
+        stored = {
+            p.phoneNo: p
+            for p in DriverHelper.objects.filter(phoneNo__in=to_create.keys())
+        }
+        for phone, indexes in created_for.items():
+            person = stored.get(phone)
+            if person is None:
+                # Only the uid conflicted
+                error = UID_TAKEN
+            elif person.name.lower() != to_create[phone].name.lower():
+                error = PHONE_TAKEN
+            else:
+                continue
+            for index in indexes:
+                errors.setdefault(index, error)
+        people.update(stored)
+
+    return people, errors
+
+
+def create_bulk_submissions(raw_entries, user):
+    """
+    Create gate entry submissions for many trucks at once
+
+    Vehicles, drivers/helpers and POs are resolved with a fixed number of
+    set-based queries, and taggings, submissions and outbox emails and SMS are
+    inserted with bulk_create, so the query count does not grow with the
+    number of entries. Entries that fail validation are reported and skipped.
+
+    Args:
+        raw_entries (list): Entry dicts with the same fields as /create/
+        user: Authenticated customer, owner of newly created POs
+
+    Returns:
+        list: One {'index', 'submission'} or {'index', 'error'} dict per entry
+    """
+    results = [None] * len(raw_entries)
+    entries = {}
+    for index, raw in enumerate(raw_entries):
+        serializer = SubmissionCreateSerializer(data=raw)
+        if serializer.is_valid():
+            entries[index] = serializer.validated_data
+        else:
+            results[index] = {'index': index, 'error': serializer.errors}
+
+    with transaction.atomic():
+        people, errors = resolve_people(entries)
+        for index, error in errors.items():
+            results[index] = {'index': index, 'error': error}
+            del entries[index]
+
+        if entries:
+            ordered = sorted(entries.items())
+            vehicles = resolve_vehicles({
+                data['vehicle_number'].strip().upper() for _, data in ordered
+            })
+            pos = resolve_pos({
+                data['poNumber'].strip().upper() for _, data in ordered
+            }, user)
+
+            def helper_for(data):
+                if data.get('helper_name') and data.get('helper_phone'):
+                    return people[data['helper_phone']]
+                return None
+
+            driver_vehicle_taggings = DriverVehicleTagging.objects.bulk_create([
+                DriverVehicleTagging(
+                    driverId=people[data['driver_phone']],
+                    helperId=helper_for(data),
+                    vehicleId=vehicles[data['vehicle_number'].strip().upper()],
+                    isVerified=False
+                )
+                for _, data in ordered
+            ])
+
+            po_taggings = PODriverVehicleTagging.objects.bulk_create([
+                PODriverVehicleTagging(
+                    poId=pos[data['poNumber'].strip().upper()],
+                    driverVehicleTaggingId=tagging,
+                    rftagId=None,
+                    actReportingTime=None,
+                    exitTime=None
+                )
+                for (_, data), tagging in zip(ordered, driver_vehicle_taggings)
+            ])
+            # bulk_create sends no post_save
+            invalidate_vehicle_profiles(vehicles=[tagging.vehicleId_id for tagging in driver_vehicle_taggings])
+
+            submissions = GateEntrySubmission.objects.bulk_create([
+                GateEntrySubmission(
+                    customer_email=data['customer_email'],
+                    customer_phone=data['customer_phone'],
+                    vehicle=tagging.vehicleId,
+                    driver=tagging.driverId,
+                    helper=tagging.helperId,
+                    po_tagging=po_tagging,
+                    qr_payload_hash=qr_payload_hash({'id': po_tagging.id})
+                )
+                for (_, data), tagging, po_tagging in zip(ordered, driver_vehicle_taggings, po_taggings)
+            ])
+
+            EmailOutbox.objects.bulk_create([
+                EmailOutbox(submission=submission, recipient=submission.customer_email)
+                for submission in submissions
+            ])
+            enqueue_qr_sms(submissions)
+
+            for (index, _), submission in zip(ordered, submissions):
+                results[index] = {'index': index, 'submission': submission}
+
+    return results
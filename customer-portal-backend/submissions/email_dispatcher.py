@@ -0,0 +1,204 @@
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .emails import build_qr_email
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+class QREmailDispatcher:
+    """
+    Deliver pending EmailOutbox rows in batches over pooled SMTP connections
+
+    Each worker thread opens one backend connection and keeps reusing it, so
+    the SMTP handshake is paid once per worker instead of once per email.
+    Failed sends are rescheduled with exponential backoff until
+    QR_EMAIL_MAX_ATTEMPTS is reached, then marked as failed.
+    """
+
+    def __init__(self, batch_size=None, workers=None, max_attempts=None,
+                 retry_base_seconds=None, retry_max_seconds=None,
+                 lease_seconds=None, connection_factory=None):
+        self.batch_size = batch_size or settings.QR_EMAIL_BATCH_SIZE
+        self.workers = workers or settings.QR_EMAIL_WORKERS
+        self.max_attempts = max_attempts or settings.QR_EMAIL_MAX_ATTEMPTS
+        self.retry_base_seconds = retry_base_seconds or settings.QR_EMAIL_RETRY_BASE_SECONDS
+        self.retry_max_seconds = retry_max_seconds or settings.QR_EMAIL_RETRY_MAX_SECONDS
+        self.lease_seconds = lease_seconds or settings.QR_EMAIL_LEASE_SECONDS
+        self.connection_factory = connection_factory or get_connection
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='qr-email'
+        )
+
+    # ---------------------------------------------------------
+    # CLAIM
+    # ---------------------------------------------------------
+    def claim_batch(self):
+        """
+        Lease up to batch_size due entries for this dispatcher
+
+        Rows are locked with SKIP LOCKED so several dispatcher processes can
+        run side by side. Entries stuck in 'sending' past their lease (e.g. a
+        crashed dispatcher) are picked up again.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                EmailOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status='pending', next_attempt_at__lte=now) |
+                    Q(status='sending', locked_until__lt=now)
+                )
+                .order_by('next_attempt_at')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return []
+
+            EmailOutbox.objects.filter(id__in=ids).update(
+                status='sending',
+                attempts=F('attempts') + 1,
+                locked_until=now + timedelta(seconds=self.lease_seconds),
+                updated_at=now
+            )
+
+        return list(
+            EmailOutbox.objects
+            .filter(id__in=ids)
+            .select_related('submission__vehicle', 'submission__driver', 'submission__helper')
+        )
+
+    # ---------------------------------------------------------
+    # CONNECTION POOL
+    # ---------------------------------------------------------
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.connection_factory(fail_silently=False)
+            connection.open()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return
+        self._local.connection = None
+        with self._connections_lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Stop the worker threads and close every pooled connection
+        """
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    # ---------------------------------------------------------
+    # SEND
+    # ---------------------------------------------------------
+    def _send(self, entry):
+        """
+        Send one entry on this thread's pooled connection
+
+        A connection the server has dropped while idle is reopened once
+        before the attempt counts as failed.
+
+        Returns:
+            tuple: (entry, error or None)
+        """
+        for retry in range(2):
+            try:
+                message = build_qr_email(entry.submission, connection=self._get_connection())
+                message.to = [entry.recipient]
+                message.send(fail_silently=False)
+                return entry, None
+            except smtplib.SMTPServerDisconnected as e:
+                self._drop_connection()
+                if retry:
+                    return entry, e
+            except Exception as e:
+                self._drop_connection()
+                return entry, e
+
+    def _retry_delay(self, attempts):
+        delay = self.retry_base_seconds * (2 ** max(attempts - 1, 0))
+        return timedelta(seconds=min(delay, self.retry_max_seconds))
+
+    def record_results(self, results):
+        """
+        Persist delivery status for a sent batch
+        """
+        now = timezone.now()
+        sent_ids = [entry.id for entry, error in results if error is None]
+        if sent_ids:
+            EmailOutbox.objects.filter(id__in=sent_ids).update(
+                status='sent',
+                sent_at=now,
+                locked_until=None,
+                last_error=None,
+                updated_at=now
+            )
+
+        for entry, error in results:
+            if error is None:
+                continue
+            logger.warning("QR email %s to %s failed (attempt %s): %s",
+                           entry.id, entry.recipient, entry.attempts, error)
+            if entry.attempts >= self.max_attempts:
+                status, next_attempt_at = 'failed', entry.next_attempt_at
+            else:
+                status, next_attempt_at = 'pending', now + self._retry_delay(entry.attempts)
+            EmailOutbox.objects.filter(id=entry.id).update(
+                status=status,
+                next_attempt_at=next_attempt_at,
+                locked_until=None,
+                last_error=str(error)[:2000],
+                updated_at=now
+            )
+
+    def run_once(self):
+        """
+        Claim, send and record one batch
+
+        Returns:
+            dict: Number of entries claimed, sent and failed
+        """
+        entries = self.claim_batch()
+        if not entries:
+            return {'claimed': 0, 'sent': 0, 'failed': 0}
+
+        results = list(self._executor.map(self._send, entries))
+        self.record_results(results)
+
+        failed = sum(1 for _, error in results if error is not None)
+        return {'claimed': len(entries), 'sent': len(entries) - failed, 'failed': failed}
@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from .qr_generator import get_qr_cache
+
+
+def build_qr_email(submission, connection=None):
+    """
+    Build the gate entry QR code email for a submission
+
+    Args:
+        submission: GateEntrySubmission instance
+        connection: Optional email backend connection to send through
+
+    Returns:
+        EmailMultiAlternatives: Message with HTML alternative and QR attachment
+    """
+    subject = f"Gate Entry QR Code - {submission.vehicle.vehicleRegistrationNo}"
+
+    html_body = f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {{
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }}
+        .container {{
+            max-width: 600px;
+            margin: 0 auto;
+            padding: 20px;
+        }}
+        .header {{
+            background-color: #2563eb;
+            color: white;
+            padding: 20px;
+            text-align: center;
+            border-radius: 8px 8px 0 0;
+        }}
+        .content {{
+            background-color: #f9fafb;
+            padding: 30px;
+            border-radius: 0 0 8px 8px;
+        }}
+        .qr-container {{
+            text-align: center;
+            margin: 30px 0;
+            padding: 20px;
+            background-color: white;
+            border-radius: 8px;
+        }}
+        .info-box {{
+            background-color: #eff6ff;
+            border-left: 4px solid #2563eb;
+            padding: 15px;
+            margin: 20px 0;
+        }}
+        .footer {{
+            text-align: center;
+            color: #6b7280;
+            font-size: 12px;
+            margin-top: 30px;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🚛 Gate Entry QR Code</h1>
+        </div>
+        <div class="content">
+            <p>Dear Customer,</p>
+            
+            <p>Your gate entry QR code has been generated successfully!</p>
+            
+            <div class="info-box">
+                <strong>Entry Details:</strong><br>
+                Vehicle Number: <strong>{submission.vehicle.vehicleRegistrationNo}</strong><br>
+                Driver: {submission.driver.name} ({submission.driver.phoneNo})<br>
+                {f'Helper: {submission.helper.name} ({submission.helper.phoneNo})<br>' if submission.helper else ''}
+                Generated: {submission.created_at.strftime('%B %d, %Y at %I:%M %p')}
+            </div>
+            
+            <div class="qr-container">
+                <p><strong>Your QR Code:</strong></p>
+                <p style="color: #6b7280; font-size: 14px;">
+                    (QR code image is attached to this email)
+                </p>
+            </div>
+            
+            <div class="info-box" style="background-color: #fef3c7; border-left-color: #f59e0b;">
+                <strong>⚠️ Important Instructions:</strong>
+                <ul style="margin: 10px 0;">
+                    <li>Present this QR code at the gate entrance</li>
+                    <li>Keep both digital and printed copies handy</li>
+                    <li>The driver will receive a token number upon scanning</li>
+                    <li>This QR code is valid for single entry</li>
+                </ul>
+            </div>
+            
+            <p>If you have any questions, please contact our support team.</p>
+            
+            <p>Best regards,<br>
+            <strong>Gate Entry System</strong></p>
+        </div>
+        <div class="footer">
+            <p>This is an automated email. Please do not reply to this message.</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+    # Plain text fallback
+    text_body = f"""
+Dear Customer,
+
+Your gate entry QR code has been generated successfully.
+
+Entry Details:
+- Vehicle Number: {submission.vehicle.vehicleRegistrationNo}
+- Driver: {submission.driver.name} ({submission.driver.phoneNo})
+{f'- Helper: {submission.helper.name} ({submission.helper.phoneNo})' if submission.helper else ''}
+- Generated: {submission.created_at.strftime('%B %d, %Y at %I:%M %p')}
+
+Important Instructions:
+✓ Present this QR code at the gate entrance
+✓ Keep both digital and printed copies handy
+✓ The driver will receive a token number upon scanning
+✓ This QR code is valid for single entry
+
+Best regards,
+Customer Web Portal
+"""
+
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_body,
+        from_email=settings.EMAIL_HOST_USER,
+        to=[submission.customer_email],
+        connection=connection,
+    )
+
+    # Attach HTML version
+    email.attach_alternative(html_body, "text/html")
+
+    # Attach QR code image
+    if submission.po_tagging_id:
+        png = get_qr_cache().get_or_render(submission.qr_payload_hash, submission.qr_payload())
+        email.attach(f"qr_{submission.vehicle.vehicleRegistrationNo}.png", png, 'image/png')
+    elif submission.qr_code_image:
+        email.attach_file(submission.qr_code_image.path)
+
+    return email
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from submissions.sms_dispatcher import QRSMSDispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued gate pass SMS for drivers and helpers from the SMSOutbox table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process a single batch and exit')
+        parser.add_argument('--batch-size', type=int, default=None, help='Entries claimed per batch')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent gateway requests')
+        parser.add_argument('--rate', type=float, default=None, help='Messages per second allowed by the provider')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty')
+
+    def handle(self, *args, **options):
+        dispatcher = QRSMSDispatcher(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            rate_per_second=options['rate']
+        )
+
+        try:
+            while True:
+                result = dispatcher.run_once()
+                if result['claimed']:
+                    self.stdout.write(
+                        f"Claimed {result['claimed']} in {result['requests']} requests: "
+                        f"{result['sent']} sent, {result['failed']} failed"
+                    )
+                if options['once']:
+                    break
+                # Keep draining while batches come back full
+                if result['claimed'] < dispatcher.batch_size:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping QR SMS dispatcher")
+        finally:
+            dispatcher.close()
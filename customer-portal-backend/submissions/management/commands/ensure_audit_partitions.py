@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from submissions.audit import ensure_audit_partitions, get_audit_writer, month_start, next_month
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly AuditLog partitions and replay spooled audit events"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future months to create partitions for')
+        parser.add_argument('--skip-replay', action='store_true', help='Do not replay the audit spool directory')
+
+    def handle(self, *args, **options):
+        months = [month_start(timezone.now())]
+        for _ in range(options['months_ahead']):
+            months.append(next_month(months[-1]))
+
+        created = ensure_audit_partitions(months)
+        for name in created:
+            self.stdout.write(f"Created partition {name}")
+        if not created:
+            self.stdout.write("All audit partitions already exist")
+
+        if not options['skip_replay']:
+            replayed = get_audit_writer().replay_spool()
+            if replayed:
+                self.stdout.write(f"Replayed {replayed} spooled audit events")
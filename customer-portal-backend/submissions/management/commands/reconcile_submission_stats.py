@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from submissions.models import SubmissionDailyStat
+
+
+class Command(BaseCommand):
+    help = "Recount the SubmissionDailyStat rollup from GateEntrySubmission"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Recount this many recent days')
+        parser.add_argument('--all', action='store_true', help='Recount every day')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else SubmissionDailyStat.today() - timedelta(days=options['days'])
+        fixed = SubmissionDailyStat.reconcile(since=since)
+        scope = "all days" if since is None else f"days since {since}"
+        self.stdout.write(f"Reconciled {scope}: {fixed} rollup rows corrected")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from submissions.sms_stub import StubSMSGatewayServer
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in SMS gateway for development and load benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8025, help='Port to listen on')
+        parser.add_argument('--rate', type=float, default=None, help='Simulated provider quota in messages per second')
+        parser.add_argument('--burst', type=int, default=None, help='Simulated provider burst size')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+
+    def handle(self, *args, **options):
+        stub = StubSMSGatewayServer(
+            port=options['port'],
+            rate=options['rate'],
+            burst=options['burst'],
+            latency=options['latency']
+        )
+        self.stdout.write(
+            f"Stub SMS gateway listening on {stub.url}\n"
+            f"Use SMS_GATEWAY=submissions.sms.HTTPSMSGateway SMS_GATEWAY_URL={stub.url}"
+        )
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
+            self.stdout.write(
+                f"{stub.requests} requests, {len(stub.delivered)} delivered, "
+                f"{stub.duplicates} duplicates, {stub.throttled} throttled"
+            )
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-16 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podrivervehicletagging', '0001_initial'),
+        ('submissions', '0004_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gateentrysubmission',
+            name='po_tagging',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='submissions', to='podrivervehicletagging.podrivervehicletagging'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-16 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0005_gateentrysubmission_po_tagging'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gateentrysubmission',
+            index=models.Index(fields=['created_at', 'id'], name='GateEntrySu_created_276423_idx'),
+        ),
+    ]
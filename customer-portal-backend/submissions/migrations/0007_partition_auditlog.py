@@ -0,0 +1,147 @@
+# Generated by Django 4.2 on 2026-10-16 19:03
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Rebuild AuditLog as a table range-partitioned by month on "timestamp".
+# Partitioned tables need the partition key in the primary key, so the
+# database primary key becomes ("id", "timestamp"); Django keeps treating
+# "id" as the primary key.
+PARTITION_SQL = """
+ALTER TABLE "AuditLog" RENAME TO "AuditLog_legacy";
+
+CREATE SEQUENCE "AuditLog_event_id_seq";
+
+CREATE TABLE "AuditLog" (
+    "id" bigint NOT NULL DEFAULT nextval('"AuditLog_event_id_seq"'),
+    "action" varchar(100) NOT NULL,
+    "description" text NOT NULL,
+    "user_email" varchar(254) NULL,
+    "ip_address" inet NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    "submission_id" bigint NULL,
+    "reference_type" varchar(50) NULL,
+    "reference_id" varchar(100) NULL,
+    PRIMARY KEY ("id", "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+ALTER SEQUENCE "AuditLog_event_id_seq" OWNED BY "AuditLog"."id";
+
+-- Safety net for events outside the pre-created months
+CREATE TABLE "AuditLog_default" PARTITION OF "AuditLog" DEFAULT;
+
+DO $$
+DECLARE
+    month_start date := date_trunc('month', LEAST(
+        COALESCE((SELECT min("timestamp") FROM "AuditLog_legacy"), now()), now()
+    ));
+    last_month date := date_trunc('month', now() + interval '3 months');
+BEGIN
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF "AuditLog" FOR VALUES FROM (%L) TO (%L)',
+            'AuditLog_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM'),
+            month_start,
+            month_start + interval '1 month'
+        );
+        month_start := month_start + interval '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO "AuditLog" ("id", "action", "description", "user_email", "ip_address", "timestamp", "submission_id")
+SELECT "id", "action", "description", "user_email", "ip_address", "timestamp", "submission_id"
+FROM "AuditLog_legacy";
+
+SELECT setval('"AuditLog_event_id_seq"', COALESCE(max("id"), 0) + 1, false) FROM "AuditLog";
+
+DROP TABLE "AuditLog_legacy";
+
+CREATE INDEX "AuditLog_timestamp_brin" ON "AuditLog" USING brin ("timestamp");
+CREATE INDEX "AuditLog_submission_ts_idx" ON "AuditLog" ("submission_id", "timestamp");
+CREATE INDEX "AuditLog_user_email_ts_idx" ON "AuditLog" ("user_email", "timestamp");
+CREATE INDEX "AuditLog_reference_idx" ON "AuditLog" ("reference_type", "reference_id");
+"""
+
+# Events without a submission have no place in the old schema and are dropped
+UNPARTITION_SQL = """
+CREATE TABLE "AuditLog_plain" (
+    "id" bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    "action" varchar(100) NOT NULL,
+    "description" text NOT NULL,
+    "user_email" varchar(254) NULL,
+    "ip_address" inet NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    "submission_id" bigint NOT NULL
+        REFERENCES "GateEntrySubmission" ("id") DEFERRABLE INITIALLY DEFERRED
+);
+
+INSERT INTO "AuditLog_plain" ("id", "action", "description", "user_email", "ip_address", "timestamp", "submission_id")
+SELECT "id", "action", "description", "user_email", "ip_address", "timestamp", "submission_id"
+FROM "AuditLog"
+WHERE "submission_id" IN (SELECT "id" FROM "GateEntrySubmission");
+
+SET CONSTRAINTS ALL IMMEDIATE;
+
+SELECT setval(pg_get_serial_sequence('"AuditLog_plain"', 'id'), COALESCE(max("id"), 0) + 1, false)
+FROM "AuditLog_plain";
+
+DROP TABLE "AuditLog";
+ALTER TABLE "AuditLog_plain" RENAME TO "AuditLog";
+CREATE INDEX ON "AuditLog" ("submission_id");
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='auditlog',
+                    name='reference_id',
+                    field=models.CharField(blank=True, max_length=100, null=True),
+                ),
+                migrations.AddField(
+                    model_name='auditlog',
+                    name='reference_type',
+                    field=models.CharField(blank=True, max_length=50, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='auditlog',
+                    name='submission',
+                    field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='audit_logs', to='submissions.gateentrysubmission'),
+                ),
+                migrations.AlterField(
+                    model_name='auditlog',
+                    name='timestamp',
+                    field=models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                migrations.AddIndex(
+                    model_name='auditlog',
+                    index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='AuditLog_timestamp_brin'),
+                ),
+                migrations.AddIndex(
+                    model_name='auditlog',
+                    index=models.Index(fields=['submission', 'timestamp'], name='AuditLog_submission_ts_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='auditlog',
+                    index=models.Index(fields=['user_email', 'timestamp'], name='AuditLog_user_email_ts_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='auditlog',
+                    index=models.Index(fields=['reference_type', 'reference_id'], name='AuditLog_reference_idx'),
+                ),
+            ],
+        ),
+    ]
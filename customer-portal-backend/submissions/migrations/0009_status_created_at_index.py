@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-16 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0008_smsoutbox'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gateentrysubmission',
+            name='GateEntrySu_status_8f4e8a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='gateentrysubmission',
+            index=models.Index(fields=['status', 'created_at'], name='GateEntrySu_status_ba2308_idx'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 4.2 on 2026-10-16 19:11
+
+from django.db import migrations, models
+
+
+# Keep SubmissionDailyStat in step with GateEntrySubmission. Statement-level
+# triggers with transition tables fold a whole bulk insert or bulk status
+# change into one upsert per (day, status, customer_email) key.
+STATS_TRIGGER_SQL = """
+CREATE FUNCTION "GateEntrySubmission_apply_stats"() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+        SELECT "created_at"::date, "status", "customer_email", count(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT ("day", "status", "customer_email")
+        DO UPDATE SET "count" = "SubmissionDailyStat"."count" + EXCLUDED."count";
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+        SELECT "created_at"::date, "status", "customer_email", -count(*)
+        FROM old_rows
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT ("day", "status", "customer_email")
+        DO UPDATE SET "count" = "SubmissionDailyStat"."count" + EXCLUDED."count";
+    ELSE
+        INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+        SELECT "day", "status", "customer_email", sum(delta)
+        FROM (
+            SELECT n."created_at"::date AS "day", n."status", n."customer_email", 1 AS delta
+            FROM old_rows o JOIN new_rows n ON n."id" = o."id"
+            WHERE (o."status", o."customer_email", o."created_at"::date)
+                  IS DISTINCT FROM (n."status", n."customer_email", n."created_at"::date)
+            UNION ALL
+            SELECT o."created_at"::date, o."status", o."customer_email", -1
+            FROM old_rows o JOIN new_rows n ON n."id" = o."id"
+            WHERE (o."status", o."customer_email", o."created_at"::date)
+                  IS DISTINCT FROM (n."status", n."customer_email", n."created_at"::date)
+        ) deltas
+        GROUP BY 1, 2, 3
+        HAVING sum(delta) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT ("day", "status", "customer_email")
+        DO UPDATE SET "count" = "SubmissionDailyStat"."count" + EXCLUDED."count";
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER "GateEntrySubmission_stats_insert"
+    AFTER INSERT ON "GateEntrySubmission"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION "GateEntrySubmission_apply_stats"();
+
+CREATE TRIGGER "GateEntrySubmission_stats_update"
+    AFTER UPDATE ON "GateEntrySubmission"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION "GateEntrySubmission_apply_stats"();
+
+CREATE TRIGGER "GateEntrySubmission_stats_delete"
+    AFTER DELETE ON "GateEntrySubmission"
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION "GateEntrySubmission_apply_stats"();
+
+INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+SELECT "created_at"::date, "status", "customer_email", count(*)
+FROM "GateEntrySubmission"
+GROUP BY 1, 2, 3;
+"""
+
+DROP_STATS_TRIGGER_SQL = """
+DROP TRIGGER "GateEntrySubmission_stats_insert" ON "GateEntrySubmission";
+DROP TRIGGER "GateEntrySubmission_stats_update" ON "GateEntrySubmission";
+DROP TRIGGER "GateEntrySubmission_stats_delete" ON "GateEntrySubmission";
+DROP FUNCTION "GateEntrySubmission_apply_stats"();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0009_status_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('completed', 'Completed')], max_length=20)),
+                ('customer_email', models.EmailField(max_length=254)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Submission Daily Stat',
+                'verbose_name_plural': 'Submission Daily Stats',
+                'db_table': 'SubmissionDailyStat',
+                'ordering': ['-day', 'status'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='submissiondailystat',
+            index=models.Index(fields=['customer_email', 'day'], name='SubmissionD_custome_1b1a0e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='submissiondailystat',
+            constraint=models.UniqueConstraint(fields=('day', 'status', 'customer_email'), name='SubmissionDailyStat_key'),
+        ),
+        migrations.RunSQL(STATS_TRIGGER_SQL, reverse_sql=DROP_STATS_TRIGGER_SQL),
+    ]
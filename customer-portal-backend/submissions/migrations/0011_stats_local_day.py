@@ -0,0 +1,89 @@
+# Generated by Django 4.2 on 2026-10-17 09:40
+
+from django.conf import settings
+from django.db import migrations
+
+
+# Bucket submissions by their calendar day in settings.TIME_ZONE rather than
+# the session time zone, so rows written from any connection land on the
+# same day the stats endpoint and reconcile_submission_stats use.
+STATS_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION "GateEntrySubmission_apply_stats"() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+        SELECT {day}, "status", "customer_email", count(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT ("day", "status", "customer_email")
+        DO UPDATE SET "count" = "SubmissionDailyStat"."count" + EXCLUDED."count";
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+        SELECT {day}, "status", "customer_email", -count(*)
+        FROM old_rows
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT ("day", "status", "customer_email")
+        DO UPDATE SET "count" = "SubmissionDailyStat"."count" + EXCLUDED."count";
+    ELSE
+        INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+        SELECT "day", "status", "customer_email", sum(delta)
+        FROM (
+            SELECT {new_day} AS "day", n."status", n."customer_email", 1 AS delta
+            FROM old_rows o JOIN new_rows n ON n."id" = o."id"
+            WHERE (o."status", o."customer_email", {old_day})
+                  IS DISTINCT FROM (n."status", n."customer_email", {new_day})
+            UNION ALL
+            SELECT {old_day}, o."status", o."customer_email", -1
+            FROM old_rows o JOIN new_rows n ON n."id" = o."id"
+            WHERE (o."status", o."customer_email", {old_day})
+                  IS DISTINCT FROM (n."status", n."customer_email", {new_day})
+        ) deltas
+        GROUP BY 1, 2, 3
+        HAVING sum(delta) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT ("day", "status", "customer_email")
+        DO UPDATE SET "count" = "SubmissionDailyStat"."count" + EXCLUDED."count";
+    END IF;
+    RETURN NULL;
+END $$;
+
+DELETE FROM "SubmissionDailyStat";
+INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+SELECT {day}, "status", "customer_email", count(*)
+FROM "GateEntrySubmission"
+GROUP BY 1, 2, 3;
+"""
+
+
+def stats_function_sql(time_zone=None):
+    """
+    Trigger function and rollup rebuild bucketing by days in time_zone
+    (the session time zone when None, as migration 0010 did)
+    """
+    def day(column):
+        if time_zone is None:
+            return f'{column}::date'
+        return "(%s AT TIME ZONE '%s')::date" % (column, time_zone.replace("'", "''"))
+
+    return STATS_FUNCTION_SQL.format(
+        day=day('"created_at"'),
+        new_day=day('n."created_at"'),
+        old_day=day('o."created_at"')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0010_submissiondailystat'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            stats_function_sql(settings.TIME_ZONE),
+            reverse_sql=stats_function_sql()
+        ),
+    ]
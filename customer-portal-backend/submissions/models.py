@@ -1,8 +1,16 @@
-from django.db import models
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db import models, connection, transaction
+from django.contrib.postgres.indexes import BrinIndex
+from django.urls import reverse
+from django.utils import timezone
 from vehicles.models import VehicleDetails
 from drivers.models import DriverHelper
+from podrivervehicletagging.models import PODriverVehicleTagging
 import hashlib
 import json
+import uuid
 
 class GateEntrySubmission(models.Model):
     """
@@ -33,8 +41,17 @@ class GateEntrySubmission(models.Model):
         blank=True
     )
 
+    # PO tagging encoded in the QR payload
+    po_tagging = models.ForeignKey(
+        PODriverVehicleTagging,
+        on_delete=models.SET_NULL,
+        related_name='submissions',
+        null=True,
+        blank=True
+    )
+
     # QR Code
-    qr_code_image = models.ImageField(upload_to='qr_codes/', null=True, blank=True)
+    qr_code_image = models.ImageField(upload_to='qr_codes/', null=True, blank=True)  # Legacy pre-rendered images
     qr_payload_hash = models.CharField(max_length=64, unique=True)  # SHA-256 hash
 
     # Status
@@ -46,6 +63,17 @@ class GateEntrySubmission(models.Model):
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
+    # Legal status changes; 'completed' is normally reached by scanning the QR code at the gate
+    TRANSITIONS = {
+        'pending': ('approved', 'rejected', 'completed'),
+        'approved': ('completed', 'rejected'),
+        'rejected': (),
+        'completed': (),
+    }
+
+    # Most rows bulk_transition changes per call when selecting by a created_at window
+    BULK_TRANSITION_MAX_ROWS = 1000
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -58,12 +86,103 @@ class GateEntrySubmission(models.Model):
         indexes = [
             models.Index(fields=['customer_email']),
             models.Index(fields=['qr_payload_hash']),
-            models.Index(fields=['status']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_at', 'id']),  # Keyset pagination
         ]
 
     def __str__(self):
         return f"Submission {self.id} - {self.vehicle.vehicle_registration_no}"
 
+    def qr_payload(self):
+        """
+        Payload encoded in the gate entry QR code
+        """
+        return {'id': self.po_tagging_id}
+
+    @classmethod
+    def statuses_leading_to(cls, to_status):
+        """
+        Statuses from which to_status can be reached
+        """
+        return tuple(status for status, targets in cls.TRANSITIONS.items() if to_status in targets)
+
+    @classmethod
+    def bulk_transition(cls, to_status, ids=None, from_status=None, created_after=None, created_before=None,
+                        limit=None):
+        """
+        Move many submissions to to_status with one UPDATE
+
+        Only rows whose current status may legally move to to_status are
+        touched; the WHERE clause filters on the current status, so rows that
+        another request already moved are skipped rather than overwritten.
+        Rows are selected by ids, or by a created_at window (served by the
+        (status, created_at) index) and optionally from_status. A window
+        selection changes at most `limit` rows (BULK_TRANSITION_MAX_ROWS by
+        default), oldest first; calling again continues with the rest.
+
+        Raises:
+            ValueError: Neither ids nor both ends of the window were given
+
+        Returns:
+            list: (id, previous_status, updated_at, customer_email, created_at)
+            for every row that changed
+        """
+        if ids is None and (created_after is None or created_before is None):
+            raise ValueError("bulk_transition needs ids or a created_at window")
+        if ids is None and limit is None:
+            limit = cls.BULK_TRANSITION_MAX_ROWS
+
+        allowed = cls.statuses_leading_to(to_status)
+        if from_status is not None:
+            allowed = tuple(status for status in allowed if status == from_status)
+        if not allowed:
+            return []
+
+        conditions = ['"status" IN %(allowed)s']
+        params = {'to_status': to_status, 'allowed': allowed, 'now': timezone.now()}
+        if ids is not None:
+            conditions.append('"id" = ANY(%(ids)s)')
+            params['ids'] = list(ids)
+        if created_after is not None:
+            conditions.append('"created_at" >= %(created_after)s')
+            params['created_after'] = created_after
+        if created_before is not None:
+            conditions.append('"created_at" < %(created_before)s')
+            params['created_before'] = created_before
+        if limit is not None:
+            params['limit'] = limit
+
+        # The FROM subquery locks the matching rows and keeps their old status for RETURNING
+        sql = f"""
+            UPDATE "GateEntrySubmission" AS s
+            SET "status" = %(to_status)s, "updated_at" = %(now)s
+            FROM (
+                SELECT "id", "status" FROM "GateEntrySubmission"
+                WHERE {' AND '.join(conditions)}
+                ORDER BY "id"
+                {'LIMIT %(limit)s' if limit is not None else ''}
+                FOR UPDATE
+            ) AS previous
+            WHERE s."id" = previous."id" AND s."status" = previous."status"
+            RETURNING s."id", previous."status", s."updated_at", s."customer_email", s."created_at"
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def get_qr_code_url(self, request=None):
+        """
+        URL of the QR image: rendered on demand from the QR cache, or the
+        legacy pre-rendered file for submissions created before the cache
+        """
+        if self.po_tagging_id:
+            url = reverse('submission-qr-image', kwargs={'payload_hash': self.qr_payload_hash})
+        elif self.qr_code_image:
+            url = self.qr_code_image.url
+        else:
+            return None
+        return request.build_absolute_uri(url) if request else url
+
     def generate_payload_hash(self):
         """
         Generate SHA-256 hash of QR payload for uniqueness
@@ -84,24 +203,228 @@ class GateEntrySubmission(models.Model):
 
 class AuditLog(models.Model):
     """
-    Audit trail for all submission activities
+    Audit trail for all submission and document activities
+
+    Rows are written in batches by submissions.audit.AuditLogWriter. The table
+    is range-partitioned by month on timestamp (primary key is (id, timestamp)
+    at the database level, see migration 0007), so the submission reference
+    has no database constraint.
     """
     submission = models.ForeignKey(
         GateEntrySubmission,
-        on_delete=models.CASCADE,
-        related_name='audit_logs'
+        on_delete=models.DO_NOTHING,
+        related_name='audit_logs',
+        null=True,
+        blank=True,
+        db_constraint=False,
+        db_index=False
     )
     action = models.CharField(max_length=100)
     description = models.TextField()
     user_email = models.EmailField(blank=True, null=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+
+    # Other object the event is about, e.g. ('DocumentControl', '42') or ('PODetails', 'PO123')
+    reference_type = models.CharField(max_length=50, blank=True, null=True)
+    reference_id = models.CharField(max_length=100, blank=True, null=True)
+
+    # Event time, set when the event is buffered rather than when it is flushed
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'AuditLog'
         verbose_name = 'Audit Log'
         verbose_name_plural = 'Audit Logs'
         ordering = ['-timestamp']
+        indexes = [
+            BrinIndex(fields=['timestamp'], name='AuditLog_timestamp_brin'),
+            models.Index(fields=['submission', 'timestamp'], name='AuditLog_submission_ts_idx'),
+            models.Index(fields=['user_email', 'timestamp'], name='AuditLog_user_email_ts_idx'),
+            models.Index(fields=['reference_type', 'reference_id'], name='AuditLog_reference_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.action} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.action} - {self.timestamp}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Outbound QR code emails, written in the same transaction as the submission
+    and delivered by the dispatch_qr_emails worker
+    """
+    submission = models.ForeignKey(
+        GateEntrySubmission,
+        on_delete=models.CASCADE,
+        related_name='email_outbox'
+    )
+    recipient = models.EmailField()
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Lease held by a dispatcher while sending
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'EmailOutbox'
+        verbose_name = 'Email Outbox Entry'
+        verbose_name_plural = 'Email Outbox'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Email {self.id} to {self.recipient} ({self.status})"
+
+
+class SMSOutbox(models.Model):
+    """
+    Outbound gate pass SMS for drivers and helpers, written in the same
+    transaction as the submission and delivered by the dispatch_qr_sms worker
+
+    message_id is sent to the gateway with every attempt, so a retry after a
+    lost response is recognised as a duplicate instead of a second SMS.
+    """
+    submission = models.ForeignKey(
+        GateEntrySubmission,
+        on_delete=models.CASCADE,
+        related_name='sms_outbox'
+    )
+    recipient = models.CharField(max_length=20)
+    language = models.CharField(max_length=5, default='en')
+    message_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Lease held by a dispatcher while sending
+    last_error = models.TextField(blank=True, null=True)
+    provider_message_id = models.CharField(max_length=100, blank=True, null=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'SMSOutbox'
+        verbose_name = 'SMS Outbox Entry'
+        verbose_name_plural = 'SMS Outbox'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"SMS {self.id} to {self.recipient} ({self.status})"
+
+
+class SubmissionDailyStat(models.Model):
+    """
+    Submission counts per day, status and customer email
+
+    Maintained inside the same transaction as every insert, update and delete
+    on GateEntrySubmission by statement-level database triggers (migrations
+    0010 and 0011), so bulk_create, queryset updates and raw SQL are all
+    counted. reconcile_submission_stats rebuilds recent days from the source
+    table. Days are calendar days in settings.TIME_ZONE, whatever the session
+    time zone of the writer; changing TIME_ZONE needs the trigger function
+    regenerated (see migration 0011) and a full reconcile.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=GateEntrySubmission.STATUS_CHOICES)
+    customer_email = models.EmailField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'SubmissionDailyStat'
+        verbose_name = 'Submission Daily Stat'
+        verbose_name_plural = 'Submission Daily Stats'
+        ordering = ['-day', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'status', 'customer_email'],
+                name='SubmissionDailyStat_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['customer_email', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.customer_email} {self.status}: {self.count}"
+
+    @staticmethod
+    def today():
+        """
+        Current day in settings.TIME_ZONE, the calendar the rollup uses
+        """
+        return datetime.now(ZoneInfo(settings.TIME_ZONE)).date()
+
+    @classmethod
+    def reconcile(cls, since=None):
+        """
+        Recount days on or after since (all days if None) from GateEntrySubmission
+
+        Writers are held off with a SHARE lock while the days are recounted so
+        the triggers and the recount cannot interleave.
+
+        Returns:
+            int: Number of rollup rows that were wrong or missing
+        """
+        params = {'since': since, 'time_zone': settings.TIME_ZONE}
+        day = '("created_at" AT TIME ZONE %(time_zone)s)::date'
+        day_filter = f'WHERE {day} >= %(since)s' if since else ''
+        stat_filter = 'AND "day" >= %(since)s' if since else ''
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE "GateEntrySubmission" IN SHARE MODE')
+            cursor.execute(f"""
+                WITH actual AS (
+                    SELECT {day} AS "day", "status", "customer_email",
+                           count(*)::integer AS "count"
+                    FROM "GateEntrySubmission"
+                    {day_filter}
+                    GROUP BY 1, 2, 3
+                ), removed AS (
+                    DELETE FROM "SubmissionDailyStat" s
+                    WHERE s."count" <> 0 {stat_filter}
+                      AND NOT EXISTS (
+                          SELECT 1 FROM actual a
+                          WHERE a."day" = s."day" AND a."status" = s."status"
+                            AND a."customer_email" = s."customer_email"
+                      )
+                    RETURNING 1
+                ), upserted AS (
+                    INSERT INTO "SubmissionDailyStat" ("day", "status", "customer_email", "count")
+                    SELECT a."day", a."status", a."customer_email", a."count"
+                    FROM actual a
+                    LEFT JOIN "SubmissionDailyStat" s
+                      ON s."day" = a."day" AND s."status" = a."status"
+                     AND s."customer_email" = a."customer_email"
+                    WHERE s."count" IS DISTINCT FROM a."count"
+                    ON CONFLICT ("day", "status", "customer_email")
+                    DO UPDATE SET "count" = EXCLUDED."count"
+                    RETURNING 1
+                )
+                SELECT (SELECT count(*) FROM removed) + (SELECT count(*) FROM upserted)
+            """, params)
+            fixed = cursor.fetchone()[0]
+            cursor.execute(f'DELETE FROM "SubmissionDailyStat" WHERE "count" = 0 {stat_filter}', params)
+        return fixed
@@ -1,21 +1,48 @@
 import qrcode
 from io import BytesIO
-from django.core.files import File
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from documents.storage import get_document_storage
+import hashlib
 import json
+import logging
+import multiprocessing
+import os
+import threading
 
-def generate_qr_code(payload_data):
+logger = logging.getLogger(__name__)
+
+
+def qr_payload_hash(payload_data):
     """
-    Generate QR code image from payload data
-    
+    Content address of a QR payload
+
     Args:
         payload_data (dict): Dictionary containing QR payload
-        
+
+    Returns:
+        str: SHA-256 hex digest of the canonical JSON payload
+    """
+    payload_json = json.dumps(payload_data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload_json.encode()).hexdigest()
+
+
+def render_qr_png(payload_data):
+    """
+    Render QR code PNG bytes from payload data
+
+    Args:
+        payload_data (dict): Dictionary containing QR payload
+
     Returns:
-        File: Django File object containing QR code image
+        bytes: PNG encoded QR code image
     """
     # Create JSON string from payload
     payload_json = json.dumps(payload_data, indent=2)
-    
+
     # Generate QR code
     qr = qrcode.QRCode(
         version=1,
@@ -25,15 +52,184 @@ def generate_qr_code(payload_data):
     )
     qr.add_data(payload_json)
     qr.make(fit=True)
-    
+
     # Create image
     img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to BytesIO
+
     buffer = BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    # Convert to Django File
-    filename = f"qr_{payload_data.get('vehicle_number', 'code')}.png"
-    return File(buffer, name=filename)
\ No newline at end of file
+    return buffer.getvalue()
+
+
+def render_qr_pngs(payloads):
+    """
+    Render a chunk of payloads, in a pre-render worker process
+    """
+    return [render_qr_png(payload_data) for payload_data in payloads]
+
+
+class QRCodeCache:
+    """
+    Lazily rendered QR images keyed by payload hash
+
+    Lookups go through a bounded in-memory LRU first and then a
+    content-addressed directory (<dir>/<hash[:2]>/<hash>.png) in document
+    storage. Images are only rendered on a miss in both, so creating a
+    submission never encodes a PNG. Bulk pre-renders run in the background
+    on a long-lived pool of `workers` processes (0 disables them).
+    """
+
+    def __init__(self, directory, max_items=1024, workers=0):
+        self.directory = str(directory)
+        self.max_items = max_items
+        self.workers = workers
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = os.getpid()
+
+    def _get_pool(self):
+        if self._pid != os.getpid():
+            # Forked child: the parent's pool does not carry over
+            self._pid = os.getpid()
+            self._pool = None
+        if self._pool is None:
+            # spawn: forking a threaded server process with open DB connections is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def path_for(self, payload_hash):
+        return os.path.join(self.directory, payload_hash[:2], f"{payload_hash}.png")
+
+    def _remember(self, payload_hash, png):
+        with self._lock:
+            self._items[payload_hash] = png
+            self._items.move_to_end(payload_hash)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, payload_hash):
+        """
+        Return cached PNG bytes without rendering, or None on a miss
+        """
+        with self._lock:
+            png = self._items.get(payload_hash)
+            if png is not None:
+                self._items.move_to_end(payload_hash)
+                return png
+
+        try:
+            with get_document_storage().open(self.path_for(payload_hash)) as f:
+                png = f.read()
+        except FileNotFoundError:
+            return None
+
+        self._remember(payload_hash, png)
+        return png
+
+    def get_or_render(self, payload_hash, payload_data):
+        """
+        Return PNG bytes for a payload, rendering and storing them on a miss
+        """
+        png = self.get(payload_hash)
+        if png is not None:
+            return png
+
+        png = render_qr_png(payload_data)
+        self.store(payload_hash, png)
+        return png
+
+    def store(self, payload_hash, png):
+        """
+        Write rendered PNG bytes to document storage and the in-memory LRU
+        """
+        # Storage writes are atomic, so readers never see a partial image
+        get_document_storage().save(self.path_for(payload_hash), [png], 'image/png')
+
+        self._remember(payload_hash, png)
+
+    def prerender(self, items):
+        """
+        Start rendering many payloads in the background
+
+        Payloads are rendered in chunks on the worker pool and stored as each
+        chunk completes; the caller does not wait for them. Payloads still
+        missing when a reader asks are rendered on demand by get_or_render.
+
+        Args:
+            items: Iterable of (payload_hash, payload_data) pairs
+
+        Returns:
+            list: One future per chunk, resolved with the number of images
+            stored once it is in the cache; empty when disabled
+        """
+        if not self.workers:
+            return []
+        with self._lock:
+            missing = [(payload_hash, payload_data) for payload_hash, payload_data in items
+                       if payload_hash not in self._items]
+            if not missing:
+                return []
+            pool = self._get_pool()
+
+        chunksize = max(len(missing) // (self.workers * 4), 1)
+        futures = []
+        for start in range(0, len(missing), chunksize):
+            chunk = missing[start:start + chunksize]
+            stored = Future()
+            pool.submit(render_qr_pngs, [payload_data for _, payload_data in chunk]).add_done_callback(
+                lambda rendered, chunk=chunk, stored=stored: self._prerendered(chunk, rendered, stored)
+            )
+            futures.append(stored)
+        return futures
+
+    def _prerendered(self, chunk, rendered, stored):
+        if rendered.cancelled():
+            stored.cancel()
+            return
+        try:
+            for (payload_hash, _), png in zip(chunk, rendered.result()):
+                self.store(payload_hash, png)
+        except Exception as e:
+            logger.warning("QR pre-render failed, images will render on demand: %s", e)
+            stored.set_exception(e)
+        else:
+            stored.set_result(len(chunk))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_qr_cache = None
+_qr_cache_lock = threading.Lock()
+
+
+def get_qr_cache():
+    """
+    Process-wide QRCodeCache configured from settings
+    """
+    global _qr_cache
+    if _qr_cache is None:
+        with _qr_cache_lock:
+            if _qr_cache is None:
+                _qr_cache = QRCodeCache(
+                    settings.QR_CACHE_DIR,
+                    max_items=settings.QR_CACHE_MAX_ITEMS,
+                    workers=settings.QR_PRERENDER_WORKERS
+                )
+    return _qr_cache
+
+
+@receiver(setting_changed)
+def reset_qr_cache(setting, **kwargs):
+    global _qr_cache
+    if setting.startswith('QR_CACHE_') or setting == 'QR_PRERENDER_WORKERS':
+        with _qr_cache_lock:
+            if _qr_cache is not None:
+                _qr_cache.close()
+            _qr_cache = None
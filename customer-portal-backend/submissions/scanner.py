@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import Max, Min
+from django.dispatch import receiver
+from django.utils import timezone
+from podrivervehicletagging.models import PODriverVehicleTagging
+from .models import GateEntrySubmission
+import threading
+import time
+
+# Submission statuses that still admit a vehicle at the gate
+SCANNABLE_STATUSES = GateEntrySubmission.statuses_leading_to('completed')
+
+
+class ScanCache:
+    """
+    In-process view of recently issued gate entry QR codes
+
+    Holds the PO tagging IDs of scannable submissions issued within
+    QR_SCAN_WINDOW_HOURS and the IDs consumed recently, so replays and IDs
+    that were never issued can be rejected without a database round trip.
+
+    The snapshot is refreshed every QR_SCAN_REFRESH_SECONDS. An ID is only
+    treated as invalid when it falls inside the snapshot's settled ID range
+    (rows older than QR_SCAN_SETTLE_SECONDS), so codes issued by other worker
+    processes after the last refresh still reach the database.
+    """
+
+    PENDING = 'pending'
+    CONSUMED = 'consumed'
+    INVALID = 'invalid'
+    UNKNOWN = 'unknown'
+
+    def __init__(self, window_hours=None, refresh_seconds=None, settle_seconds=None, consumed_size=None):
+        self.window = timedelta(hours=window_hours or settings.QR_SCAN_WINDOW_HOURS)
+        self.refresh_seconds = refresh_seconds or settings.QR_SCAN_REFRESH_SECONDS
+        self.settle = timedelta(seconds=settle_seconds or settings.QR_SCAN_SETTLE_SECONDS)
+        self.consumed_size = consumed_size or settings.QR_SCAN_CONSUMED_CACHE_SIZE
+
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._consumed = OrderedDict()
+        self._low_id = None
+        self._high_id = None
+        self._refreshed_at = None
+
+    def refresh(self):
+        now = timezone.now()
+        window_start = now - self.window
+
+        pending = set(
+            GateEntrySubmission.objects
+            .filter(
+                created_at__gte=window_start,
+                status__in=SCANNABLE_STATUSES,
+                po_tagging__actReportingTime__isnull=True
+            )
+            .values_list('po_tagging_id', flat=True)
+        )
+        bounds = (
+            PODriverVehicleTagging.objects
+            .filter(created__gte=window_start, created__lt=now - self.settle)
+            .aggregate(low=Min('id'), high=Max('id'))
+        )
+
+        with self._lock:
+            self._pending = pending
+            self._low_id = bounds['low']
+            self._high_id = bounds['high']
+            self._refreshed_at = time.monotonic()
+
+    def _maybe_refresh(self):
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.refresh_seconds:
+            self.refresh()
+
+    def check(self, tagging_id):
+        """
+        Classify a scanned ID as PENDING, CONSUMED, INVALID or UNKNOWN
+
+        Only CONSUMED and INVALID are final; the others still need the
+        database to consume the code.
+        """
+        self._maybe_refresh()
+        with self._lock:
+            if tagging_id in self._consumed:
+                return self.CONSUMED
+            if tagging_id in self._pending:
+                return self.PENDING
+            if self._low_id is not None and self._low_id <= tagging_id <= self._high_id:
+                return self.INVALID
+            return self.UNKNOWN
+
+    def mark_issued(self, tagging_ids):
+        with self._lock:
+            self._pending.update(tagging_ids)
+
+    def mark_consumed(self, tagging_id):
+        with self._lock:
+            self._pending.discard(tagging_id)
+            self._consumed[tagging_id] = True
+            self._consumed.move_to_end(tagging_id)
+            while len(self._consumed) > self.consumed_size:
+                self._consumed.popitem(last=False)
+
+
+_scan_cache = None
+_scan_cache_lock = threading.Lock()
+
+
+def get_scan_cache():
+    """
+    Process-wide ScanCache configured from settings
+    """
+    global _scan_cache
+    if _scan_cache is None:
+        with _scan_cache_lock:
+            if _scan_cache is None:
+                _scan_cache = ScanCache()
+    return _scan_cache
+
+
+@receiver(setting_changed)
+def reset_scan_cache(setting, **kwargs):
+    global _scan_cache
+    if setting.startswith('QR_SCAN_'):
+        with _scan_cache_lock:
+            _scan_cache = None
+
+
+CONSUME_SQL = """
+    WITH submission AS (
+        UPDATE "GateEntrySubmission"
+        SET "status" = 'completed', "updated_at" = %(now)s
+        WHERE "qr_payload_hash" = %(hash)s
+          AND "status" IN %(statuses)s
+          AND "po_tagging_id" IN (
+              SELECT "id" FROM "PODriverVehicleTagging"
+              WHERE "id" = %(id)s AND "actReportingTime" IS NULL
+          )
+        RETURNING "id", "po_tagging_id", "vehicle_id"
+    ), tagging AS (
+        UPDATE "PODriverVehicleTagging"
+        SET "actReportingTime" = %(now)s
+        WHERE "id" IN (SELECT "po_tagging_id" FROM submission)
+        RETURNING "id", "actReportingTime"
+    )
+    SELECT s."id", t."actReportingTime", v."vehicleRegistrationNo"
+    FROM submission s
+    JOIN tagging t ON t."id" = s."po_tagging_id"
+    JOIN "VehicleDetails" v ON v."id" = s."vehicle_id"
+"""
+
+
+def consume_qr_code(tagging_id, payload_hash):
+    """
+    Atomically mark a gate entry QR code as used
+
+    Sets PODriverVehicleTagging.actReportingTime and flips the submission to
+    'completed' in one statement. Concurrent scans of the same code serialize
+    on the submission row, so only one of them succeeds.
+
+    Returns:
+        dict: submission_id, reported_at and vehicle_number, or None if the
+        code is unknown, already used or its submission is not admissible
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(CONSUME_SQL, {
+            'now': timezone.now(),
+            'hash': payload_hash,
+            'statuses': SCANNABLE_STATUSES,
+            'id': tagging_id,
+        })
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    return {'submission_id': row[0], 'reported_at': row[1], 'vehicle_number': row[2]}
@@ -1,12 +1,15 @@
 from rest_framework import serializers
+import json
 from .models import GateEntrySubmission, AuditLog
+from drivers.serializers import DriverHelperValidateSerializer
 
 class GateEntrySubmissionSerializer(serializers.ModelSerializer):
-    vehicle_number = serializers.CharField(source='vehicle.vehicle_registration_no', read_only=True)
+    # Views must select_related('vehicle', 'driver', 'helper') to avoid N+1 queries
+    vehicle_number = serializers.CharField(source='vehicle.vehicleRegistrationNo', read_only=True)
     driver_name = serializers.CharField(source='driver.name', read_only=True)
-    driver_phone = serializers.CharField(source='driver.phone_no', read_only=True)
+    driver_phone = serializers.CharField(source='driver.phoneNo', read_only=True)
     helper_name = serializers.CharField(source='helper.name', read_only=True)
-    helper_phone = serializers.CharField(source='helper.phone_no', read_only=True)
+    helper_phone = serializers.CharField(source='helper.phoneNo', read_only=True)
     qr_code_url = serializers.SerializerMethodField()
 
     class Meta:
@@ -20,10 +23,9 @@ class GateEntrySubmissionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'qr_payload_hash', 'created_at', 'updated_at']
 
     def get_qr_code_url(self, obj):
-        if obj.qr_code_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.qr_code_image.url)
+        request = self.context.get('request')
+        if request:
+            return obj.get_qr_code_url(request)
         return None
 
 class SubmissionCreateSerializer(serializers.Serializer):
@@ -49,6 +51,82 @@ class SubmissionCreateSerializer(serializers.Serializer):
     )
     helper_language = serializers.CharField(default='en', required=False)
 
+    # Only needed for drivers/helpers that are not registered yet
+    driver_uid = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    helper_uid = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+    def validate_driver_uid(self, value):
+        return DriverHelperValidateSerializer().validate_uid(value) if value else value
+
+    def validate_helper_uid(self, value):
+        return DriverHelperValidateSerializer().validate_uid(value) if value else value
+
+class BulkSubmissionCreateSerializer(serializers.Serializer):
+    MAX_ENTRIES = 200
+
+    # Entries are validated one by one so each can report its own errors
+    entries = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=MAX_ENTRIES
+    )
+
+class QRScanSerializer(serializers.Serializer):
+    # Raw scanned text ('{"id": 123}') or the already decoded object
+    payload = serializers.JSONField()
+
+    def validate_payload(self, value):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError("QR payload is not valid JSON")
+
+        if (
+            not isinstance(value, dict)
+            or set(value) != {'id'}
+            or not isinstance(value['id'], int)
+            or isinstance(value['id'], bool)
+            # Must fit the bigint primary key the scan compares against
+            or not 0 < value['id'] < 2 ** 63
+        ):
+            raise serializers.ValidationError("Invalid QR code")
+        return value
+
+class BulkStatusTransitionSerializer(serializers.Serializer):
+    MAX_IDS = 1000
+
+    # Rows are picked either by ids or by a created_at window, optionally narrowed by from_status
+    to_status = serializers.ChoiceField(choices=GateEntrySubmission.STATUS_CHOICES)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_IDS,
+        required=False
+    )
+    from_status = serializers.ChoiceField(choices=GateEntrySubmission.STATUS_CHOICES, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        to_status = attrs['to_status']
+        if not GateEntrySubmission.statuses_leading_to(to_status):
+            raise serializers.ValidationError({"to_status": f"Submissions cannot be moved to '{to_status}'"})
+
+        from_status = attrs.get('from_status')
+        if from_status and to_status not in GateEntrySubmission.TRANSITIONS[from_status]:
+            raise serializers.ValidationError({
+                "from_status": f"Cannot move submissions from '{from_status}' to '{to_status}'"
+            })
+
+        if 'ids' not in attrs:
+            created_after, created_before = attrs.get('created_after'), attrs.get('created_before')
+            if created_after is None or created_before is None:
+                raise serializers.ValidationError("Provide ids, or created_after and created_before")
+            if created_after >= created_before:
+                raise serializers.ValidationError({"created_before": "Must be later than created_after"})
+        return attrs
+
 class AuditLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = AuditLog
@@ -0,0 +1,227 @@
+import http.client
+import json
+import logging
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import SMSOutbox
+
+logger = logging.getLogger(__name__)
+
+# Gate pass text per DriverHelper.language; languages without a template use English
+SMS_TEMPLATES = {
+    'en': "Gate entry pass for vehicle {vehicle}. Show this QR code at the gate: {url}",
+    'hi': "वाहन {vehicle} के लिए गेट प्रवेश पास। गेट पर यह QR कोड दिखाएं: {url}",
+    'mr': "वाहन {vehicle} साठी गेट प्रवेश पास. गेटवर हा QR कोड दाखवा: {url}",
+    'gu': "વાહન {vehicle} માટે ગેટ પ્રવેશ પાસ. ગેટ પર આ QR કોડ બતાવો: {url}",
+    'ta': "வாகனம் {vehicle} க்கான நுழைவு அனுமதி. வாயிலில் இந்த QR குறியீட்டைக் காட்டவும்: {url}",
+    'te': "వాహనం {vehicle} కోసం గేట్ ప్రవేశ పాస్. గేట్ వద్ద ఈ QR కోడ్ చూపించండి: {url}",
+    'kn': "ವಾಹನ {vehicle} ಗಾಗಿ ಗೇಟ್ ಪ್ರವೇಶ ಪಾಸ್. ಗೇಟ್‌ನಲ್ಲಿ ಈ QR ಕೋಡ್ ತೋರಿಸಿ: {url}",
+    'ml': "വാഹനം {vehicle} നുള്ള ഗേറ്റ് പ്രവേശന പാസ്. ഗേറ്റിൽ ഈ QR കോഡ് കാണിക്കുക: {url}",
+    'bn': "যানবাহন {vehicle} এর জন্য গেট প্রবেশ পাস। গেটে এই QR কোড দেখান: {url}",
+    'pa': "ਵਾਹਨ {vehicle} ਲਈ ਗੇਟ ਦਾਖਲਾ ਪਾਸ। ਗੇਟ 'ਤੇ ਇਹ QR ਕੋਡ ਦਿਖਾਓ: {url}",
+    'ur': "گاڑی {vehicle} کے لیے گیٹ داخلہ پاس۔ گیٹ پر یہ QR کوڈ دکھائیں: {url}",
+}
+
+SMSMessage = namedtuple('SMSMessage', ['message_id', 'to', 'text'])
+
+# Per-message gateway outcome; retryable is False for permanent rejections (e.g. bad number)
+SMSResult = namedtuple('SMSResult', ['message_id', 'provider_message_id', 'error', 'retryable'])
+
+
+def render_qr_sms(submission, language):
+    """
+    Gate pass SMS text for a submission in the recipient's language
+    """
+    template = SMS_TEMPLATES.get(language, SMS_TEMPLATES['en'])
+    url = submission.get_qr_code_url()
+    if url and url.startswith('/'):
+        url = settings.PUBLIC_BASE_URL.rstrip('/') + url
+    return template.format(vehicle=submission.vehicle.vehicleRegistrationNo, url=url or '')
+
+
+def enqueue_qr_sms(submissions):
+    """
+    Queue gate pass SMS for the driver and helper of each submission
+
+    Must run inside the transaction that creates the submissions, so an SMS
+    is only ever sent for a committed submission.
+
+    Returns:
+        list: Created SMSOutbox entries
+    """
+    entries = []
+    for submission in submissions:
+        for person in (submission.driver, submission.helper):
+            if person is None:
+                continue
+            entries.append(SMSOutbox(
+                submission=submission,
+                recipient=person.phoneNo,
+                language=person.language or 'en'
+            ))
+    return SMSOutbox.objects.bulk_create(entries)
+
+
+class SMSGatewayError(Exception):
+    """
+    A whole gateway request failed; retry_after is the provider's hint in seconds
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SMSGateway:
+    """
+    Interface of an SMS provider
+
+    Subclasses implement send_batch(), which delivers up to max_recipients
+    messages in one provider request and reports an SMSResult per message.
+    Providers must treat a repeated message_id as the same message.
+    """
+    max_recipients = 1
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ConsoleSMSGateway(SMSGateway):
+    """
+    Development gateway that only logs messages
+    """
+    max_recipients = 1000
+
+    def send_batch(self, messages):
+        results = []
+        for message in messages:
+            logger.info("SMS %s to %s: %s", message.message_id, message.to, message.text)
+            results.append(SMSResult(message.message_id, str(message.message_id), None, False))
+        return results
+
+
+class HTTPSMSGateway(SMSGateway):
+    """
+    JSON-over-HTTP bulk SMS gateway
+
+    POST <SMS_GATEWAY_URL>
+    {
+        "sender": "GATEPS",
+        "messages": [{"id": "<uuid>", "to": "+91...", "text": "..."}, ...]
+    }
+
+    Response:
+    {
+        "results": [{"id": "<uuid>", "status": "accepted", "provider_id": "..."}, ...]
+    }
+
+    Each worker thread keeps one keep-alive connection. 429 and 5xx responses
+    fail the whole request as SMSGatewayError so it can be retried.
+    """
+
+    def __init__(self, url=None, api_key=None, sender_id=None, timeout=None, max_recipients=None):
+        self.url = url or settings.SMS_GATEWAY_URL
+        self.api_key = api_key if api_key is not None else settings.SMS_GATEWAY_API_KEY
+        self.sender_id = sender_id or settings.SMS_SENDER_ID
+        self.timeout = timeout or settings.SMS_GATEWAY_TIMEOUT
+        self.max_recipients = max_recipients or settings.SMS_GATEWAY_MAX_RECIPIENTS
+
+        parts = urlsplit(self.url)
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._path = parts.path or '/'
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection_class = (
+                http.client.HTTPSConnection if self._scheme == 'https' else http.client.HTTPConnection
+            )
+            connection = connection_class(self._netloc, timeout=self.timeout)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            connection.close()
+
+    def _post(self, body):
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+
+        # A keep-alive connection the server has closed fails on first use; reconnect once
+        for retry in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request('POST', self._path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.getheader('Retry-After'), response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                self._drop_connection()
+                if retry:
+                    raise SMSGatewayError(f"SMS gateway connection failed: {e}")
+            except OSError as e:
+                self._drop_connection()
+                raise SMSGatewayError(f"SMS gateway connection failed: {e}")
+
+    def send_batch(self, messages):
+        body = json.dumps({
+            'sender': self.sender_id,
+            'messages': [
+                {'id': str(message.message_id), 'to': message.to, 'text': message.text}
+                for message in messages
+            ]
+        }).encode()
+
+        status, retry_after, payload = self._post(body)
+        if status == 429 or status >= 500:
+            raise SMSGatewayError(
+                f"SMS gateway returned HTTP {status}",
+                retry_after=float(retry_after) if retry_after else None
+            )
+        if status >= 400:
+            error = payload.decode(errors='replace')[:500]
+            return [SMSResult(m.message_id, None, f"HTTP {status}: {error}", False) for m in messages]
+
+        outcomes = {item['id']: item for item in json.loads(payload).get('results', [])}
+        results = []
+        for message in messages:
+            outcome = outcomes.get(str(message.message_id))
+            if outcome is None:
+                results.append(SMSResult(message.message_id, None, "Missing from gateway response", True))
+            elif outcome.get('status') in ('accepted', 'duplicate'):
+                results.append(SMSResult(message.message_id, outcome.get('provider_id'), None, False))
+            else:
+                results.append(SMSResult(
+                    message.message_id, None, outcome.get('error') or outcome.get('status'), False
+                ))
+        return results
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+def get_sms_gateway():
+    """
+    New instance of the gateway class named by SMS_GATEWAY
+    """
+    return import_string(settings.SMS_GATEWAY)()
@@ -0,0 +1,249 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import SMSOutbox
+from .sms import SMSGatewayError, SMSMessage, get_sms_gateway, render_qr_sms
+
+logger = logging.getLogger(__name__)
+
+# Times one gateway request is re-sent after a 429 before its messages are rescheduled
+THROTTLE_RETRIES = 3
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at rate tokens per second up to capacity
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if available
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds to wait
+        """
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if now >= self._blocked_until and self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return max(self._blocked_until - now, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens=1):
+        """
+        Block until tokens are available and take them
+        """
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Hold every caller for seconds, e.g. after the provider answered 429,
+        then refill from empty
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self.clock() + seconds)
+            self._tokens = 0
+            self._updated = self._blocked_until
+
+
+class QRSMSDispatcher:
+    """
+    Deliver pending SMSOutbox rows through the configured SMS gateway
+
+    Claimed rows are grouped into multi-recipient gateway requests of up to
+    gateway.max_recipients messages. Every request first takes one token per
+    message from a token bucket sized to the provider quota
+    (SMS_RATE_PER_SECOND, SMS_RATE_BURST). Failed messages are rescheduled
+    with exponential backoff and keep their message_id, so the provider can
+    drop duplicates of a message whose response was lost.
+    """
+
+    def __init__(self, gateway=None, batch_size=None, workers=None, max_attempts=None,
+                 retry_base_seconds=None, retry_max_seconds=None, lease_seconds=None,
+                 rate_per_second=None, rate_burst=None):
+        self.gateway = gateway or get_sms_gateway()
+        self.batch_size = batch_size or settings.SMS_BATCH_SIZE
+        self.workers = workers or settings.SMS_WORKERS
+        self.max_attempts = max_attempts or settings.SMS_MAX_ATTEMPTS
+        self.retry_base_seconds = retry_base_seconds or settings.SMS_RETRY_BASE_SECONDS
+        self.retry_max_seconds = retry_max_seconds or settings.SMS_RETRY_MAX_SECONDS
+        self.lease_seconds = lease_seconds or settings.SMS_LEASE_SECONDS
+        self.bucket = TokenBucket(
+            rate_per_second or settings.SMS_RATE_PER_SECOND,
+            rate_burst or settings.SMS_RATE_BURST
+        )
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='qr-sms'
+        )
+
+    # ---------------------------------------------------------
+    # CLAIM
+    # ---------------------------------------------------------
+    def claim_batch(self):
+        """
+        Lease up to batch_size due entries for this dispatcher
+
+        Same SKIP LOCKED leasing as the QR email outbox, so several
+        dispatchers can share the queue.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                SMSOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status='pending', next_attempt_at__lte=now) |
+                    Q(status='sending', locked_until__lt=now)
+                )
+                .order_by('next_attempt_at')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return []
+
+            SMSOutbox.objects.filter(id__in=ids).update(
+                status='sending',
+                attempts=F('attempts') + 1,
+                locked_until=now + timedelta(seconds=self.lease_seconds),
+                updated_at=now
+            )
+
+        return list(
+            SMSOutbox.objects
+            .filter(id__in=ids)
+            .select_related('submission__vehicle')
+        )
+
+    # ---------------------------------------------------------
+    # SEND
+    # ---------------------------------------------------------
+    def _send(self, entries):
+        """
+        Send one multi-recipient gateway request
+
+        Returns:
+            list: (entry, error or None, retryable, provider_message_id) tuples
+        """
+        messages = [
+            SMSMessage(entry.message_id, entry.recipient, render_qr_sms(entry.submission, entry.language))
+            for entry in entries
+        ]
+        # A throttled request is retried in place after the provider's
+        # Retry-After instead of costing the messages an attempt
+        for throttled in range(THROTTLE_RETRIES + 1):
+            self.bucket.acquire(len(messages))
+            try:
+                results = self.gateway.send_batch(messages)
+                break
+            except SMSGatewayError as e:
+                if not e.retry_after or throttled == THROTTLE_RETRIES:
+                    return [(entry, e, True, None) for entry in entries]
+                self.bucket.pause(e.retry_after)
+            except Exception as e:
+                return [(entry, e, True, None) for entry in entries]
+
+        by_id = {result.message_id: result for result in results}
+        outcomes = []
+        for entry in entries:
+            result = by_id.get(entry.message_id)
+            if result is None:
+                outcomes.append((entry, "Missing from gateway response", True, None))
+            else:
+                outcomes.append((entry, result.error, result.retryable, result.provider_message_id))
+        return outcomes
+
+    def _retry_delay(self, attempts):
+        delay = self.retry_base_seconds * (2 ** max(attempts - 1, 0))
+        return timedelta(seconds=min(delay, self.retry_max_seconds))
+
+    def record_results(self, outcomes):
+        """
+        Persist delivery status for a sent batch in one UPDATE
+        """
+        now = timezone.now()
+        entries = []
+        for entry, error, retryable, provider_message_id in outcomes:
+            entry.locked_until = None
+            entry.updated_at = now
+            if error is None:
+                entry.status = 'sent'
+                entry.sent_at = now
+                entry.provider_message_id = provider_message_id
+                entry.last_error = None
+            else:
+                logger.warning("QR SMS %s to %s failed (attempt %s): %s",
+                               entry.id, entry.recipient, entry.attempts, error)
+                if not retryable or entry.attempts >= self.max_attempts:
+                    entry.status = 'failed'
+                else:
+                    entry.status = 'pending'
+                    entry.next_attempt_at = now + self._retry_delay(entry.attempts)
+                entry.last_error = str(error)[:2000]
+            entries.append(entry)
+
+        SMSOutbox.objects.bulk_update(entries, [
+            'status', 'next_attempt_at', 'locked_until', 'last_error',
+            'provider_message_id', 'sent_at', 'updated_at'
+        ])
+
+    def run_once(self):
+        """
+        Claim, send and record one batch
+
+        Returns:
+            dict: Number of entries claimed, sent and failed, and gateway requests made
+        """
+        entries = self.claim_batch()
+        if not entries:
+            return {'claimed': 0, 'sent': 0, 'failed': 0, 'requests': 0}
+
+        size = max(min(self.gateway.max_recipients, int(self.bucket.capacity)), 1)
+        chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+        outcomes = [outcome for chunk in self._executor.map(self._send, chunks) for outcome in chunk]
+        self.record_results(outcomes)
+
+        failed = sum(1 for _, error, _, _ in outcomes if error is not None)
+        return {
+            'claimed': len(entries),
+            'sent': len(entries) - failed,
+            'failed': failed,
+            'requests': len(chunks)
+        }
+
+    def close(self):
+        """
+        Stop the worker threads and release the gateway's connections
+        """
+        self._executor.shutdown(wait=True)
+        self.gateway.close()
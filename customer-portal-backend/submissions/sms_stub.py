@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .sms_dispatcher import TokenBucket
+
+
+class StubSMSGatewayServer:
+    """
+    Local stand-in for the HTTP SMS provider, for tests and load benchmarks
+
+    Speaks the HTTPSMSGateway protocol on 127.0.0.1 and records every message
+    it accepts. Repeated message IDs are answered as 'duplicate' and not
+    delivered twice. Optional behaviour:
+
+    - rate / burst: provider quota; requests over it get 429 with Retry-After
+    - latency: seconds to sleep per request
+    - fail_next: number of upcoming requests whose messages are accepted but
+      answered with 503, as if the response had been lost
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, rate=None, burst=None, latency=0.0):
+        self.latency = latency
+        self.fail_next = 0
+        self.bucket = TokenBucket(rate, burst or rate) if rate else None
+
+        self.delivered = {}
+        self.requests = 0
+        self.duplicates = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                status, headers, body = stub.handle(json.loads(self.rfile.read(length) or b'{}'))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/sms/send"
+
+    def handle(self, body):
+        messages = body.get('messages', [])
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests += 1
+            if self.bucket is not None:
+                retry_after = self.bucket.try_acquire(len(messages))
+                if retry_after:
+                    self.throttled += 1
+                    return 429, {'Retry-After': f"{retry_after:.3f}"}, {'error': 'rate limit exceeded'}
+
+            results = []
+            for message in messages:
+                if message['id'] in self.delivered:
+                    self.duplicates += 1
+                    results.append({'id': message['id'], 'status': 'duplicate',
+                                    'provider_id': self.delivered[message['id']]['provider_id']})
+                    continue
+                if not message.get('to', '').startswith('+'):
+                    results.append({'id': message['id'], 'status': 'rejected', 'error': 'invalid number'})
+                    continue
+                provider_id = uuid.uuid4().hex
+                self.delivered[message['id']] = dict(message, provider_id=provider_id)
+                results.append({'id': message['id'], 'status': 'accepted', 'provider_id': provider_id})
+
+            if self.fail_next:
+                self.fail_next -= 1
+                return 503, {}, {'error': 'service unavailable'}
+        return 200, {}, {'results': results}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='sms-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,3 +1,816 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import wait
+from datetime import date, datetime, timedelta
 
-# Create your tests here.
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Message
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import CustomerUser
+from drivers.models import DriverHelper
+from po_details.models import PODetails
+from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
+from vehicles.models import VehicleDetails
+from .audit import AuditLogWriter, get_audit_writer, get_client_ip
+from .email_dispatcher import QREmailDispatcher
+from .models import AuditLog, EmailOutbox, GateEntrySubmission, SMSOutbox, SubmissionDailyStat
+from .qr_generator import QRCodeCache, get_qr_cache, qr_payload_hash
+from .sms import HTTPSMSGateway, enqueue_qr_sms
+from .sms_dispatcher import QRSMSDispatcher, TokenBucket
+from .sms_stub import StubSMSGatewayServer
+
+
+class RecordingHandler(Message):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def handle_message(self, message):
+        self.messages.append(message)
+
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+def make_submission(user, vehicle_number='MH12AB1234', status='pending', driver_phone='+919876543210'):
+    """
+    Issued gate entry submission with its vehicle, driver, PO and taggings
+    """
+    vehicle, _ = VehicleDetails.upsert(vehicle_number, customer=user)
+    driver, _, _ = DriverHelper.upsert('Ravi', driver_phone, 'Driver', uid=f'1234{driver_phone[-8:]}')
+    po, _ = PODetails.upsert(f'PO-{vehicle_number}', user)
+    tagging = DriverVehicleTagging.objects.create(driverId=driver, vehicleId=vehicle)
+    po_tagging = PODriverVehicleTagging.objects.create(poId=po, driverVehicleTaggingId=tagging)
+    return GateEntrySubmission.objects.create(
+        customer_email=user.email,
+        customer_phone='+919999999999',
+        vehicle=vehicle,
+        driver=driver,
+        po_tagging=po_tagging,
+        qr_payload_hash=qr_payload_hash({'id': po_tagging.id}),
+        status=status
+    )
+
+
+def flush_audit_log(test):
+    """
+    Write buffered audit events inside the test's transaction, so none leak
+    into the next test
+    """
+    test.addCleanup(lambda: get_audit_writer().flush())
+
+
+def audit_actions():
+    get_audit_writer().flush()
+    return list(AuditLog.objects.order_by('id').values_list('action', flat=True))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class QREmailDispatcherTests(TestCase):
+    def setUp(self):
+        vehicle = VehicleDetails.objects.create(vehicleRegistrationNo='MH12AB1234')
+        driver = DriverHelper.objects.create(
+            uid='123456789012', name='Ravi', type='Driver', phoneNo='+919876543210'
+        )
+        self.submission = GateEntrySubmission.objects.create(
+            customer_email='customer@example.com',
+            customer_phone='+919800000000',
+            vehicle=vehicle,
+            driver=driver,
+            qr_payload_hash='a' * 64
+        )
+
+    def smtp_settings(self, port):
+        return override_settings(
+            EMAIL_BACKEND=SMTP_BACKEND,
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+
+    def test_batch_is_sent_over_pooled_connection(self):
+        handler = RecordingHandler()
+        controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+        controller.start()
+        self.addCleanup(controller.stop)
+
+        for _ in range(5):
+            EmailOutbox.objects.create(submission=self.submission, recipient='customer@example.com')
+
+        with self.smtp_settings(controller.port):
+            dispatcher = QREmailDispatcher(batch_size=10, workers=2)
+            try:
+                result = dispatcher.run_once()
+                pooled = len(dispatcher._connections)
+            finally:
+                dispatcher.close()
+
+        self.assertEqual(result, {'claimed': 5, 'sent': 5, 'failed': 0})
+        self.assertLessEqual(pooled, 2)
+        self.assertEqual(len(handler.messages), 5)
+        self.assertEqual(handler.messages[0]['To'], 'customer@example.com')
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+    def test_failed_send_is_rescheduled_then_marked_failed(self):
+        entry = EmailOutbox.objects.create(submission=self.submission, recipient='customer@example.com')
+
+        # Nothing is listening on this port, so every attempt fails
+        with self.smtp_settings(free_port()):
+            dispatcher = QREmailDispatcher(max_attempts=2, retry_base_seconds=60)
+            try:
+                dispatcher.run_once()
+                entry.refresh_from_db()
+                self.assertEqual(entry.status, 'pending')
+                self.assertEqual(entry.attempts, 1)
+                self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=30))
+
+                EmailOutbox.objects.filter(id=entry.id).update(next_attempt_at=timezone.now())
+                dispatcher.run_once()
+            finally:
+                dispatcher.close()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'failed')
+        self.assertEqual(entry.attempts, 2)
+        self.assertTrue(entry.last_error)
+
+
+class TokenBucketTests(TestCase):
+    def test_acquire_waits_for_refill(self):
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=10, capacity=20, clock=lambda: now[0], sleep=sleep)
+        bucket.acquire(20)
+        self.assertEqual(slept, [])
+
+        bucket.acquire(5)
+        self.assertAlmostEqual(sum(slept), 0.5)
+
+        bucket.pause(2)
+        bucket.acquire(1)
+        self.assertAlmostEqual(now[0], 2.6)
+
+
+class QRSMSDispatcherTests(TestCase):
+    def setUp(self):
+        vehicle = VehicleDetails.objects.create(vehicleRegistrationNo='MH12AB1234')
+        driver = DriverHelper.objects.create(
+            uid='123456789012', name='Ravi', type='Driver', phoneNo='+919876543210', language='en'
+        )
+        helper = DriverHelper.objects.create(
+            uid='123456789013', name='Sunil', type='Helper', phoneNo='+919876543211', language='hi'
+        )
+        self.submissions = [
+            GateEntrySubmission.objects.create(
+                customer_email='customer@example.com',
+                customer_phone='+919800000000',
+                vehicle=vehicle,
+                driver=driver,
+                helper=helper,
+                qr_payload_hash=str(i) * 64
+            )
+            for i in range(3)
+        ]
+
+        self.stub = StubSMSGatewayServer().start()
+        self.addCleanup(self.stub.stop)
+
+    def dispatcher(self, **kwargs):
+        gateway = HTTPSMSGateway(url=self.stub.url, max_recipients=kwargs.pop('max_recipients', 100))
+        dispatcher = QRSMSDispatcher(gateway=gateway, **kwargs)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    def test_batch_is_sent_in_recipient_language(self):
+        enqueue_qr_sms(self.submissions)
+
+        result = self.dispatcher(max_recipients=4).run_once()
+
+        self.assertEqual(result, {'claimed': 6, 'sent': 6, 'failed': 0, 'requests': 2})
+        self.assertEqual(self.stub.requests, 2)
+        texts = {m['to']: m['text'] for m in self.stub.delivered.values()}
+        self.assertIn('Gate entry pass for vehicle MH12AB1234', texts['+919876543210'])
+        self.assertIn('वाहन MH12AB1234 के लिए', texts['+919876543211'])
+        self.assertFalse(SMSOutbox.objects.exclude(status='sent').exists())
+
+    def test_retry_after_lost_response_is_not_delivered_twice(self):
+        enqueue_qr_sms(self.submissions[:1])
+        self.stub.fail_next = 1
+
+        dispatcher = self.dispatcher(retry_base_seconds=60)
+        self.assertEqual(dispatcher.run_once()['failed'], 2)
+        self.assertEqual(SMSOutbox.objects.filter(status='pending', attempts=1).count(), 2)
+
+        SMSOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatcher.run_once()['sent'], 2)
+
+        self.assertEqual(len(self.stub.delivered), 2)
+        self.assertEqual(self.stub.duplicates, 2)
+        self.assertFalse(SMSOutbox.objects.filter(provider_message_id__isnull=True).exists())
+
+
+@override_settings(AUDIT_LOG_FLUSH_SECONDS=3600)
+class UpsertQueryCountTests(TestCase):
+    """
+    Query-count benchmark for vehicle, driver/helper and PO resolution
+    """
+
+    def setUp(self):
+        self.user = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        flush_audit_log(self)
+        DriverHelper.objects.create(uid='123456789012', name='Ravi', type='Driver', phoneNo='+919876543210')
+        DriverHelper.objects.create(uid='123456789013', name='Sunil', type='Helper', phoneNo='+919876543211')
+
+    def resolve_with_get_or_create(self, suffix):
+        VehicleDetails.objects.get_or_create(vehicleRegistrationNo=f'MH12AB{suffix}')
+        for phone, name in (('+919876543210', 'Ravi'), ('+919876543211', 'Sunil')):
+            person = DriverHelper.objects.get(phoneNo=phone)
+            if person.name.lower() == name.lower() and person.language != 'hi':
+                person.language = 'hi'
+                person.save()
+        PODetails.objects.get_or_create(id=f'PO{suffix}', defaults={'customerUserId': self.user})
+
+    def resolve_with_upsert(self, suffix):
+        VehicleDetails.upsert(f'MH12AB{suffix}')
+        DriverHelper.validate_or_create('Ravi', '+919876543210', 'Driver', language='hi')
+        DriverHelper.validate_or_create('Sunil', '+919876543211', 'Helper', language='hi')
+        PODetails.upsert(f'PO{suffix}', self.user)
+
+    def count_queries(self, resolve, suffix):
+        with CaptureQueriesContext(connection) as queries:
+            resolve(suffix)
+        return len(queries)
+
+    def test_upsert_path_uses_one_statement_per_entity(self):
+        legacy_new = self.count_queries(self.resolve_with_get_or_create, '1')
+        legacy_existing = self.count_queries(self.resolve_with_get_or_create, '1')
+
+        DriverHelper.objects.update(language='en')
+        upsert_new = self.count_queries(self.resolve_with_upsert, '2')
+        upsert_existing = self.count_queries(self.resolve_with_upsert, '2')
+
+        self.assertEqual(upsert_new, 4)
+        self.assertEqual(upsert_existing, 4)
+        self.assertLess(upsert_new, legacy_new)
+        self.assertLessEqual(upsert_existing, legacy_existing)
+
+    def test_upsert_returns_existing_rows_and_verdicts(self):
+        vehicle, created = VehicleDetails.upsert('MH12AB9', customer=self.user)
+        self.assertTrue(created)
+        again, created = VehicleDetails.upsert('MH12AB9')
+        self.assertFalse(created)
+        self.assertEqual(again.pk, vehicle.pk)
+        self.assertEqual(again.customer_id, self.user.pk)
+
+        driver, created, name_matches = DriverHelper.upsert('ravi', '+919876543210', 'Driver', language='mr')
+        self.assertEqual((created, name_matches, driver.language), (False, True, 'mr'))
+
+        driver, created, name_matches = DriverHelper.upsert('Someone', '+919876543210', 'Driver')
+        self.assertEqual((created, name_matches, driver.name), (False, False, 'Ravi'))
+        with self.assertRaises(ValidationError):
+            DriverHelper.validate_or_create('Someone', '+919876543210', 'Driver')
+
+        self.assertIsNone(DriverHelper.upsert('New', '+919876543299', 'Driver'))
+        self.assertIsNone(DriverHelper.upsert('New', '+919876543299', 'Driver', uid='123456789012'))
+        new, created = DriverHelper.validate_or_create('New', '+919876543299', 'Driver', uid='123456789099')
+        self.assertTrue(created)
+        self.assertEqual(new.uid, '123456789099')
+
+    def test_validate_or_create_without_uid_creates_the_driver(self):
+        driver, created = DriverHelper.validate_or_create('Mahesh', '+919876543298', 'Driver', language='hi')
+        self.assertTrue(created)
+        self.assertEqual((driver.uid, driver.name, driver.language), ('', 'Mahesh', 'hi'))
+
+        again, created = DriverHelper.validate_or_create('mahesh', '+919876543298', 'Driver')
+        self.assertFalse(created)
+        self.assertEqual((again.pk, again.language), (driver.pk, 'en'))
+
+    def test_submission_for_a_new_driver_needs_no_uid(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                '/api/submissions/create/', bulk_entry('MH12AB0001', 'Mahesh', '+919876543298'), format='json'
+            )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(GateEntrySubmission.objects.get().driver.name, 'Mahesh')
+
+
+@override_settings(AUDIT_LOG_FLUSH_SECONDS=3600, QR_SCAN_REFRESH_SECONDS=3600)
+class GateScanTests(TestCase):
+    def setUp(self):
+        self.customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.guard = CustomerUser.objects.create_user(email='gate@example.com', password='x', username='gate', userType='employee')
+        flush_audit_log(self)
+        self.client = APIClient()
+        self.client.force_authenticate(self.guard)
+
+    def scan(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/submissions/scan/', {'payload': payload}, format='json')
+
+    def test_code_is_accepted_once(self):
+        submission = make_submission(self.customer)
+        payload = f'{{"id": {submission.po_tagging_id}}}'
+
+        response = self.scan(payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['submissionId'], response.data['vehicleNumber']), (submission.id, 'MH12AB1234'))
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, 'completed')
+        self.assertIsNotNone(submission.po_tagging.actReportingTime)
+
+        # Rejected from the scan cache, then by the database once the cache is gone
+        self.assertEqual(self.scan(payload).status_code, 409)
+        with override_settings(QR_SCAN_REFRESH_SECONDS=60):
+            replay = self.scan(payload)
+        self.assertEqual(replay.status_code, 409)
+        self.assertEqual(replay.data['reportedAt'], submission.po_tagging.actReportingTime)
+
+        self.assertEqual(audit_actions(), ['scan.accepted', 'scan.rejected', 'scan.rejected'])
+
+    def test_unknown_and_rejected_codes_are_refused(self):
+        rejected = make_submission(self.customer, status='rejected')
+
+        self.assertEqual(self.scan('{"id": 987654321}').status_code, 404)
+        self.assertEqual(self.scan({'id': rejected.po_tagging_id}).status_code, 409)
+        self.assertEqual(self.scan('{"id": "1"}').status_code, 400)
+        self.assertEqual(self.scan({'id': 2 ** 63}).status_code, 400)
+        self.assertEqual(self.scan('{"id": 0}').status_code, 400)
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.status, 'rejected')
+        self.assertIsNone(rejected.po_tagging.actReportingTime)
+
+    def test_customers_cannot_scan(self):
+        submission = make_submission(self.customer)
+        self.client.force_authenticate(self.customer)
+
+        self.assertEqual(self.scan({'id': submission.po_tagging_id}).status_code, 403)
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, 'pending')
+
+
+def bulk_entry(vehicle_number, driver_name, driver_phone, **fields):
+    return {
+        'customer_email': 'customer@example.com',
+        'customer_phone': '+919999999999',
+        'vehicle_number': vehicle_number,
+        'poNumber': f'PO-{vehicle_number}',
+        'driver_name': driver_name,
+        'driver_phone': driver_phone,
+        **fields
+    }
+
+
+@override_settings(AUDIT_LOG_FLUSH_SECONDS=3600, QR_PRERENDER_WORKERS=0)
+class BulkSubmissionTests(TestCase):
+    def setUp(self):
+        self.customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        DriverHelper.objects.create(uid='123456789012', name='Ravi', type='Driver', phoneNo='+919876543210')
+        self.client = APIClient()
+        flush_audit_log(self)
+        self.client.force_authenticate(self.customer)
+
+    def bulk_create(self, entries):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/submissions/bulk-create/', {'entries': entries}, format='json')
+
+    def test_each_failed_entry_is_reported_and_the_rest_created(self):
+        response = self.bulk_create([
+            bulk_entry('MH12AB0001', 'ravi', '+919876543210'),
+            bulk_entry('MH12AB0002', 'Ravi', '98765'),
+            bulk_entry('MH12AB0003', 'Someone', '+919876543210'),
+            bulk_entry('MH12AB0004', 'Anil', '+919876543220'),
+            bulk_entry('MH12AB0005', 'Anil', '+919876543220', driver_uid='1234 5678 9012'),
+            bulk_entry('MH12AB0006', 'Anil', '+919876543220', driver_uid='123456789020',
+                       helper_name='Sunil', helper_phone='+919876543221', helper_uid='123456789021'),
+            bulk_entry('MH12AB0007', 'anil', '+919876543220'),
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 4))
+        results = response.data['results']
+        self.assertEqual([r['index'] for r in results], list(range(7)))
+        self.assertEqual([i for i, r in enumerate(results) if 'submission' in r], [0, 5, 6])
+        self.assertIn('driver_phone', results[1]['error'])
+        self.assertIn('different person', results[2]['error'])
+        self.assertIn('not registered', results[3]['error'])
+        self.assertIn('Aadhar number is already registered', results[4]['error'])
+        self.assertEqual(results[5]['submission']['vehicleNumber'], 'MH12AB0006')
+
+        self.assertEqual(GateEntrySubmission.objects.count(), 3)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+        self.assertEqual(
+            sorted(DriverHelper.objects.values_list('phoneNo', flat=True)),
+            ['+919876543210', '+919876543220', '+919876543221']
+        )
+        self.assertEqual(audit_actions(), ['submission.created'] * 3)
+
+    def test_nothing_created_is_a_bad_request(self):
+        response = self.bulk_create([bulk_entry('MH12AB0001', 'Someone', '+919876543210')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.data['created'], response.data['failed']), (0, 1))
+        self.assertFalse(GateEntrySubmission.objects.exists())
+
+
+@override_settings(AUDIT_LOG_FLUSH_SECONDS=3600, QR_PRERENDER_WORKERS=0)
+class BulkSubmissionRaceTests(TransactionTestCase):
+    def test_people_inserted_concurrently_are_reselected(self):
+        customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        inserted, commit = threading.Event(), threading.Event()
+        responses = []
+
+        def register_elsewhere():
+            # Another request registers the same phone and uid, committing late
+            try:
+                with transaction.atomic():
+                    DriverHelper.objects.create(uid='123456789030', name='Other', type='Driver', phoneNo='+919876543230')
+                    DriverHelper.objects.create(uid='123456789031', name='Kiran', type='Driver', phoneNo='+919876543239')
+                    inserted.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        def bulk_create():
+            try:
+                client = APIClient()
+                client.force_authenticate(customer)
+                responses.append(client.post('/api/submissions/bulk-create/', {'entries': [
+                    bulk_entry('MH12AB0001', 'Ravi', '+919876543230', driver_uid='123456789032'),
+                    bulk_entry('MH12AB0002', 'Mohan', '+919876543231', driver_uid='123456789031'),
+                    bulk_entry('MH12AB0003', 'Suresh', '+919876543232', driver_uid='123456789033'),
+                ]}, format='json'))
+            finally:
+                connection.close()
+
+        other = threading.Thread(target=register_elsewhere)
+        other.start()
+        self.assertTrue(inserted.wait(10))
+        request = threading.Thread(target=bulk_create)
+        request.start()
+        # The insert waits for the other transaction's conflicting rows
+        request.join(0.5)
+        self.assertTrue(request.is_alive())
+        commit.set()
+        other.join(10)
+        request.join(10)
+
+        response = responses[0]
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 2))
+        self.assertIn('different person', response.data['results'][0]['error'])
+        self.assertIn('Aadhar number is already registered', response.data['results'][1]['error'])
+        self.assertEqual(response.data['results'][2]['submission']['vehicleNumber'], 'MH12AB0003')
+        self.assertEqual(DriverHelper.objects.get(phoneNo='+919876543230').name, 'Other')
+        self.assertFalse(DriverHelper.objects.filter(phoneNo='+919876543231').exists())
+        self.assertEqual(GateEntrySubmission.objects.get().driver.phoneNo, '+919876543232')
+
+
+class QRCodeCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_prerender_runs_in_the_background_pool(self):
+        cache = QRCodeCache(self.directory, workers=2)
+        self.addCleanup(cache.close)
+        items = [(qr_payload_hash({'id': i}), {'id': i}) for i in range(10)]
+
+        futures = cache.prerender(items)
+        pool = cache._pool
+        wait(futures, timeout=60)
+
+        self.assertEqual(sum(f.result() for f in futures), 10)
+        # Stored to the shared directory, and the pool is kept for the next batch
+        fresh = QRCodeCache(self.directory)
+        self.assertTrue(all(fresh.get(payload_hash) for payload_hash, _ in items))
+        self.assertEqual(cache.prerender(items), [])
+        cache.prerender([(qr_payload_hash({'id': 10}), {'id': 10})])
+        self.assertIs(cache._pool, pool)
+
+    def test_image_is_rendered_once_and_served_immutable(self):
+        customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        submission = make_submission(customer)
+        url = f'/api/submissions/qr/{submission.qr_payload_hash}/'
+        client = APIClient()
+
+        with override_settings(QR_CACHE_DIR=self.directory):
+            first = client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first['Content-Type'], 'image/png')
+            self.assertTrue(first.content.startswith(b'\x89PNG'))
+            self.assertEqual(first['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(first['ETag'], f'"{submission.qr_payload_hash}"')
+            self.assertTrue(os.path.isfile(get_qr_cache().path_for(submission.qr_payload_hash)))
+
+            # Served from the cache without touching the database
+            with self.assertNumQueries(0):
+                second = client.get(url)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second['Cache-Control'], 'public, max-age=31536000, immutable')
+
+            revalidated = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.content, b'')
+
+            self.assertEqual(client.get(f'/api/submissions/qr/{"0" * 64}/').status_code, 404)
+
+    def test_prerender_is_disabled_without_workers(self):
+        cache = QRCodeCache(self.directory)
+        self.assertEqual(cache.prerender([(qr_payload_hash({'id': 1}), {'id': 1})]), [])
+        self.assertIsNone(cache._pool)
+
+
+@override_settings(AUDIT_LOG_FLUSH_SECONDS=3600)
+class BulkStatusTransitionTests(TestCase):
+    def setUp(self):
+        self.customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.employee = CustomerUser.objects.create_user(email='staff@example.com', password='x', username='staff', userType='employee')
+        flush_audit_log(self)
+        self.pending = make_submission(self.customer, 'MH12AB0001', driver_phone='+919876543210')
+        self.approved = make_submission(self.customer, 'MH12AB0002', 'approved', driver_phone='+919876543211')
+        self.rejected = make_submission(self.customer, 'MH12AB0003', 'rejected', driver_phone='+919876543212')
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee)
+
+    def transition(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/submissions/bulk-status/', data, format='json')
+
+    def window(self):
+        now = timezone.now()
+        return {'created_after': now - timedelta(hours=1), 'created_before': now + timedelta(hours=1)}
+
+    def test_legal_rows_change_and_the_rest_are_skipped(self):
+        ids = [self.pending.id, self.approved.id, self.rejected.id, 987654321]
+        response = self.transition(to_status='completed', ids=ids)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(
+            [(row['id'], row['previousStatus'], row['status']) for row in response.data['submissions']],
+            [(self.pending.id, 'pending', 'completed'), (self.approved.id, 'approved', 'completed')]
+        )
+        self.assertEqual(response.data['skipped'], [
+            {'id': self.rejected.id, 'status': 'rejected'},
+            {'id': 987654321, 'status': None}
+        ])
+        self.assertEqual(
+            dict(GateEntrySubmission.objects.values_list('id', 'status')),
+            {self.pending.id: 'completed', self.approved.id: 'completed', self.rejected.id: 'rejected'}
+        )
+        self.assertEqual(audit_actions(), ['submission.status_changed'] * 2)
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list('submission_id', flat=True)), [self.pending.id, self.approved.id]
+        )
+
+    def test_illegal_transitions_are_rejected(self):
+        self.assertEqual(self.transition(to_status='pending', ids=[self.pending.id]).status_code, 400)
+        self.assertEqual(
+            self.transition(to_status='approved', from_status='completed', **self.window()).status_code, 400
+        )
+        self.assertFalse(GateEntrySubmission.objects.exclude(status__in=['pending', 'approved', 'rejected']).exists())
+        self.assertEqual(audit_actions(), [])
+
+    def test_status_selection_needs_a_window(self):
+        response = self.transition(to_status='rejected', from_status='pending')
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ValueError):
+            GateEntrySubmission.bulk_transition('rejected', from_status='pending')
+        self.assertEqual(GateEntrySubmission.objects.get(id=self.pending.id).status, 'pending')
+
+        response = self.transition(to_status='rejected', from_status='pending', **self.window())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['submissions']], [self.pending.id])
+        self.assertFalse(response.data['hasMore'])
+
+    def test_window_changes_at_most_limit_rows_per_call(self):
+        window = self.window()
+        first = GateEntrySubmission.bulk_transition('rejected', limit=1, **window)
+        second = GateEntrySubmission.bulk_transition('rejected', limit=1, **window)
+
+        self.assertEqual([row[:2] for row in first], [(self.pending.id, 'pending')])
+        self.assertEqual([row[:2] for row in second], [(self.approved.id, 'approved')])
+        self.assertEqual(GateEntrySubmission.bulk_transition('rejected', limit=1, **window), [])
+
+    def test_customers_cannot_change_status(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.transition(to_status='approved', ids=[self.pending.id]).status_code, 403)
+
+
+def install_stats_triggers():
+    """
+    Create the rollup triggers, which the test database (built without
+    migrations) does not have
+    """
+    initial = importlib.import_module('submissions.migrations.0010_submissiondailystat')
+    local_day = importlib.import_module('submissions.migrations.0011_stats_local_day')
+    with connection.cursor() as cursor:
+        cursor.execute(initial.STATS_TRIGGER_SQL)
+        cursor.execute(local_day.stats_function_sql(settings.TIME_ZONE))
+
+
+@override_settings(TIME_ZONE='Asia/Kolkata')
+class SubmissionDailyStatTests(TestCase):
+    def setUp(self):
+        install_stats_triggers()
+        self.customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.first = make_submission(self.customer, 'MH12AB0001', driver_phone='+919876543210')
+        self.second = make_submission(self.customer, 'MH12AB0002', driver_phone='+919876543211')
+        # 00:30 in Kolkata, still the previous day in UTC
+        GateEntrySubmission.objects.filter(id=self.second.id).update(created_at=datetime(2024, 1, 16, 0, 30))
+
+    def stats(self):
+        # Triggers leave emptied counters at 0; reconcile clears them
+        return sorted(
+            SubmissionDailyStat.objects.exclude(count=0).values_list('day', 'status', 'customer_email', 'count')
+        )
+
+    def test_counters_follow_inserts_status_changes_and_deletes(self):
+        today = SubmissionDailyStat.today()
+        self.assertEqual(self.stats(), [
+            (date(2024, 1, 16), 'pending', 'customer@example.com', 1),
+            (today, 'pending', 'customer@example.com', 1),
+        ])
+
+        # Writers in another session time zone land on the same day
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL TimeZone = 'UTC'")
+            GateEntrySubmission.bulk_transition('approved', ids=[self.first.id, self.second.id])
+            cursor.execute('SET LOCAL TimeZone = %s', [settings.TIME_ZONE])
+        self.assertEqual(self.stats(), [
+            (date(2024, 1, 16), 'approved', 'customer@example.com', 1),
+            (today, 'approved', 'customer@example.com', 1),
+        ])
+
+        GateEntrySubmission.objects.filter(id=self.second.id).delete()
+        self.assertEqual(self.stats(), [(today, 'approved', 'customer@example.com', 1)])
+
+    def test_reconcile_repairs_drift(self):
+        SubmissionDailyStat.objects.filter(day=date(2024, 1, 16)).update(count=7)
+        SubmissionDailyStat.objects.filter(day=SubmissionDailyStat.today()).delete()
+        SubmissionDailyStat.objects.create(
+            day=date(2024, 1, 17), status='rejected', customer_email='customer@example.com', count=2
+        )
+
+        # Only recent days are recounted unless asked for all
+        self.assertEqual(SubmissionDailyStat.reconcile(since=date(2024, 1, 17)), 2)
+        self.assertEqual(SubmissionDailyStat.objects.get(day=date(2024, 1, 16)).count, 7)
+
+        self.assertEqual(SubmissionDailyStat.reconcile(), 1)
+        self.assertEqual(self.stats(), [
+            (date(2024, 1, 16), 'pending', 'customer@example.com', 1),
+            (SubmissionDailyStat.today(), 'pending', 'customer@example.com', 1),
+        ])
+        self.assertEqual(SubmissionDailyStat.reconcile(), 0)
+
+    def test_endpoint_reads_days_from_the_rollup(self):
+        other = CustomerUser.objects.create_user(email='other@example.com', password='x', username='other')
+        make_submission(other, 'MH12AB0003', driver_phone='+919876543212')
+        client = APIClient()
+        client.force_authenticate(self.customer)
+
+        response = client.get('/api/submissions/stats/', {'date_from': '2024-01-16', 'date_to': '2024-01-17'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'pending': 1, 'approved': 0, 'rejected': 0, 'completed': 0})
+        self.assertEqual(response.data['byDay'], [
+            {'day': date(2024, 1, 16), 'pending': 1, 'approved': 0, 'rejected': 0, 'completed': 0}
+        ])
+
+        # Defaults to the last 30 days, ending today in TIME_ZONE
+        response = client.get('/api/submissions/stats/')
+        self.assertEqual(response.data['dateTo'], SubmissionDailyStat.today())
+        self.assertEqual(response.data['totals']['pending'], 1)
+
+
+class AuditLogWriterTests(TransactionTestCase):
+    """
+    The flusher thread writes on its own connection, so rows are committed
+    for real and these tests run outside a test transaction
+    """
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+
+    def writer(self, **kwargs):
+        writer = AuditLogWriter(spool_dir=self.spool_dir, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def wait_for_rows(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while AuditLog.objects.count() < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return AuditLog.objects.count()
+
+    def spooled(self):
+        return sorted(os.listdir(self.spool_dir)) if os.path.isdir(self.spool_dir) else []
+
+    def test_flushes_when_batch_size_is_reached(self):
+        writer = self.writer(batch_size=3, flush_seconds=3600)
+        writer.log('test.event', 'first')
+        writer.log('test.event', 'second')
+        time.sleep(0.2)
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        writer.log('test.event', 'third', user_email='staff@example.com', reference_id=7)
+        self.assertEqual(self.wait_for_rows(3), 3)
+        self.assertEqual(
+            list(AuditLog.objects.order_by('id').values_list('description', 'reference_id')),
+            [('first', None), ('second', None), ('third', '7')]
+        )
+        self.assertTrue(writer._thread.is_alive())
+
+    def test_flushes_after_flush_seconds(self):
+        writer = self.writer(batch_size=100, flush_seconds=0.3)
+        started = time.monotonic()
+        writer.log('test.event', 'lonely')
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        self.assertEqual(self.wait_for_rows(1), 1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    def test_close_writes_the_buffer_and_stops_the_thread(self):
+        # close() is what runs at interpreter exit (registered with atexit)
+        writer = self.writer(batch_size=100, flush_seconds=3600)
+        writer.log('test.event', 'one')
+        writer.log('test.event', 'two')
+        thread = writer._thread
+
+        writer.close()
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(AuditLog.objects.count(), 2)
+
+    def test_overflowing_events_are_spooled_then_replayed(self):
+        writer = self.writer(batch_size=100, flush_seconds=3600, max_buffer=2)
+        # Beyond max_buffer: straight to the spool file, nothing kept in memory
+        for i in range(3):
+            writer.log('test.event', f'overflow {i}')
+        spool_file = f'audit-{os.getpid()}.jsonl'
+        self.assertEqual(self.spooled(), [spool_file])
+        self.assertEqual(writer._buffer, [])
+
+        # An event the database rejects, and an unreadable file replayed first
+        with open(os.path.join(self.spool_dir, spool_file), 'a') as f:
+            f.write('{"action": "test.event", "description": "bad address", "ip_address": "not-an-ip", '
+                    '"timestamp": "2026-10-17T10:00:00"}\n')
+        with open(os.path.join(self.spool_dir, 'audit-1.jsonl'), 'w') as f:
+            f.write('not json\n')
+
+        # Both are set aside and do not hold up the good events
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(self.spooled(), ['audit-1.jsonl.bad', f'{spool_file}.bad'])
+        with open(os.path.join(self.spool_dir, f'{spool_file}.bad')) as f:
+            self.assertEqual([json.loads(line)['description'] for line in f], ['bad address'])
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list('description', flat=True)),
+            ['overflow 0', 'overflow 1', 'overflow 2']
+        )
+        self.assertEqual(writer.replay_spool(), 0)
+
+    def test_client_addresses_are_validated(self):
+        factory = RequestFactory()
+        forwarded = factory.get('/', HTTP_X_FORWARDED_FOR='203.0.113.5, 10.0.0.1', REMOTE_ADDR='10.0.0.1')
+        junk = factory.get('/', HTTP_X_FORWARDED_FOR='junk', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(get_client_ip(forwarded), '203.0.113.5')
+        self.assertEqual(get_client_ip(junk), '10.0.0.1')
+        self.assertIsNone(get_client_ip(factory.get('/', REMOTE_ADDR='unknown')))
+
+        # An address that is not one is dropped, not allowed to fail the batch
+        writer = self.writer(batch_size=100, flush_seconds=3600)
+        writer.log('test.event', 'junk', ip_address='junk')
+        writer.log('test.event', 'ok', ip_address=' 10.0.0.1 ')
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(
+            dict(AuditLog.objects.values_list('description', 'ip_address')), {'junk': None, 'ok': '10.0.0.1'}
+        )
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GateEntrySubmissionViewSet
+from .views import GateEntrySubmissionViewSet, AuditLogViewSet
 
 router = DefaultRouter()
+router.register(r'audit-logs', AuditLogViewSet, basename='audit-log')
 router.register(r'', GateEntrySubmissionViewSet, basename='submission')
 
 urlpatterns = [
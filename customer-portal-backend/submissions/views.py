@@ -2,25 +2,43 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.permissions import AllowAny
 from django.db import transaction
-from django.core.mail import EmailMessage
-from django.conf import settings
+from django.db.models import Sum
+from django.http import HttpResponse, Http404
 from django.core.exceptions import ValidationError
-from .models import GateEntrySubmission, AuditLog
-from .serializers import GateEntrySubmissionSerializer, SubmissionCreateSerializer
-from .qr_generator import generate_qr_code
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from .models import GateEntrySubmission, AuditLog, EmailOutbox, SubmissionDailyStat
+from .serializers import (
+    GateEntrySubmissionSerializer,
+    AuditLogSerializer,
+    SubmissionCreateSerializer,
+    BulkSubmissionCreateSerializer,
+    BulkStatusTransitionSerializer,
+    QRScanSerializer
+)
+from .audit import audit, audit_many, get_client_ip
+from .bulk import create_bulk_submissions
+from .qr_generator import qr_payload_hash, get_qr_cache
+from .scanner import ScanCache, get_scan_cache, consume_qr_code
+from .sms import enqueue_qr_sms
+from customer_portal.permissions import IsEmployee, is_employee
 from vehicles.models import VehicleDetails
 from drivers.models import DriverHelper
 from documents.models import CustomerDocument
 from po_details.models import PODetails
 from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
-import hashlib
-import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class GateEntrySubmissionViewSet(viewsets.ModelViewSet):
-    queryset = GateEntrySubmission.objects.all()
+    queryset = GateEntrySubmission.objects.select_related('vehicle', 'driver', 'helper')
     serializer_class = GateEntrySubmissionSerializer
+    cursor_ordering = ('-created_at', '-id')
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
     @action(detail=False, methods=['post'], url_path='create')
@@ -47,15 +65,14 @@ class GateEntrySubmissionViewSet(viewsets.ModelViewSet):
                 helper_language = serializer.validated_data.get('helper_language', 'en')
                 po_number = serializer.validated_data['poNumber']
 
-                vehicle, _ = VehicleDetails.objects.get_or_create(
-                    vehicleRegistrationNo=vehicle_number.upper()
-                )
+                vehicle, _ = VehicleDetails.upsert(vehicle_number.strip().upper())
 
                 driver, driver_created = DriverHelper.validate_or_create(
                     name=driver_name,
                     phone_no=driver_phone,
                     driver_type='Driver',
-                    language=driver_language
+                    language=driver_language,
+                    uid=serializer.validated_data.get('driver_uid')
                 )
 
                 helper = None
@@ -64,13 +81,11 @@ class GateEntrySubmissionViewSet(viewsets.ModelViewSet):
                         name=helper_name,
                         phone_no=helper_phone,
                         driver_type='Helper',
-                        language=helper_language
+                        language=helper_language,
+                        uid=serializer.validated_data.get('helper_uid')
                     )
 
-                po, _ = PODetails.objects.get_or_create(
-                    id=po_number.strip().upper(),
-                    defaults={'customerUserId': request.user}
-                )
+                po, _ = PODetails.upsert(po_number.strip().upper(), request.user)
 
                 driver_vehicle_tagging = DriverVehicleTagging.objects.create(
                     driverId=driver,
@@ -87,41 +102,38 @@ class GateEntrySubmissionViewSet(viewsets.ModelViewSet):
                     exitTime=None
                 )
 
+                # The QR image itself is rendered lazily by qr_image()
                 submission = GateEntrySubmission.objects.create(
                     customer_email=customer_email,
                     customer_phone=customer_phone,
                     vehicle=vehicle,
                     driver=driver,
-                    helper=helper
+                    helper=helper,
+                    po_tagging=po_driver_vehicle_tagging,
+                    qr_payload_hash=qr_payload_hash({'id': po_driver_vehicle_tagging.id})
                 )
 
-                qr_payload_data = {
-                    'po_driver_vehicle_tagging_id': po_driver_vehicle_tagging.id
-                }
-                submission.qr_payload_hash = hashlib.sha256(
-                    json.dumps(qr_payload_data, sort_keys=True).encode()
-                ).hexdigest()
-
-                qr_payload = {
-                    'id': po_driver_vehicle_tagging.id
-                }
-
-                qr_file = generate_qr_code(qr_payload)
-                submission.qr_code_image = qr_file
-                submission.save()
+                transaction.on_commit(
+                    lambda: get_scan_cache().mark_issued([po_driver_vehicle_tagging.id])
+                )
 
-                self.send_qr_email(submission)
+                # Delivered by the dispatch_qr_emails worker once this commits
+                EmailOutbox.objects.create(
+                    submission=submission,
+                    recipient=submission.customer_email
+                )
                 self.send_qr_sms(submission)
 
+                audit(
+                    request, 'submission.created',
+                    f"Gate entry submission created for vehicle {vehicle.vehicleRegistrationNo} on PO {po.id}",
+                    submission_id=submission.id,
+                    reference_type='PODriverVehicleTagging',
+                    reference_id=po_driver_vehicle_tagging.id
+                )
+
                 return Response({
-                    "submission": {
-                        "id": submission.id,
-                        "qrCodeImage": request.build_absolute_uri(submission.qr_code_image.url),
-                        "vehicleNumber": submission.vehicle.vehicleRegistrationNo,
-                        "driverPhone": submission.driver.phoneNo,
-                        "status": submission.status,
-                        "createdAt": submission.created_at
-                    }
+                    "submission": self.submission_summary(submission, request)
                 }, status=status.HTTP_201_CREATED)
 
         except ValidationError as e:
@@ -136,176 +148,409 @@ class GateEntrySubmissionViewSet(viewsets.ModelViewSet):
                 "error": str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk-create')
+    def bulk_create_submissions(self, request):
+        """
+        Create gate entry submissions for a whole fleet in one request
+
+        POST /api/submissions/bulk-create/
+
+        Request:
+        {
+            "entries": [
+                {
+                    ...same fields as /api/submissions/create/...,
+                    "driver_uid": "123456789012",  (only for unregistered drivers)
+                    "helper_uid": "123456789013"   (only for unregistered helpers)
+                },
+                ...
+            ]
+        }
+
+        Response:
+        {
+            "created": 2,
+            "failed": 1,
+            "results": [
+                {"index": 0, "submission": {...}},
+                {"index": 1, "error": "..."},
+                ...
+            ]
+        }
+        """
+        serializer = BulkSubmissionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            results = create_bulk_submissions(serializer.validated_data['entries'], request.user)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        submissions = [result['submission'] for result in results if 'submission' in result]
+        get_scan_cache().mark_issued([s.po_tagging_id for s in submissions])
+
+        for submission in submissions:
+            audit(
+                request, 'submission.created',
+                f"Gate entry submission created for vehicle {submission.vehicle.vehicleRegistrationNo} (bulk)",
+                submission_id=submission.id,
+                reference_type='PODriverVehicleTagging',
+                reference_id=submission.po_tagging_id
+            )
+
+        # Warm the QR cache in the background so the gate and the outbox
+        # emails rarely render inline; the response does not wait for it
+        if submissions:
+            try:
+                get_qr_cache().prerender(
+                    [(s.qr_payload_hash, s.qr_payload()) for s in submissions]
+                )
+            except Exception:
+                logger.warning("QR pre-render failed, images will render on demand", exc_info=True)
+
+        response_results = []
+        for result in results:
+            if 'submission' in result:
+                response_results.append({
+                    "index": result['index'],
+                    "submission": self.submission_summary(result['submission'], request)
+                })
+            else:
+                response_results.append(result)
+
+        return Response({
+            "created": len(submissions),
+            "failed": len(results) - len(submissions),
+            "results": response_results
+        }, status=status.HTTP_201_CREATED if submissions else status.HTTP_400_BAD_REQUEST)
+
+    def submission_summary(self, submission, request):
+        """
+        Response payload for a newly created submission
+        """
+        return {
+            "id": submission.id,
+            "qrCodeImage": submission.get_qr_code_url(request),
+            "vehicleNumber": submission.vehicle.vehicleRegistrationNo,
+            "driverPhone": submission.driver.phoneNo,
+            "status": submission.status,
+            "createdAt": submission.created_at
+        }
+
     # ---------------------------------------------------------
-    # EMAIL
+    # STATUS
     # ---------------------------------------------------------
-    def send_qr_email(self, submission):
+    @action(detail=False, methods=['post'], url_path='bulk-status', permission_classes=[IsEmployee])
+    def bulk_status_transition(self, request):
         """
-        Send QR code via email with enhanced template
+        Change the status of many submissions at once (employees only)
+
+        POST /api/submissions/bulk-status/
+
+        Request (by id):
+        {
+            "to_status": "approved",
+            "ids": [101, 102, 103]
+        }
+
+        Request (by creation time, optionally narrowed to one status):
+        {
+            "to_status": "approved",
+            "from_status": "pending",
+            "created_after": "2024-01-15T00:00:00",
+            "created_before": "2024-01-15T12:00:00"
+        }
+
+        Response:
+        {
+            "updated": 2,
+            "submissions": [
+                {"id": 101, "previousStatus": "pending", "status": "approved", "updatedAt": "..."},
+                ...
+            ],
+            "skipped": [
+                {"id": 103, "status": "rejected"}
+            ],
+            "hasMore": false
+        }
+
+        Only legal transitions are applied (see GateEntrySubmission.TRANSITIONS);
+        rows in any other status, or moved concurrently, are reported as skipped.
+        A time window changes at most BULK_TRANSITION_MAX_ROWS rows per request;
+        hasMore tells the client to repeat it for the rest.
+        """
+        serializer = BulkStatusTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        to_status = data['to_status']
+        ids = data.get('ids')
+
+        with transaction.atomic():
+            changed = GateEntrySubmission.bulk_transition(
+                to_status,
+                ids=ids,
+                from_status=data.get('from_status'),
+                created_after=data.get('created_after'),
+                created_before=data.get('created_before')
+            )
+            audit_many(request, [
+                {
+                    'action': 'submission.status_changed',
+                    'description': f"Submission {submission_id} moved from {previous_status} to {to_status}",
+                    'submission_id': submission_id
+                }
+                for submission_id, previous_status, *_ in changed
+            ])
+
+        skipped = []
+        if ids is not None and len(changed) < len(set(ids)):
+            changed_ids = {row[0] for row in changed}
+            current = dict(
+                GateEntrySubmission.objects
+                .filter(id__in=[i for i in ids if i not in changed_ids])
+                .values_list('id', 'status')
+            )
+            skipped = [
+                {"id": i, "status": current.get(i)}
+                for i in dict.fromkeys(ids) if i not in changed_ids
+            ]
+
+        return Response({
+            "updated": len(changed),
+            "submissions": [
+                {
+                    "id": submission_id,
+                    "previousStatus": previous_status,
+                    "status": to_status,
+                    "updatedAt": updated_at
+                }
+                for submission_id, previous_status, updated_at, *_ in changed
+            ],
+            "skipped": skipped,
+            "hasMore": ids is None and len(changed) == GateEntrySubmission.BULK_TRANSITION_MAX_ROWS
+        })
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def stats(self, request):
+        """
+        Submission counts per status and per day
+
+        GET /api/submissions/stats/?date_from=2024-01-01&date_to=2024-01-31
+
+        Query Parameters:
+        - date_from / date_to: inclusive day range (default: last 30 days)
+        - customer_email: employees only; customers always see their own
+
+        Response:
+        {
+            "dateFrom": "2024-01-01",
+            "dateTo": "2024-01-31",
+            "totals": {"pending": 12, "approved": 40, "rejected": 1, "completed": 35},
+            "byDay": [
+                {"day": "2024-01-31", "pending": 3, "approved": 5, "rejected": 0, "completed": 9},
+                ...
+            ]
+        }
+
+        Read from the SubmissionDailyStat rollup, so the cost depends on the
+        number of days requested rather than the number of submissions. Days
+        are calendar days in settings.TIME_ZONE.
         """
         try:
-            subject = f"Gate Entry QR Code - {submission.vehicle.vehicleRegistrationNo}"
-            
-            # Create HTML email body
-            html_body = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            line-height: 1.6;
-            color: #333;
-        }}
-        .container {{
-            max-width: 600px;
-            margin: 0 auto;
-            padding: 20px;
-        }}
-        .header {{
-            background-color: #2563eb;
-            color: white;
-            padding: 20px;
-            text-align: center;
-            border-radius: 8px 8px 0 0;
-        }}
-        .content {{
-            background-color: #f9fafb;
-            padding: 30px;
-            border-radius: 0 0 8px 8px;
-        }}
-        .qr-container {{
-            text-align: center;
-            margin: 30px 0;
-            padding: 20px;
-            background-color: white;
-            border-radius: 8px;
-        }}
-        .info-box {{
-            background-color: #eff6ff;
-            border-left: 4px solid #2563eb;
-            padding: 15px;
-            margin: 20px 0;
-        }}
-        .footer {{
-            text-align: center;
-            color: #6b7280;
-            font-size: 12px;
-            margin-top: 30px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🚛 Gate Entry QR Code</h1>
-        </div>
-        <div class="content">
-            <p>Dear Customer,</p>
-            
-            <p>Your gate entry QR code has been generated successfully!</p>
-            
-            <div class="info-box">
-                <strong>Entry Details:</strong><br>
-                Vehicle Number: <strong>{submission.vehicle.vehicleRegistrationNo}</strong><br>
-                Driver: {submission.driver.name} ({submission.driver.phoneNo})<br>
-                {f'Helper: {submission.helper.name} ({submission.helper.phoneNo})<br>' if submission.helper else ''}
-                Generated: {submission.created_at.strftime('%B %d, %Y at %I:%M %p')}
-            </div>
-            
-            <div class="qr-container">
-                <p><strong>Your QR Code:</strong></p>
-                <p style="color: #6b7280; font-size: 14px;">
-                    (QR code image is attached to this email)
-                </p>
-            </div>
-            
-            <div class="info-box" style="background-color: #fef3c7; border-left-color: #f59e0b;">
-                <strong>⚠️ Important Instructions:</strong>
-                <ul style="margin: 10px 0;">
-                    <li>Present this QR code at the gate entrance</li>
-                    <li>Keep both digital and printed copies handy</li>
-                    <li>The driver will receive a token number upon scanning</li>
-                    <li>This QR code is valid for single entry</li>
-                </ul>
-            </div>
-            
-            <p>If you have any questions, please contact our support team.</p>
-            
-            <p>Best regards,<br>
-            <strong>Gate Entry System</strong></p>
-        </div>
-        <div class="footer">
-            <p>This is an automated email. Please do not reply to this message.</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-
-            # Plain text fallback
-            text_body = f"""
-Dear Customer,
-
-Your gate entry QR code has been generated successfully.
-
-Entry Details:
-- Vehicle Number: {submission.vehicle.vehicleRegistrationNo}
-- Driver: {submission.driver.name} ({submission.driver.phoneNo})
-{f'- Helper: {submission.helper.name} ({submission.helper.phoneNo})' if submission.helper else ''}
-- Generated: {submission.created_at.strftime('%B %d, %Y at %I:%M %p')}
-
-Important Instructions:
-✓ Present this QR code at the gate entrance
-✓ Keep both digital and printed copies handy
-✓ The driver will receive a token number upon scanning
-✓ This QR code is valid for single entry
-
-Best regards,
-Customer Web Portal
-"""
-
-            from django.core.mail import EmailMultiAlternatives
-            
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=text_body,
-                from_email=settings.EMAIL_HOST_USER,
-                to=[submission.customer_email],
+            date_to = parse_date(request.query_params.get('date_to') or SubmissionDailyStat.today().isoformat())
+            date_from = parse_date(request.query_params.get('date_from') or (date_to - timedelta(days=29)).isoformat())
+            if date_from is None or date_to is None:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({
+                "error": "date_from and date_to must be YYYY-MM-DD dates"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = SubmissionDailyStat.objects.filter(day__gte=date_from, day__lte=date_to)
+        if is_employee(request.user):
+            if request.query_params.get('customer_email'):
+                rows = rows.filter(customer_email=request.query_params['customer_email'])
+        else:
+            rows = rows.filter(customer_email=request.user.email)
+
+        statuses = [choice for choice, _ in GateEntrySubmission.STATUS_CHOICES]
+        totals = dict.fromkeys(statuses, 0)
+        by_day = {}
+        for row in rows.values('day', 'status').annotate(total=Sum('count')).order_by('-day'):
+            totals[row['status']] += row['total']
+            by_day.setdefault(row['day'], dict.fromkeys(statuses, 0))[row['status']] = row['total']
+
+        return Response({
+            "dateFrom": date_from,
+            "dateTo": date_to,
+            "totals": totals,
+            "byDay": [{"day": day, **counts} for day, counts in by_day.items()]
+        })
+
+    # ---------------------------------------------------------
+    # GATE SCAN
+    # ---------------------------------------------------------
+    @action(detail=False, methods=['post'], url_path='scan', permission_classes=[IsEmployee])
+    def scan_qr_code(self, request):
+        """
+        Validate and consume a gate entry QR code (single use)
+
+        POST /api/submissions/scan/
+
+        Request:
+        {
+            "payload": "{\"id\": 123}"
+        }
+
+        Response (200):
+        {
+            "valid": true,
+            "submissionId": 45,
+            "vehicleNumber": "MH12AB1234",
+            "reportedAt": "2024-01-15T10:30:00"
+        }
+
+        Gate staff only (employees): consuming a code admits the vehicle.
+        Replays and unknown codes are answered with 409 / 404. Codes the
+        in-process scan cache already knows to be used or never issued are
+        rejected without touching the database.
+        """
+        serializer = QRScanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        payload = serializer.validated_data['payload']
+        tagging_id = payload['id']
+        cache = get_scan_cache()
+
+        verdict = cache.check(tagging_id)
+        if verdict == ScanCache.CONSUMED:
+            self.audit_scan(request, tagging_id, 'scan.rejected', "QR code has already been used")
+            return Response({
+                "valid": False,
+                "error": "QR code has already been used"
+            }, status=status.HTTP_409_CONFLICT)
+        if verdict == ScanCache.INVALID:
+            self.audit_scan(request, tagging_id, 'scan.rejected', "Invalid QR code")
+            return Response({
+                "valid": False,
+                "error": "Invalid QR code"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        payload_hash = qr_payload_hash(payload)
+        consumed = consume_qr_code(tagging_id, payload_hash)
+        if consumed:
+            cache.mark_consumed(tagging_id)
+            self.audit_scan(
+                request, tagging_id, 'scan.accepted',
+                f"Vehicle {consumed['vehicle_number']} admitted at gate",
+                submission_id=consumed['submission_id']
             )
-            
-            # Attach HTML version
-            email.attach_alternative(html_body, "text/html")
+            return Response({
+                "valid": True,
+                "submissionId": consumed['submission_id'],
+                "vehicleNumber": consumed['vehicle_number'],
+                "reportedAt": consumed['reported_at']
+            })
+
+        # Slow path: explain why the code could not be consumed
+        submission = (
+            GateEntrySubmission.objects
+            .filter(qr_payload_hash=payload_hash, po_tagging_id=tagging_id)
+            .values('id', 'status', 'po_tagging__actReportingTime')
+            .first()
+        )
+        if submission is None:
+            self.audit_scan(request, tagging_id, 'scan.rejected', "Invalid QR code")
+            return Response({
+                "valid": False,
+                "error": "Invalid QR code"
+            }, status=status.HTTP_404_NOT_FOUND)
+        if submission['po_tagging__actReportingTime']:
+            cache.mark_consumed(tagging_id)
+            self.audit_scan(
+                request, tagging_id, 'scan.rejected', "QR code has already been used",
+                submission_id=submission['id']
+            )
+            return Response({
+                "valid": False,
+                "error": "QR code has already been used",
+                "reportedAt": submission['po_tagging__actReportingTime']
+            }, status=status.HTTP_409_CONFLICT)
+        self.audit_scan(
+            request, tagging_id, 'scan.rejected',
+            f"Submission is {submission['status']} and cannot be used for entry",
+            submission_id=submission['id']
+        )
+        return Response({
+            "valid": False,
+            "error": f"Submission is {submission['status']} and cannot be used for entry"
+        }, status=status.HTTP_409_CONFLICT)
+
+    def audit_scan(self, request, tagging_id, action, description, submission_id=None):
+        audit(
+            request, action, description,
+            submission_id=submission_id,
+            reference_type='PODriverVehicleTagging',
+            reference_id=tagging_id
+        )
 
-            # Attach QR code image
-            if submission.qr_code_image:
-                email.attach_file(submission.qr_code_image.path)
+    # ---------------------------------------------------------
+    # QR IMAGE
+    # ---------------------------------------------------------
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path=r'qr/(?P<payload_hash>[0-9a-f]{64})',
+        url_name='qr-image',
+        permission_classes=[AllowAny]
+    )
+    def qr_image(self, request, payload_hash=None):
+        """
+        Serve a QR code image by payload hash
 
-            email.send(fail_silently=False)
+        GET /api/submissions/qr/{payload_hash}/
 
-            # Log success (optional - currently commented out in your code)
-            print(f"✅ Email sent successfully to {submission.customer_email}")
+        The image is rendered on first request and then served from the
+        in-memory LRU or the content-addressed disk cache. The content never
+        changes for a hash, so responses are marked immutable.
+        """
+        etag = f'"{payload_hash}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache = get_qr_cache()
+            png = cache.get(payload_hash)
+            if png is None:
+                po_tagging_id = (
+                    GateEntrySubmission.objects
+                    .filter(qr_payload_hash=payload_hash, po_tagging__isnull=False)
+                    .values_list('po_tagging_id', flat=True)
+                    .first()
+                )
+                if po_tagging_id is None:
+                    raise Http404("QR code not found")
+                png = cache.get_or_render(payload_hash, {'id': po_tagging_id})
+            response = HttpResponse(png, content_type='image/png')
 
-        except Exception as e:
-            # Log error
-            print(f"❌ Failed to send email: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
 
     # ---------------------------------------------------------
     # SMS
     # ---------------------------------------------------------
     def send_qr_sms(self, submission):
         """
-        Send QR code link via SMS (placeholder implementation)
+        Queue the gate pass SMS for the driver and helper
+
+        Delivered in their own language by the dispatch_qr_sms worker once
+        the submission commits.
         """
-        try:
-            message = (
-                f"Gate Entry QR Code generated for vehicle "
-                f"{submission.vehicle.vehicleRegistrationNo}."
-            )
-        except Exception:
-            pass
+        enqueue_qr_sms([submission])
 
     # ---------------------------------------------------------
     # CLIENT IP
@@ -314,9 +559,58 @@ Customer Web Portal
         """
         Get client IP address from request
         """
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+        return get_client_ip(request)
+
+class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Query the audit trail
+
+    GET /api/submissions/audit-logs/?action=scan.rejected&since=2024-01-01T00:00:00
+
+    Query Parameters:
+    - action: exact action, or a prefix ending in '.' (e.g. 'document.')
+    - user_email: only honoured for employees and staff
+    - submission: submission ID
+    - reference_type / reference_id: object the event is about
+    - since / until: ISO datetimes bounding the event timestamp
+
+    Customers only see their own events. Time bounds let the database skip
+    whole monthly partitions and use the BRIN index on timestamp.
+    """
+    queryset = AuditLog.objects.all()
+    serializer_class = AuditLogSerializer
+    cursor_ordering = ('-timestamp', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        params = self.request.query_params
+
+        if is_employee(user):
+            if params.get('user_email'):
+                queryset = queryset.filter(user_email=params['user_email'])
         else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+            queryset = queryset.filter(user_email=user.email)
+
+        action_name = params.get('action')
+        if action_name:
+            if action_name.endswith('.'):
+                queryset = queryset.filter(action__startswith=action_name)
+            else:
+                queryset = queryset.filter(action=action_name)
+
+        if params.get('submission'):
+            queryset = queryset.filter(submission_id=params['submission'])
+        if params.get('reference_type'):
+            queryset = queryset.filter(reference_type=params['reference_type'])
+        if params.get('reference_id'):
+            queryset = queryset.filter(reference_id=params['reference_id'])
+
+        for param, lookup in (('since', 'timestamp__gte'), ('until', 'timestamp__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param]) or parse_date(params[param])
+                if value is None:
+                    raise DRFValidationError({param: "Expected an ISO 8601 date or datetime"})
+                queryset = queryset.filter(**{lookup: value})
+
+        return queryset
@@ -0,0 +1,107 @@
+from documents.models import DocumentControl
+from drivers.models import DriverHelper
+
+# Every driver and helper ever tagged to the vehicle, once each with their most recent tagging,
+# whether that tagging is the vehicle's latest one, and the latest tagging's most recent PO
+VEHICLE_PEOPLE_SQL = """
+    WITH "taggings" AS (
+        SELECT "id", "driverId", "helperId", "created" FROM "DriverVehicleTagging" WHERE "vehicleId" = %s
+    ), "latest" AS (
+        SELECT "id" FROM "taggings" ORDER BY "created" DESC, "id" DESC LIMIT 1
+    ), "people" AS (
+        SELECT DISTINCT ON ("role", "person_id") "role", "person_id", "created", "tagging_id" FROM (
+            SELECT 'driver' AS "role", "driverId" AS "person_id", "created", "id" AS "tagging_id" FROM "taggings"
+            UNION ALL
+            SELECT 'helper', "helperId", "created", "id" FROM "taggings" WHERE "helperId" IS NOT NULL
+        ) AS "tagged"
+        ORDER BY "role", "person_id", "created" DESC, "tagging_id" DESC
+    )
+    SELECT "DriverHelper".*,
+        "people"."role" AS "tagging_role",
+        "people"."tagging_id" = (SELECT "id" FROM "latest") AS "in_latest_tagging",
+        (
+            SELECT "poId" FROM "PODriverVehicleTagging"
+            WHERE "driverVehicleTaggingId" = (SELECT "id" FROM "latest")
+            ORDER BY "created" DESC, "id" DESC LIMIT 1
+        ) AS "latest_po"
+    FROM "people" JOIN "DriverHelper" ON "DriverHelper"."id" = "people"."person_id"
+    ORDER BY "people"."created" DESC, "people"."tagging_id" DESC
+"""
+
+
+def person_data(person):
+    """
+    Driver/helper fields returned with vehicle data
+    """
+    if person is None:
+        return None
+    return {
+        "id": person.id,
+        "name": person.name,
+        "phoneNo": person.phoneNo,
+        "language": person.language,
+        "type": person.type,
+        "uid": person.uid,
+    }
+
+
+class VehicleAggregate:
+    """
+    A vehicle with its drivers, helpers, latest PO and all their documents
+
+    Loaded in two queries whatever the vehicle's history: one for the
+    people and the PO, one for the documents of the vehicle, every driver
+    and helper and the PO.
+
+    Attributes:
+        drivers / helpers: DriverHelper rows, most recently tagged first
+        driver / helper: Those on the vehicle's latest tagging (or None)
+        po_number: Latest PO of the latest tagging (or None)
+        documents: DocumentControl rows, grouped by reference, newest first
+    """
+
+    def __init__(self, vehicle, drivers, helpers, driver, helper, po_number, documents):
+        self.vehicle = vehicle
+        self.drivers = drivers
+        self.helpers = helpers
+        self.driver = driver
+        self.helper = helper
+        self.po_number = po_number
+        self.documents = documents
+
+    @classmethod
+    def load(cls, vehicle, latest_only=False):
+        """
+        Args:
+            vehicle: VehicleDetails
+            latest_only: Only load documents of the latest tagging's driver
+                and helper rather than of everyone ever tagged
+        """
+        drivers, helpers = [], []
+        driver = helper = po_number = None
+        for person in DriverHelper.objects.raw(VEHICLE_PEOPLE_SQL, [vehicle.id]):
+            po_number = person.latest_po
+            if person.tagging_role == 'driver':
+                drivers.append(person)
+                if person.in_latest_tagging:
+                    driver = person
+            else:
+                helpers.append(person)
+                if person.in_latest_tagging:
+                    helper = person
+
+        references = [('vehicle', vehicle.id)]
+        if latest_only:
+            references.extend(('driver', person.id) for person in [driver] if person)
+            references.extend(('helper', person.id) for person in [helper] if person)
+        else:
+            references.extend(('driver', person.id) for person in drivers)
+            references.extend(('helper', person.id) for person in helpers)
+        if po_number:
+            references.append(('po', po_number))
+        documents = [
+            document
+            for reference_documents in DocumentControl.for_references(references).values()
+            for document in reference_documents
+        ]
+        return cls(vehicle, drivers, helpers, driver, helper, po_number, documents)
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-16 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0006_fix_customer_fk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vehicledetails',
+            index=models.Index(fields=['created', 'id'], name='VehicleDeta_created_fd1a1c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicledetails',
+            index=models.Index(fields=['customer', 'created', 'id'], name='VehicleDeta_custome_9a7fd2_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.core.validators import RegexValidator
 from django.conf import settings
+from django.utils import timezone
+from customer_portal.upsert import column_list, upsert_returning
 
 class VehicleDetails(models.Model):
     """
@@ -33,6 +35,59 @@ class VehicleDetails(models.Model):
         verbose_name = 'Vehicle Detail'
         verbose_name_plural = 'Vehicle Details'
         ordering = ['-created']
+        indexes = [
+            # Keyset pagination (all vehicles / my-vehicles)
+            models.Index(fields=['created', 'id']),
+            models.Index(fields=['customer', 'created', 'id']),
+        ]
 
     def __str__(self):
-        return self.vehicleRegistrationNo
\ No newline at end of file
+        return self.vehicleRegistrationNo
+
+    @classmethod
+    def upsert(cls, vehicle_number, customer=None):
+        """
+        Get or create a vehicle in a single INSERT ... ON CONFLICT statement
+
+        If customer is given and the vehicle has no customer yet, it is
+        assigned in the same statement.
+
+        Returns:
+            tuple: (vehicle, created)
+        """
+        columns = column_list(cls)
+        sql = f"""
+            WITH claimed AS (
+                UPDATE "VehicleDetails" SET "customer_id" = %(customer)s
+                WHERE "vehicleRegistrationNo" = %(number)s
+                  AND "customer_id" IS NULL AND %(customer)s IS NOT NULL
+                RETURNING {columns}
+            ), inserted AS (
+                INSERT INTO "VehicleDetails" ("vehicleRegistrationNo", "customer_id", "ratings", "created")
+                VALUES (%(number)s, %(customer)s, 0, %(now)s)
+                ON CONFLICT ("vehicleRegistrationNo") DO NOTHING
+                RETURNING {columns}
+            )
+            SELECT {columns}, false FROM claimed
+            UNION ALL
+            SELECT {columns}, true FROM inserted
+            UNION ALL
+            SELECT {columns}, false FROM "VehicleDetails"
+            WHERE "vehicleRegistrationNo" = %(number)s
+              AND NOT EXISTS (SELECT 1 FROM claimed)
+              AND NOT EXISTS (SELECT 1 FROM inserted)
+        """
+        params = {
+            'number': vehicle_number,
+            'customer': customer.pk if customer else None,
+            'now': timezone.now(),
+        }
+
+        # A row committed by a concurrent insert after this statement's
+        # snapshot is skipped by ON CONFLICT but not visible to the SELECT;
+        # running the statement again sees it.
+        for _ in range(2):
+            result = upsert_returning(cls, sql, params)
+            if result:
+                return result
+        raise cls.DoesNotExist(f"Vehicle {vehicle_number} could not be created or found")
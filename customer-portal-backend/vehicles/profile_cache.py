@@ -0,0 +1,443 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from urllib.parse import unquote, urlsplit
+import json
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of a cached profile changes, so old entries are never read
+PROFILE_KEY_PREFIX = 'vehicle-profile:v1:'
+GENERATION_KEY_PREFIX = 'vehicle-profile:gen:'
+
+# Vehicles whose profile may include any of the given people or POs
+AFFECTED_VEHICLES_SQL = """
+    SELECT "vehicleId" FROM "DriverVehicleTagging"
+    WHERE "driverId" = ANY(%(people)s) OR "helperId" = ANY(%(people)s)
+    UNION
+    SELECT "DriverVehicleTagging"."vehicleId" FROM "PODriverVehicleTagging"
+    JOIN "DriverVehicleTagging" ON "DriverVehicleTagging"."id" = "PODriverVehicleTagging"."driverVehicleTaggingId"
+    WHERE "PODriverVehicleTagging"."poId" = ANY(%(pos)s)
+"""
+
+
+class VehicleProfileCache:
+    """
+    Read-through cache of the profile POST /api/vehicles/create/ returns
+
+    A profile is the latest tagging's driver, helper and PO and their
+    documents, keyed by vehicle ID. Every vehicle has a generation that
+    invalidate() bumps; a profile is only served while it carries the
+    current generation, so a profile loaded while a write was committing
+    (and stored after that write invalidated it) is never read back.
+
+    Subclasses implement _read, _write and _bump. Counters are per process.
+    """
+
+    name = 'base'
+
+    def __init__(self, ttl=None):
+        self.ttl = settings.VEHICLE_PROFILE_CACHE_TTL if ttl is None else ttl
+        self._stats_lock = threading.Lock()
+        self._counters = dict.fromkeys(('hits', 'misses', 'stale', 'sets', 'invalidations', 'errors'), 0)
+
+    def _count(self, counter, amount=1):
+        with self._stats_lock:
+            self._counters[counter] += amount
+
+    def _read(self, vehicle_id):
+        """
+        Returns:
+            tuple: (stored generation, profile) or None, current generation
+        """
+        raise NotImplementedError
+
+    def _write(self, vehicle_id, generation, profile):
+        raise NotImplementedError
+
+    def _bump(self, vehicle_ids):
+        raise NotImplementedError
+
+    def get_or_load(self, vehicle_id, loader):
+        """
+        Cached profile of vehicle_id, or loader() stored for the next request
+
+        Cache failures fall back to loader() so they never fail the request.
+        """
+        if self.ttl <= 0:
+            return loader()
+
+        generation = None
+        try:
+            entry, generation = self._read(vehicle_id)
+        except (OSError, RedisError) as e:
+            self._count('errors')
+            logger.warning("Vehicle profile cache read failed: %s", e)
+            entry = None
+
+        if entry is not None and entry[0] == generation:
+            self._count('hits')
+            return entry[1]
+        self._count('stale' if entry is not None else 'misses')
+
+        profile = loader()
+        if generation is not None:
+            try:
+                self._write(vehicle_id, generation, profile)
+                self._count('sets')
+            except (OSError, RedisError) as e:
+                self._count('errors')
+                logger.warning("Vehicle profile cache write failed: %s", e)
+        return profile
+
+    def invalidate(self, vehicle_ids):
+        vehicle_ids = sorted(set(vehicle_ids))
+        if not vehicle_ids:
+            return
+        try:
+            self._bump(vehicle_ids)
+            self._count('invalidations', len(vehicle_ids))
+        except (OSError, RedisError) as e:
+            # Stale for at most VEHICLE_PROFILE_CACHE_TTL
+            self._count('errors')
+            logger.warning("Vehicle profile cache invalidation failed for %s: %s", vehicle_ids, e)
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses'] + counters['stale']
+        counters.update(
+            backend=self.name,
+            ttl_seconds=self.ttl,
+            hit_ratio=round(counters['hits'] / lookups, 4) if lookups else None,
+        )
+        return counters
+
+    def close(self):
+        pass
+
+
+class LocalMemoryProfileCache(VehicleProfileCache):
+    """
+    Profiles held in this process, least recently used evicted first
+
+    Invalidation only reaches this process: with several workers, another
+    worker's write shows here once the entry expires (VEHICLE_PROFILE_CACHE_TTL).
+    """
+
+    name = 'local-memory'
+
+    def __init__(self, ttl=None, max_items=None):
+        super().__init__(ttl)
+        self.max_items = max_items or settings.VEHICLE_PROFILE_CACHE_MAX_ITEMS
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = OrderedDict()
+
+    def _read(self, vehicle_id):
+        with self._lock:
+            generation = self._generations.get(vehicle_id, 0)
+            entry = self._entries.get(vehicle_id)
+            if entry is None:
+                return None, generation
+            expires_at, stored_generation, profile = entry
+            if expires_at <= time.monotonic():
+                del self._entries[vehicle_id]
+                return None, generation
+            self._entries.move_to_end(vehicle_id)
+            return (stored_generation, profile), generation
+
+    def _write(self, vehicle_id, generation, profile):
+        with self._lock:
+            self._entries[vehicle_id] = (time.monotonic() + self.ttl, generation, profile)
+            self._entries.move_to_end(vehicle_id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def _bump(self, vehicle_ids):
+        with self._lock:
+            for vehicle_id in vehicle_ids:
+                self._entries.pop(vehicle_id, None)
+                self._generations[vehicle_id] = self._generations.get(vehicle_id, 0) + 1
+                self._generations.move_to_end(vehicle_id)
+            while len(self._generations) > self.max_items:
+                # Forgetting a generation resets it to 0; drop its entry so nothing stale matches
+                vehicle_id, _ = self._generations.popitem(last=False)
+                self._entries.pop(vehicle_id, None)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+# ----- REDIS -----
+
+class RedisError(Exception):
+    """
+    Error reply from a Redis server, or no connection free in time
+    """
+
+
+class RedisConnection:
+    """
+    One connection speaking RESP2, the Redis wire protocol
+    """
+
+    def __init__(self, host, port, db, password, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        setup = []
+        if password:
+            setup.append(('AUTH', password))
+        if db:
+            setup.append(('SELECT', db))
+        if setup:
+            try:
+                self.execute(setup)
+            except BaseException:
+                self.close()
+                raise
+
+    @staticmethod
+    def encode(command):
+        parts = [b'*%d\r\n' % len(command)]
+        for argument in command:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(argument), argument))
+        return b''.join(parts)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by Redis server")
+        prefix, value = line[:1], line[1:-2]
+        if prefix == b'+':
+            return value
+        if prefix == b'-':
+            return RedisError(value.decode(errors='replace'))
+        if prefix == b':':
+            return int(value)
+        if prefix == b'$':
+            length = int(value)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by Redis server")
+            return data[:-2]
+        if prefix == b'*':
+            length = int(value)
+            return None if length < 0 else [self.read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from Redis server: {line[:40]!r}")
+
+    def execute(self, commands):
+        """
+        Send commands in one write and read their replies (pipelining)
+
+        Raises:
+            RedisError: If any command got an error reply
+        """
+        self.sock.sendall(b''.join(self.encode(command) for command in commands))
+        replies = [self.read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisClient:
+    """
+    Bounded pool of Redis connections to one server
+
+    Args:
+        url: redis://[:password@]host[:port][/db]
+    """
+
+    def __init__(self, url, timeout, max_connections):
+        parts = urlsplit(url)
+        if parts.scheme != 'redis':
+            raise ValueError(f"Unsupported Redis URL scheme: {parts.scheme!r}")
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.db = int(parts.path.strip('/') or 0)
+        self.password = unquote(parts.password) if parts.password else None
+        self.timeout = timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+
+    def execute(self, *commands):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RedisError("No Redis connection available")
+        connection = None
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = RedisConnection(self.host, self.port, self.db, self.password, self.timeout)
+            replies = connection.execute(commands)
+        except RedisError:
+            # A well-formed error reply leaves the connection usable
+            self._put(connection)
+            raise
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            self._slots.release()
+            raise
+        self._put(connection)
+        return replies
+
+    def _put(self, connection):
+        if connection is not None:
+            with self._lock:
+                self._idle.append(connection)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class RedisProfileCache(VehicleProfileCache):
+    """
+    Profiles shared by every worker through a Redis server
+
+    A lookup is one MGET of the profile and the vehicle's generation;
+    invalidation INCRs the generation and deletes the profile in one
+    round trip. Generations expire VEHICLE_PROFILE_CACHE_TTL after any
+    profile stored under them.
+    """
+
+    name = 'redis'
+
+    def __init__(self, ttl=None, url=None, timeout=None, max_connections=None):
+        super().__init__(ttl)
+        self.client = RedisClient(
+            url or settings.VEHICLE_PROFILE_CACHE_REDIS_URL,
+            timeout or settings.VEHICLE_PROFILE_CACHE_REDIS_TIMEOUT,
+            max_connections or settings.VEHICLE_PROFILE_CACHE_REDIS_MAX_CONNECTIONS
+        )
+
+    def _read(self, vehicle_id):
+        (data, generation), = self.client.execute(
+            ('MGET', f"{PROFILE_KEY_PREFIX}{vehicle_id}", f"{GENERATION_KEY_PREFIX}{vehicle_id}")
+        )
+        generation = int(generation or 0)
+        if data is None:
+            return None, generation
+        try:
+            entry = json.loads(data)
+            return (entry['generation'], entry['profile']), generation
+        except (ValueError, KeyError, TypeError):
+            return None, generation
+
+    def _write(self, vehicle_id, generation, profile):
+        data = json.dumps({'generation': generation, 'profile': profile}, separators=(',', ':'))
+        self.client.execute(
+            ('SET', f"{PROFILE_KEY_PREFIX}{vehicle_id}", data, 'EX', self.ttl),
+            # Outlive the profile, or a forgotten generation would read as 0 while it is cached
+            ('EXPIRE', f"{GENERATION_KEY_PREFIX}{vehicle_id}", self.ttl * 2),
+        )
+
+    def _bump(self, vehicle_ids):
+        commands = []
+        for vehicle_id in vehicle_ids:
+            commands.append(('INCR', f"{GENERATION_KEY_PREFIX}{vehicle_id}"))
+            commands.append(('EXPIRE', f"{GENERATION_KEY_PREFIX}{vehicle_id}", self.ttl * 2))
+        commands.append(('DEL', *(f"{PROFILE_KEY_PREFIX}{vehicle_id}" for vehicle_id in vehicle_ids)))
+        self.client.execute(*commands)
+
+    def close(self):
+        self.client.close()
+
+
+# ----- INVALIDATION -----
+
+def affected_vehicles(people=(), pos=()):
+    """
+    IDs of the vehicles whose profile may include any of the people or POs
+    """
+    if not people and not pos:
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(AFFECTED_VEHICLES_SQL, {'people': sorted(people), 'pos': sorted(pos)})
+        return {row[0] for row in cursor.fetchall()}
+
+
+def invalidate_vehicle_profiles(vehicles=(), people=(), pos=(), documents=()):
+    """
+    Drop the cached profiles fed by the given rows once the transaction commits
+
+    Model signals call this for single-row saves and deletes (see
+    vehicles.signals); code writing with bulk_create, bulk_update or raw
+    SQL calls it directly. People and POs are mapped to vehicles after the
+    commit, so the write itself runs no extra query.
+
+    Args:
+        vehicles: VehicleDetails IDs
+        people: DriverHelper IDs
+        pos: PODetails IDs (PO numbers)
+        documents: DocumentControl rows, by the row they refer to
+    """
+    vehicle_ids = set(vehicles)
+    people = set(people)
+    pos = set(pos)
+    for document in documents:
+        if document.reference_kind == 'vehicle':
+            vehicle_ids.add(document.reference_key)
+        elif document.reference_kind in ('driver', 'helper'):
+            people.add(document.reference_key)
+        elif document.reference_kind == 'po':
+            pos.add(document.reference_key)
+    vehicle_ids.discard(None)
+    people.discard(None)
+    pos.discard(None)
+
+    if vehicle_ids or people or pos:
+        transaction.on_commit(
+            lambda: get_vehicle_profile_cache().invalidate(vehicle_ids | affected_vehicles(people, pos))
+        )
+
+
+_profile_cache = None
+_profile_cache_lock = threading.Lock()
+
+
+def get_vehicle_profile_cache():
+    """
+    Process-wide instance of the VEHICLE_PROFILE_CACHE_BACKEND class
+    """
+    global _profile_cache
+    if _profile_cache is None:
+        with _profile_cache_lock:
+            if _profile_cache is None:
+                _profile_cache = import_string(settings.VEHICLE_PROFILE_CACHE_BACKEND)()
+    return _profile_cache
+
+
+@receiver(setting_changed)
+def reset_vehicle_profile_cache(setting, **kwargs):
+    global _profile_cache
+    if setting.startswith('VEHICLE_PROFILE_CACHE_'):
+        with _profile_cache_lock:
+            if _profile_cache is not None:
+                _profile_cache.close()
+            _profile_cache = None
@@ -0,0 +1,127 @@
+import socketserver
+import sys
+import threading
+import time
+
+
+class StubRedisServer:
+    """
+    Local stand-in for a Redis server, for tests and development
+
+    Speaks RESP2 for the commands RedisProfileCache uses (GET, MGET, SET
+    with EX, DEL, INCR, EXPIRE, plus PING, AUTH and SELECT) on 127.0.0.1
+    and keeps keys in memory. Counters let tests check commands and
+    connections.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, password=None):
+        self.password = password
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with stub._lock:
+                    stub.connections += 1
+                authenticated = stub.password is None
+                while True:
+                    command = self.read_command()
+                    if command is None:
+                        return
+                    name = command[0].upper()
+                    if name == b'AUTH':
+                        authenticated = command[-1].decode() == stub.password
+                        reply = b'+OK\r\n' if authenticated else b'-WRONGPASS invalid password\r\n'
+                    elif not authenticated:
+                        reply = b'-NOAUTH Authentication required.\r\n'
+                    else:
+                        reply = stub.execute(name, command[1:])
+                    self.wfile.write(reply)
+
+            def read_command(self):
+                line = self.rfile.readline()
+                if not line.startswith(b'*'):
+                    return None
+                command = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    command.append(self.rfile.read(length + 2)[:-2])
+                return command
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+            def handle_error(self, request, client_address):
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self.server = Server((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        credentials = f":{self.password}@" if self.password else ''
+        return f"redis://{credentials}{host}:{port}/0"
+
+    def _live(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def execute(self, name, args):
+        with self._lock:
+            self.commands += 1
+            if name in (b'PING', b'SELECT'):
+                return b'+OK\r\n' if name == b'SELECT' else b'+PONG\r\n'
+            if name == b'GET':
+                return bulk(self._live(args[0]))
+            if name == b'MGET':
+                return b'*%d\r\n' % len(args) + b''.join(bulk(self._live(key)) for key in args)
+            if name == b'SET':
+                self.data[args[0]] = args[1]
+                self.expires.pop(args[0], None)
+                if len(args) >= 4 and args[2].upper() == b'EX':
+                    self.expires[args[0]] = time.monotonic() + int(args[3])
+                return b'+OK\r\n'
+            if name == b'DEL':
+                deleted = 0
+                for key in args:
+                    if self._live(key) is not None:
+                        deleted += 1
+                    self.data.pop(key, None)
+                    self.expires.pop(key, None)
+                return b':%d\r\n' % deleted
+            if name == b'INCR':
+                value = int(self._live(args[0]) or 0) + 1
+                self.data[args[0]] = str(value).encode()
+                return b':%d\r\n' % value
+            if name == b'EXPIRE':
+                if self._live(args[0]) is None:
+                    return b':0\r\n'
+                self.expires[args[0]] = time.monotonic() + int(args[1])
+                return b':1\r\n'
+            return b"-ERR unknown command '%s'\r\n" % name
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='redis-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
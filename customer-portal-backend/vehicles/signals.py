@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from documents.models import DocumentControl
+from drivers.models import DriverHelper
+from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
+from .profile_cache import affected_vehicles, invalidate_vehicle_profiles
+
+# Rows feeding the cached vehicle profiles (see profile_cache). Bulk and raw
+# SQL writes send no signals; those call invalidate_vehicle_profiles directly.
+
+
+@receiver([post_save, post_delete], sender=DriverVehicleTagging)
+def tagging_changed(instance, **kwargs):
+    invalidate_vehicle_profiles(vehicles=[instance.vehicleId_id])
+
+
+@receiver([post_save, post_delete], sender=PODriverVehicleTagging)
+def po_tagging_changed(instance, **kwargs):
+    # The tagging is usually already loaded by whoever created the PO tagging
+    invalidate_vehicle_profiles(vehicles=[instance.driverVehicleTaggingId.vehicleId_id])
+
+
+@receiver([post_save, post_delete], sender=DocumentControl)
+def document_changed(instance, **kwargs):
+    invalidate_vehicle_profiles(documents=[instance])
+
+
+@receiver(post_save, sender=DriverHelper)
+def person_saved(instance, created, **kwargs):
+    if not created:
+        invalidate_vehicle_profiles(people=[instance.id])
+
+
+@receiver(pre_delete, sender=DriverHelper)
+def person_deleted(instance, **kwargs):
+    # Resolved now: after the commit their helper taggings no longer point at them
+    invalidate_vehicle_profiles(vehicles=affected_vehicles(people=[instance.id]))
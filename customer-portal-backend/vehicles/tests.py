@@ -1,3 +1,219 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from authentication.models import CustomerUser
+from documents.models import DocumentControl
+from drivers.models import DriverHelper
+from po_details.models import PODetails
+from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
+from .models import VehicleDetails
+from .profile_cache import get_vehicle_profile_cache
+from .redis_stub import StubRedisServer
+
+
+class VehicleAggregateTests(TestCase):
+    def setUp(self):
+        self.user = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vehicle = VehicleDetails.objects.create(vehicleRegistrationNo='MH12AB1234', customer=self.user)
+
+    def person(self, number, type):
+        return DriverHelper.objects.create(
+            uid=f'1234567890{number:02d}', name=f'{type} {number}', type=type, phoneNo=f'+9198765432{number:02d}'
+        )
+
+    def tag(self, driver, helper, days_ago, po=None):
+        tagging = DriverVehicleTagging.objects.create(driverId=driver, helperId=helper, vehicleId=self.vehicle)
+        DriverVehicleTagging.objects.filter(pk=tagging.pk).update(created=tagging.created - timedelta(days=days_ago))
+        if po:
+            PODriverVehicleTagging.objects.create(poId=po, driverVehicleTaggingId=tagging)
+        return tagging
+
+    def document(self, kind, key, document_type):
+        return DocumentControl.objects.create(
+            name=f'{document_type}.pdf', type=document_type, filePath=f'/tmp/{document_type}-{key}.pdf',
+            **DocumentControl.reference_fields(document_type, key)
+        )
+
+    def test_complete_data_query_count_does_not_grow_with_history(self):
+        drivers = [self.person(i, 'Driver') for i in range(5)]
+        helpers = [self.person(10 + i, 'Helper') for i in range(3)]
+        old_po = PODetails.objects.create(id='PO-OLD', customerUserId=self.user)
+        latest_po = PODetails.objects.create(id='PO-NEW', customerUserId=self.user)
+        # A long history: every driver many times, most recent taggings last
+        for day in range(30, 0, -1):
+            self.tag(drivers[day % 5], helpers[day % 3], days_ago=day, po=old_po)
+        self.tag(drivers[2], None, days_ago=0, po=latest_po)
+        for person in drivers:
+            self.document('driver', person.id, 'driver_aadhar')
+        for person in helpers:
+            self.document('helper', person.id, 'helper_aadhar')
+        self.document('vehicle', self.vehicle.id, 'vehicle_registration')
+        self.document('po', 'PO-NEW', 'po')
+        self.document('po', 'PO-OLD', 'do')
+
+        # Vehicle, people with the latest PO, documents
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/vehicles/vehicle-complete-data/', {'vehicle_reg_no': 'MH12AB1234'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [driver['id'] for driver in response.data['drivers']],
+            [drivers[2].id, drivers[1].id, drivers[3].id, drivers[4].id, drivers[0].id]
+        )
+        self.assertEqual([helper['id'] for helper in response.data['helpers']], [helpers[1].id, helpers[2].id, helpers[0].id])
+        self.assertEqual(response.data['po_number'], 'PO-NEW')
+        self.assertEqual(len(response.data['documents']), 5 + 3 + 1 + 1)
+
+        # Upsert, people with the latest PO, documents
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/vehicles/create/', {'vehicle_number': 'MH12AB1234'}, format='json')
+
+        self.assertEqual(response.data['driver']['id'], drivers[2].id)
+        self.assertIsNone(response.data['helper'])
+        self.assertEqual(response.data['po_number'], 'PO-NEW')
+        self.assertEqual(
+            sorted(document['type'] for document in response.data['documents']),
+            ['driver_aadhar', 'po', 'vehicle_registration']
+        )
+
+
+class VehicleProfileCacheTests(TestCase):
+    def setUp(self):
+        self.user = CustomerUser.objects.create_user(
+            email='staff@example.com', password='x', username='staff', is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vehicle = VehicleDetails.objects.create(vehicleRegistrationNo='MH12CD5678', customer=self.user)
+        self.other_vehicle = VehicleDetails.objects.create(vehicleRegistrationNo='MH12EF9012', customer=self.user)
+        self.driver = DriverHelper.objects.create(uid='123456789001', name='Driver One', type='Driver', phoneNo='+919876543201')
+        self.po = PODetails.objects.create(id='PO-1', customerUserId=self.user)
+
+    def use_cache(self, **overrides):
+        settings_override = override_settings(VEHICLE_PROFILE_CACHE_TTL=300, **overrides)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def profile(self, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.post('/api/vehicles/create/', {'vehicle_number': 'MH12CD5678'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def write(self, change):
+        # Invalidation happens when the writing transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return change()
+
+    def assert_invalidated_by_writes(self):
+        self.write(lambda: PODriverVehicleTagging.objects.create(
+            poId=self.po, driverVehicleTaggingId=DriverVehicleTagging.objects.create(driverId=self.driver, vehicleId=self.vehicle)
+        ))
+
+        # Miss: upsert, people with the latest PO, documents; then hits: the upsert alone
+        self.assertEqual(self.profile(3)['driver']['name'], 'Driver One')
+        cached = self.profile(1)
+        self.assertEqual(cached['po_number'], 'PO-1')
+        self.assertEqual(cached['documents'], [])
+
+        # Other vehicles' rows leave the profile cached
+        self.write(lambda: DriverVehicleTagging.objects.create(driverId=self.driver, vehicleId=self.other_vehicle))
+        self.profile(1)
+
+        # A document of the PO
+        self.write(lambda: DocumentControl.objects.create(
+            name='po.pdf', type='po', filePath='/tmp/po-1.pdf', **DocumentControl.reference_fields('po', 'PO-1')
+        ))
+        self.assertEqual([document['type'] for document in self.profile(3)['documents']], ['po'])
+        self.profile(1)
+
+        # The driver's language, changed with raw SQL
+        self.write(lambda: DriverHelper.upsert('Driver One', '+919876543201', 'Driver', language='hi'))
+        self.assertEqual(self.profile(3)['driver']['language'], 'hi')
+
+        # A new tagging with another driver
+        other = DriverHelper.objects.create(uid='123456789002', name='Driver Two', type='Driver', phoneNo='+919876543202')
+        self.write(lambda: DriverVehicleTagging.objects.create(driverId=other, vehicleId=self.vehicle))
+        profile = self.profile(3)
+        self.assertEqual(profile['driver']['name'], 'Driver Two')
+        self.assertIsNone(profile['po_number'])
+        self.profile(1)
+
+        stats = self.client.get('/api/vehicles/profile-cache-stats/').data
+        self.assertEqual((stats['hits'], stats['misses'] + stats['stale']), (4, 4))
+        return stats
+
+    def test_local_memory_cache_is_invalidated_by_writes_feeding_the_profile(self):
+        self.use_cache(VEHICLE_PROFILE_CACHE_BACKEND='vehicles.profile_cache.LocalMemoryProfileCache')
+        stats = self.assert_invalidated_by_writes()
+        self.assertEqual(stats['backend'], 'local-memory')
+        self.assertEqual(stats['entries'], 1)
+
+    def test_redis_cache_is_invalidated_by_writes_feeding_the_profile(self):
+        stub = StubRedisServer(password='secret').start()
+        self.addCleanup(stub.stop)
+        self.use_cache(
+            VEHICLE_PROFILE_CACHE_BACKEND='vehicles.profile_cache.RedisProfileCache',
+            VEHICLE_PROFILE_CACHE_REDIS_URL=stub.url
+        )
+        stats = self.assert_invalidated_by_writes()
+        self.assertEqual((stats['backend'], stats['errors']), ('redis', 0))
+        self.assertEqual(stub.connections, 1)
+
+        # An unreachable server degrades to loading every time
+        stub.stop()
+        get_vehicle_profile_cache().client.close()
+        self.assertEqual(self.profile(3)['driver']['name'], 'Driver Two')
+        self.assertEqual(get_vehicle_profile_cache().stats()['errors'], 1)
+
+    def test_stats_are_for_employees_only(self):
+        customer = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.client.force_authenticate(customer)
+        self.assertEqual(self.client.get('/api/vehicles/profile-cache-stats/').status_code, 403)
+
+
+class MyVehiclesPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomerUser.objects.create_user(email='customer@example.com', password='x', username='customer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = VehicleDetails.objects.create(vehicleRegistrationNo='MH12ZZ0000', customer=None).created
+        self.vehicles = []
+        for number in range(5):
+            vehicle = VehicleDetails.objects.create(vehicleRegistrationNo=f'MH12AB000{number}', customer=self.user)
+            # Two vehicles share a timestamp: id breaks the tie
+            VehicleDetails.objects.filter(pk=vehicle.pk).update(created=now - timedelta(minutes=min(number, 3)))
+            self.vehicles.append(vehicle)
+
+    def test_pages_follow_created_then_id_without_count(self):
+        seen = []
+        response = self.client.get('/api/vehicles/my-vehicles/', {'page_size': 2})
+        self.assertNotIn('count', response.data)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(vehicle['vehicleRegistrationNo'] for vehicle in response.data['vehicles'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(seen, ['MH12AB0000', 'MH12AB0001', 'MH12AB0002', 'MH12AB0004', 'MH12AB0003'])
+        self.assertIsNone(self.client.get('/api/vehicles/my-vehicles/', {'page_size': 2}).data['previous'])
+
+        counted = self.client.get('/api/vehicles/my-vehicles/', {'page_size': 2, 'count': 'true'})
+        self.assertEqual((counted.data['count'], len(counted.data['vehicles'])), (5, 2))
+
+    def test_page_query_is_served_in_index_order(self):
+        queryset = VehicleDetails.objects.filter(customer=self.user).order_by('-created', '-id')[:51]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('Index Scan Backward', plan)
+        self.assertNotIn('Sort', plan)
@@ -2,10 +2,25 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from .aggregate import VehicleAggregate, person_data
 from .models import VehicleDetails
+from .profile_cache import get_vehicle_profile_cache
 from .serializers import VehicleDetailsSerializer
-from documents.models import DocumentControl
 from documents.serializers import DocumentControlSerializer
+from customer_portal.permissions import IsEmployee
+
+
+def vehicle_profile(vehicle):
+    """
+    Cached part of the POST /api/vehicles/create/ response (JSON-serializable)
+    """
+    aggregate = VehicleAggregate.load(vehicle, latest_only=True)
+    return {
+        "driver": person_data(aggregate.driver),
+        "helper": person_data(aggregate.helper),
+        "po_number": aggregate.po_number,
+        "documents": DocumentControlSerializer(aggregate.documents, many=True).data,
+    }
 
 
 class VehicleViewSet(viewsets.ModelViewSet):
@@ -17,6 +32,8 @@ class VehicleViewSet(viewsets.ModelViewSet):
         """Set permissions based on action"""
         if self.action in ['my_vehicles', 'vehicle_complete_data', 'create_or_get_vehicle']:
             permission_classes = [IsAuthenticated]
+        elif self.action == 'profile_cache_stats':
+            permission_classes = [IsEmployee]
         else:
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
@@ -24,18 +41,11 @@ class VehicleViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='my-vehicles')
     def my_vehicles(self, request):
         """Get all vehicles associated with the authenticated customer"""
-        vehicles = (
-            VehicleDetails.objects
-            .filter(customer=request.user)
-            .distinct()
-            .order_by('-created')
-        )
+        vehicles = VehicleDetails.objects.filter(customer=request.user)
 
-        serializer = VehicleDetailsSerializer(vehicles, many=True)
-        return Response({
-            "vehicles": serializer.data,
-            "count": vehicles.count()
-        })
+        page = self.paginate_queryset(vehicles)
+        serializer = VehicleDetailsSerializer(page, many=True)
+        return Response(self.paginator.get_paginated_data(serializer.data, results_key='vehicles'))
 
     @action(detail=False, methods=['post'], url_path='create')
     def create_or_get_vehicle(self, request):
@@ -50,101 +60,16 @@ class VehicleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        vehicle, created = VehicleDetails.objects.get_or_create(
-            vehicleRegistrationNo=vehicle_number,
-            defaults={'customer': request.user}
-        )
-
-        if not created and not vehicle.customer:
-            vehicle.customer = request.user
-            vehicle.save()
-
-        from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
-
-        latest_tagging = (
-            DriverVehicleTagging.objects
-            .filter(vehicleId=vehicle)
-            .select_related('driverId', 'helperId')
-            .order_by('-created')
-            .first()
-        )
-
-        driver_data = None
-        helper_data = None
-        po_number = None
-        documents = []
-
-        if latest_tagging:
-            if latest_tagging.driverId:
-                driver = latest_tagging.driverId
-                driver_data = {
-                    "id": driver.id,
-                    "name": driver.name,
-                    "phoneNo": driver.phoneNo,
-                    "language": driver.language,
-                    "type": driver.type,
-                    "uid": driver.uid,
-                }
-
-            if latest_tagging.helperId:
-                helper = latest_tagging.helperId
-                helper_data = {
-                    "id": helper.id,
-                    "name": helper.name,
-                    "phoneNo": helper.phoneNo,
-                    "language": helper.language,
-                    "type": helper.type,
-                    "uid": helper.uid,
-                }
-
-            po_tagging = (
-                PODriverVehicleTagging.objects
-                .filter(driverVehicleTaggingId=latest_tagging)
-                .select_related('poId')
-                .order_by('-created')
-                .first()
-            )
-
-            if po_tagging and po_tagging.poId:
-                po_number = po_tagging.poId.id
-
-        documents.extend(
-            DocumentControl.objects.filter(
-                referenceId=vehicle.id,
-                type__in=['vehicle_registration', 'vehicle_insurance', 'vehicle_puc']
-            ).order_by('-created')
-        )
-
-        if driver_data:
-            documents.extend(
-                DocumentControl.objects.filter(
-                    referenceId=driver_data['id'],
-                    type='driver_aadhar'
-                )
-            )
-
-        if helper_data:
-            documents.extend(
-                DocumentControl.objects.filter(
-                    referenceId=helper_data['id'],
-                    type='helper_aadhar'
-                )
-            )
+        # Also claims an existing vehicle that has no customer yet
+        vehicle, created = VehicleDetails.upsert(vehicle_number, customer=request.user)
 
-        if po_number:
-            documents.extend(
-                DocumentControl.objects.filter(
-                    referenceId=po_number,
-                    type__in=['po', 'do', 'before_weighing', 'after_weighing']
-                )
-            )
+        # Latest tagging's driver, helper and PO, and all their documents: cached,
+        # else loaded in two queries
+        profile = get_vehicle_profile_cache().get_or_load(vehicle.id, lambda: vehicle_profile(vehicle))
 
         return Response({
             "vehicle": VehicleDetailsSerializer(vehicle).data,
-            "driver": driver_data,
-            "helper": helper_data,
-            "po_number": po_number,
-            "documents": DocumentControlSerializer(documents, many=True).data,
+            **profile,
             "created": created,
             "message": "New vehicle created" if created else "Existing vehicle found"
         }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
@@ -172,92 +97,42 @@ class VehicleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        from podrivervehicletagging.models import DriverVehicleTagging, PODriverVehicleTagging
-
-        taggings = (
-            DriverVehicleTagging.objects
-            .filter(vehicleId=vehicle)
-            .select_related('driverId', 'helperId')
-            .order_by('-created')
-        )
-        
-        drivers = {}
-        helpers = {}
-
-        for tagging in taggings:
-            if tagging.driverId:
-                drivers.setdefault(tagging.driverId.id, {
-                    "id": tagging.driverId.id,
-                    "name": tagging.driverId.name,
-                    "phoneNo": tagging.driverId.phoneNo,
-                    "language": tagging.driverId.language,
-                    "type": tagging.driverId.type,
-                    "uid": tagging.driverId.uid,
-                })
-
-            if tagging.helperId:
-                helpers.setdefault(tagging.helperId.id, {
-                    "id": tagging.helperId.id,
-                    "name": tagging.helperId.name,
-                    "phoneNo": tagging.helperId.phoneNo,
-                    "language": tagging.helperId.language,
-                    "type": tagging.helperId.type,
-                    "uid": tagging.helperId.uid,
-                })
-
-        latest_tagging = taggings.first()
-        po_number = None
-
-        if latest_tagging:
-            po_tagging = (
-                PODriverVehicleTagging.objects
-                .filter(driverVehicleTaggingId=latest_tagging)
-                .select_related('poId')
-                .order_by('-created')
-                .first()
-            )
-            if po_tagging and po_tagging.poId:
-                po_number = po_tagging.poId.id
-
-        documents = list(
-            DocumentControl.objects.filter(
-                referenceId=vehicle.id,
-                type__in=['vehicle_registration', 'vehicle_insurance', 'vehicle_puc']
-            )
-        )
-
-        for driver in drivers.values():
-            documents.extend(
-                DocumentControl.objects.filter(
-                    referenceId=driver['id'],
-                    type='driver_aadhar'
-                )
-            )
-
-        for helper in helpers.values():
-            documents.extend(
-                DocumentControl.objects.filter(
-                    referenceId=helper['id'],
-                    type='helper_aadhar'
-                )
-            )
-
-        if po_number:
-            documents.extend(
-                DocumentControl.objects.filter(
-                    referenceId=po_number,
-                    type__in=['po', 'do', 'before_weighing', 'after_weighing']
-                )
-            )
+        # Everyone ever tagged to the vehicle, the latest PO and all their documents, in two queries
+        aggregate = VehicleAggregate.load(vehicle)
 
         return Response({
             "vehicle": VehicleDetailsSerializer(vehicle).data,
-            "drivers": list(drivers.values()),
-            "helpers": list(helpers.values()),
-            "po_number": po_number,
-            "documents": DocumentControlSerializer(documents, many=True).data
+            "drivers": [person_data(driver) for driver in aggregate.drivers],
+            "helpers": [person_data(helper) for helper in aggregate.helpers],
+            "po_number": aggregate.po_number,
+            "documents": DocumentControlSerializer(aggregate.documents, many=True).data
         })
 
+    @action(detail=False, methods=['get'], url_path='profile-cache-stats')
+    def profile_cache_stats(self, request):
+        """
+        Hit/miss counters of the vehicle profile cache (this worker process)
+        
+        GET /api/vehicles/profile-cache-stats/
+        
+        Response:
+        {
+            "backend": "redis",
+            "ttl_seconds": 300,
+            "hits": 1520,
+            "misses": 210,
+            "stale": 12,
+            "hit_ratio": 0.8786,
+            "sets": 222,
+            "invalidations": 95,
+            "errors": 0
+        }
+        
+        "stale" counts profiles found but invalidated since they were
+        stored; the local-memory backend also reports "entries".
+        """
+        return Response(get_vehicle_profile_cache().stats())
+
     def destroy(self, request, *args, **kwargs):
         """Override delete to return custom success message"""
         vehicle = self.get_object()
@@ -376,7 +376,7 @@ const CustomerPortal = () => {
 
   const [errors, setErrors] = useState({});
   const [selectedDocType, setSelectedDocType] = useState(documentOptions[0].id);
-  const [stagedFile, setStagedFile] = useState(null);
+  const [stagedFiles, setStagedFiles] = useState([]);
   const [docDropdownOpen, setDocDropdownOpen] = useState(false);
   const [docSearch, setDocSearch] = useState("");
   const [docHighlight, setDocHighlight] = useState(0);
@@ -1327,28 +1327,42 @@ const CustomerPortal = () => {
     clearFieldError(field);
   };
 
-  const handleStageFile = (file) => {
-    // validate quickly
+  const handleStageFiles = (selected) => {
+    // validate quickly; valid files are staged even if others are rejected
+    const accepted = [];
     let errorMessage = "";
-    if (!ACCEPTED_TYPES.includes(file.type)) {
-      errorMessage = "Only PDF, JPG, JPEG, or PNG files are accepted.";
-    } else if (file.size > MAX_FILE_SIZE) {
-      errorMessage = "File must be 5MB or smaller.";
-    }
-    if (errorMessage) {
-      setErrors((previous) => ({ ...previous, staged: errorMessage }));
-      return;
+    selected.forEach((file) => {
+      if (!ACCEPTED_TYPES.includes(file.type)) {
+        errorMessage = `${file.name}: Only PDF, JPG, JPEG, or PNG files are accepted.`;
+      } else if (file.size > MAX_FILE_SIZE) {
+        errorMessage = `${file.name}: File must be 5MB or smaller.`;
+      } else {
+        accepted.push(file);
+      }
+    });
+    if (accepted.length) {
+      setStagedFiles((previous) => [...previous, ...accepted]);
     }
-    setStagedFile(file);
     setErrors((previous) => {
       const copy = { ...previous };
-      delete copy.staged;
+      if (errorMessage) {
+        copy.staged = errorMessage;
+      } else {
+        delete copy.staged;
+      }
       return copy;
     });
   };
 
+  // Error text for the files the batch endpoint rejected
+  const describeRejectedUploads = (results = []) =>
+    results
+      .filter((result) => result.status === "rejected")
+      .map((result) => `${result.name}: ${result.error}`)
+      .join(" ");
+
   const handleUploadStaged = async () => {
-    if (!stagedFile) {
+    if (!stagedFiles.length) {
       setErrors((previous) => ({
         ...previous,
         staged: "No file selected to upload.",
@@ -1360,34 +1374,22 @@ const CustomerPortal = () => {
     setLoading(true);
 
     try {
-      // Prepare FormData for API call
-      const uploadFormData = new FormData();
-      uploadFormData.append("file", stagedFile);
-      uploadFormData.append("document_type", selectedDocType);
-
-      // Add reference fields based on what's available
-      if (formData.vehicleNumber) {
-        uploadFormData.append("vehicle_number", formData.vehicleNumber.trim());
-      }
-      if (formData.poNumber) {
-        uploadFormData.append("po_number", formData.poNumber.trim());
-      }
-      if (formData.driverPhone) {
-        uploadFormData.append("driver_phone", formData.driverPhone);
-      }
-      if (formData.helperPhone) {
-        uploadFormData.append("helper_phone", formData.helperPhone);
-      }
-
-      // Call API to upload document
-      const response = await documentsAPI.uploadToDocumentControl(
-        uploadFormData
+      // All staged files go up in one request, sharing the reference fields
+      const response = await documentsAPI.uploadBatchToDocumentControl(
+        stagedFiles.map((file) => ({ file, documentType: selectedDocType })),
+        {
+          vehicle_number: formData.vehicleNumber?.trim(),
+          po_number: formData.poNumber?.trim(),
+          driver_phone: formData.driverPhone,
+          helper_phone: formData.helperPhone,
+        }
       );
 
-      if (response.data && response.data.document) {
-        // Success - document saved to local storage and database
-        console.log("Document uploaded successfully:", response.data);
+      const results = response.data?.results || [];
+      const created = results.filter((result) => result.status === "created");
+      console.log("Documents uploaded:", response.data);
 
+      if (created.length) {
         // Store file info in local state (for display purposes)
         setFiles((previous) => {
           const existing = previous[selectedDocType];
@@ -1397,33 +1399,37 @@ const CustomerPortal = () => {
             ? [existing]
             : [];
 
-          // Store file object with database info
-          const fileWithInfo = {
-            ...stagedFile,
-            documentId: response.data.document.id,
-            filePath: response.data.document.filePath,
-            name: stagedFile.name,
+          // Store file objects with database info
+          const filesWithInfo = created.map((result) => ({
+            ...stagedFiles[result.index],
+            documentId: result.document.id,
+            filePath: result.document.filePath,
+            name: stagedFiles[result.index].name,
             fromDatabase: true,
-          };
+          }));
 
           return {
             ...previous,
-            [selectedDocType]: [...arr, fileWithInfo],
+            [selectedDocType]: [...arr, ...filesWithInfo],
           };
         });
-
-        // Clear staged file
-        setStagedFile(null);
         clearFieldError(selectedDocType);
 
         // Show success message
         showPopupMessage(
-          `${
+          `${created.length} ${
             documentOptions.find((d) => d.id === selectedDocType)?.label
-          } uploaded successfully`,
+          } file${created.length === 1 ? "" : "s"} uploaded successfully`,
           "info"
         );
       }
+
+      // Clear staged files; rejected ones are reported below
+      setStagedFiles([]);
+      const rejected = describeRejectedUploads(results);
+      if (rejected) {
+        setErrors((previous) => ({ ...previous, staged: rejected }));
+      }
     } catch (error) {
       console.error("Upload error:", error);
 
@@ -1435,8 +1441,14 @@ const CustomerPortal = () => {
         const data = error.response.data;
 
         if (status === 400) {
+          // Every file was rejected, or the request itself was invalid
           errorMessage =
-            data?.error || "Invalid file or missing reference information.";
+            describeRejectedUploads(data?.results) ||
+            data?.error ||
+            "Invalid file or missing reference information.";
+          if (data?.results) {
+            setStagedFiles([]);
+          }
         } else if (status === 401) {
           errorMessage = "Authentication failed. Please sign in again.";
         } else if (status === 413) {
@@ -2699,7 +2711,7 @@ const CustomerPortal = () => {
 
     try {
       // Build payload with ONLY form data (NO FILES)
-      // Files are already uploaded to server via uploadToDocumentControl
+      // Files are already uploaded to server via uploadBatchToDocumentControl
       const payload = {
         customer_email: formData.customerEmail.trim(),
         customer_phone: formData.customerPhone,
@@ -4607,8 +4619,9 @@ const CustomerPortal = () => {
                             tabIndex={0}
                             onDrop={(e) => {
                               e.preventDefault();
-                              const f = e.dataTransfer.files?.[0];
-                              if (f) handleStageFile(f);
+                              handleStageFiles(
+                                Array.from(e.dataTransfer.files || [])
+                              );
                             }}
                             onDragOver={(e) => e.preventDefault()}
                             onClick={() =>
@@ -4623,9 +4636,9 @@ const CustomerPortal = () => {
                             }`}
                           >
                             <p className="text-sm font-medium text-gray-700">
-                              {stagedFile
-                                ? stagedFile.name
-                                : "Drag & drop a file here or click to browse"}
+                              {stagedFiles.length
+                                ? stagedFiles.map((f) => f.name).join(", ")
+                                : "Drag & drop files here or click to browse"}
                             </p>
                             <p className="mt-1 text-xs text-gray-500">
                               PDF, JPG, JPEG, PNG up to 5MB
@@ -4634,10 +4647,13 @@ const CustomerPortal = () => {
                               id="staged-file-input"
                               type="file"
                               accept=".pdf,.jpg,.jpeg,.png"
+                              multiple
                               className="hidden"
                               onChange={(e) => {
-                                const s = e.target.files?.[0];
-                                if (s) handleStageFile(s);
+                                handleStageFiles(
+                                  Array.from(e.target.files || [])
+                                );
+                                e.target.value = "";
                               }}
                             />
                           </div>
@@ -4653,7 +4669,7 @@ const CustomerPortal = () => {
                             <button
                               type="button"
                               onClick={() => {
-                                setStagedFile(null);
+                                setStagedFiles([]);
                                 setErrors((p) => {
                                   const c = { ...p };
                                   delete c.staged;
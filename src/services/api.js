@@ -123,6 +123,28 @@ export const documentsAPI = {
       headers: { "Content-Type": "multipart/form-data" },
     }),
 
+  /**
+   * Upload several documents to DocumentControl in one request
+   * @param {Array<{file: File, documentType: string}>} documents - Files with their document types
+   * @param {Object} references - Optional vehicle_number, po_number, driver_phone, helper_phone shared by all files
+   * @returns {Promise} - Response with a result per file (status "created" or "rejected")
+   */
+  uploadBatchToDocumentControl: (documents, references = {}) => {
+    const formData = new FormData();
+    documents.forEach(({ file, documentType }) => {
+      formData.append("files", file);
+      formData.append("document_types", documentType);
+    });
+    Object.entries(references).forEach(([key, value]) => {
+      if (value) {
+        formData.append(key, value);
+      }
+    });
+    return api.post("/documents/upload-batch/", formData, {
+      headers: { "Content-Type": "multipart/form-data" },
+    });
+  },
+
   /**
    * Delete document from DocumentControl table and remove file from storage
    * @param {number} documentId - The ID of the document to delete
@@ -160,11 +182,29 @@ export const submissionsAPI = {
     api.get(`/submissions/${submissionId}/generate_qr/`),
 };
 
+/**
+ * GET a cursor-paginated list and follow its "next" links to the end
+ * @param {string} url - List endpoint
+ * @param {string} resultsKey - Key holding each page's rows (e.g. "vehicles")
+ * @returns {Promise} - The first response with every page's rows under resultsKey
+ */
+const getAllPages = async (url, resultsKey) => {
+  const first = await api.get(url, { params: { page_size: 200 } });
+  const results = [...(first.data[resultsKey] || [])];
+  let next = first.data.next;
+  while (next) {
+    const page = await api.get(next);
+    results.push(...(page.data[resultsKey] || []));
+    next = page.data.next;
+  }
+  return { ...first, data: { ...first.data, [resultsKey]: results, next: null } };
+};
+
 // Vehicles endpoints
 export const vehiclesAPI = {
   getVehicles: (params) => api.get("/vehicles/", { params }),
 
-  getMyVehicles: () => api.get("/vehicles/my-vehicles/"),
+  getMyVehicles: () => getAllPages("/vehicles/my-vehicles/", "vehicles"),
 
   createOrGetVehicle: (vehicleNumber) =>
     api.post("/vehicles/create/", { vehicle_number: vehicleNumber }),
@@ -186,7 +226,7 @@ export const vehiclesAPI = {
 
 // PO Details endpoints
 export const poDetailsAPI = {
-  getMyPOs: () => api.get("/po-details/my-pos/"),
+  getMyPOs: () => getAllPages("/po-details/my-pos/", "pos"),
 
   createOrGetPO: (poNumber) =>
     api.post("/po-details/create/", { po_number: poNumber }),